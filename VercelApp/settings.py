@@ -54,6 +54,14 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # BEGIN IMMEDIATE: las transacciones de reserva toman el bloqueo de
+            # escritura al empezar en vez de fallar al intentar promoverlo.
+            # SQLite admite un solo escritor: las escrituras se serializan
+            # igualmente; el bloqueo por vehículo solo se aprecia en PostgreSQL
+            "OPTIONS": {
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 20,
+            },
         }
     }
 
@@ -137,7 +145,10 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 # =====================
 
 MEDIA_URL = "/media/"
-MEDIA_ROOT = BASE_DIR / "media"
+# En Vercel solo se puede escribir en /tmp, que además es propio de cada
+# instancia: los PDF guardados (contratos, reportes) funcionan como caché y se
+# regeneran si faltan. MEDIA_ROOT permite apuntar a un volumen persistente.
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT") or ("/tmp/media" if IS_VERCEL else BASE_DIR / "media")
 
 # =====================
 # LOGIN
@@ -146,3 +157,81 @@ MEDIA_ROOT = BASE_DIR / "media"
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/dashboard/"
 LOGOUT_REDIRECT_URL = "/login/"
+
+# =====================
+# DISPONIBILIDAD
+# =====================
+
+# Segundos tras los que el índice en memoria se reconstruye desde la BD
+DISPONIBILIDAD_INDICE_TTL = 300
+DISPONIBILIDAD_USAR_INDICE = True
+# Segundos entre comprobaciones de VERSION_DISPONIBILIDAD para traer al índice
+# los cambios de otros procesos
+DISPONIBILIDAD_VERIFICAR_CADA = 1
+# Holgura al releer reservas modificadas desde la última lectura del índice
+DISPONIBILIDAD_MARGEN_SEGUNDOS = 60
+# Días cubiertos por el calendario de ocupación (desde el inicio del mes actual)
+DISPONIBILIDAD_HORIZONTE_DIAS = 365
+# Días a cada lado del rango pedido en los que se buscan ventanas libres
+DISPONIBILIDAD_VENTANAS_DIAS = 90
+
+# =====================
+# TARIFAS
+# =====================
+
+# Multiplicadores sobre precio_dia; los valores por defecto no alteran el precio
+TARIFA_FACTOR_TIPO = {}  # p. ej. {"SUV": 1.15}
+TARIFA_FACTOR_FIN_DE_SEMANA = 1.0  # sábados y domingos
+TARIFA_FACTOR_MES = {}  # p. ej. {12: 1.2, 1: 1.2}
+# (días mínimos, descuento), p. ej. [(7, 0.05), (30, 0.15)]
+TARIFA_DESCUENTOS_DURACION = []
+# Días compilados a cada lado de hoy en la tabla de factores diarios
+TARIFA_HORIZONTE_DIAS = 1100
+
+# =====================
+# REPORTES
+# =====================
+
+# Reportes guardados en el LRU en memoria de cada proceso
+REPORTES_CACHE_TAMANO = 64
+# Hilos por proceso web que generan reportes en segundo plano (0 = solo el
+# comando procesar_reportes)
+REPORTES_TRABAJADORES = 2
+# Segundos tras los que un reporte en PROCESANDO se considera abandonado
+REPORTES_TIEMPO_MAXIMO = 600
+# Procesos que generan PDF en paralelo (0 = en el propio proceso web)
+REPORTES_PROCESOS = 2
+# PDF que pueden esperar turno en el pool además de los que están en proceso;
+# con la cola llena las descargas responden 503 al instante
+PDF_COLA_MAXIMA = 8
+# Segundos que una vista espera un PDF antes de responder 503
+PDF_TIEMPO_MAXIMO = 30
+# Valor de Retry-After (segundos) de esas respuestas 503
+PDF_REINTENTAR_EN = 5
+# PDF que se pueden generar a la vez en todo el despliegue (todos los procesos
+# e instancias que comparten la base de datos), contando los que esperan en
+# la cola de un pool; 0 = sin límite global (solo el de cada proceso)
+PDF_TURNOS = 10
+# Segundos tras los que un turno no liberado (proceso caído) se da por libre
+PDF_TURNO_MAXIMO = 600
+# Filas leídas por vuelta del cursor en la exportación de reservas
+EXPORTACION_CHUNK_SIZE = 2000
+# Filas de cada LongTable en los PDF de detalle (exportación en PDF)
+PDF_FILAS_POR_TABLA = 500
+# Medir tiempos, consultas y filas de cada reporte y contrato (ver
+# instrumentacion.py)
+INSTRUMENTACION_REPORTES = True
+# Contratos como máximo en una descarga en lote
+CONTRATOS_LOTE_MAXIMO = 1000
+
+# =====================
+# ANALÍTICA
+# =====================
+
+# Filas leídas por vuelta del cursor al cargar la instantánea de reservas
+ANALITICA_CHUNK_SIZE = 5000
+# Holgura al buscar reservas modificadas desde el último refresco, para las
+# transacciones que confirman después de empezar el refresco
+ANALITICA_MARGEN_SEGUNDOS = 60
+# Segundos tras los que la instantánea se vuelve a leer completa
+ANALITICA_RECONSTRUIR_CADA = 3600
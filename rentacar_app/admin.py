@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cliente, Vehiculo, Reserva, Contrato, Reporte, Empleado
+from .models import Cliente, Vehiculo, Reserva, Contrato, Reporte, Empleado, MetricaReporte
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
@@ -23,16 +23,28 @@ class ReservaAdmin(admin.ModelAdmin):
 class ContratoAdmin(admin.ModelAdmin):
     list_display = ['reserva', 'fecha_creacion', 'firmado']
     list_filter = ['firmado', 'fecha_creacion']
+    readonly_fields = ['hash_pdf', 'huella_datos']
 
 @admin.register(Reporte)
 class ReporteAdmin(admin.ModelAdmin):
-    list_display = ['tipo', 'fecha_generacion', 'generado_por']
-    list_filter = ['tipo', 'fecha_generacion']
-    readonly_fields = ['fecha_generacion', 'generado_por']
+    list_display = ['tipo', 'fecha_generacion', 'generado_por', 'estado', 'tamano_datos']
+    list_filter = ['tipo', 'estado', 'fecha_generacion']
+    readonly_fields = ['fecha_generacion', 'generado_por', 'version_datos', 'fecha_proceso', 'error', 'tamano_datos']
+    list_select_related = ['generado_por']
+    
+    def get_queryset(self, request):
+        # El listado no necesita los datos; el formulario de edición no los muestra
+        return super().get_queryset(request).defer('datos')
 
 @admin.register(Empleado)
 class EmpleadoAdmin(admin.ModelAdmin):
     list_display = ['usuario', 'telefono', 'fecha_contratacion', 'activo']
     list_filter = ['activo', 'fecha_contratacion']
     search_fields = ['usuario__first_name', 'usuario__last_name', 'usuario__email']
-    list_editable = ['activo']
\ No newline at end of file
+    list_editable = ['activo']
+
+@admin.register(MetricaReporte)
+class MetricaReporteAdmin(admin.ModelAdmin):
+    list_display = ['tipo', 'operacion', 'fecha', 'duracion_ms', 'tiempo_bd_ms', 'consultas', 'filas', 'tamano_pdf', 'reporte_id']
+    list_filter = ['tipo', 'operacion', 'fecha']
+    raw_id_fields = ['reporte']
@@ -0,0 +1,47 @@
+"""
+PDF guardados en MEDIA_ROOT (contratos y reportes).
+
+Los archivos guardados son una caché: si no se pueden escribir (en Vercel el
+sistema de archivos es de solo lectura salvo /tmp, que además es propio de
+cada instancia) o ya no están, el PDF se sirve igualmente desde los bytes
+recién generados y se vuelve a generar cuando haga falta.
+"""
+import logging
+
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+
+def archivo_disponible(archivo):
+    """True si el FileField tiene archivo y el almacenamiento aún lo tiene"""
+    if not archivo:
+        return False
+    try:
+        return archivo.storage.exists(archivo.name)
+    except Exception:
+        logger.exception('No se pudo comprobar el archivo %s', archivo.name)
+        return False
+
+
+def guardar_archivo(archivo, nombre, contenido):
+    """
+    Guarda `contenido` (bytes o un File) en el FileField `archivo` (sin
+    guardar el modelo). Devuelve False y deja el campo vacío si el almacenamiento falla; el
+    archivo anterior, si lo había, se borra.
+    """
+    anterior = archivo.name or ''
+    try:
+        archivo.save(nombre, ContentFile(contenido) if isinstance(contenido, bytes) else contenido, save=False)
+    except Exception:
+        logger.exception('No se pudo guardar %s; se servirá sin guardar', nombre)
+        archivo.name = None
+        guardado = False
+    else:
+        guardado = True
+    if anterior and anterior != archivo.name:
+        try:
+            archivo.storage.delete(anterior)
+        except Exception:
+            logger.exception('No se pudo borrar %s', anterior)
+    return guardado
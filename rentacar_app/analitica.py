@@ -0,0 +1,293 @@
+"""
+Analítica de tendencias sobre una instantánea columnar de las reservas.
+
+La instantánea guarda cada reserva (con el tipo de su vehículo) en arreglos
+NumPy, una columna por campo: id, códigos de estado y de tipo (int8), fechas
+en segundos epoch (int64) y precio_total en centavos (int64). El reporte de
+tendencias se calcula sobre ella con operaciones vectorizadas (np.bincount
+sobre claves semana × tipo, percentiles...) en lugar de una agrupación del
+ORM por cada corte.
+
+El refresco es incremental: solo se leen las reservas con id mayor que el
+último visto o con fecha_actualizacion posterior al refresco anterior (menos
+ANALITICA_MARGEN_SEGUNDOS, por las transacciones que confirman tarde; esto
+también recoge las altas con IDs de un bloque anterior, que no llegan en
+orden). Se vuelve a leer todo tras un borrado (VERSION_RESERVAS_ELIMINADAS),
+si el id máximo es menor que el ya visto o cada ANALITICA_RECONSTRUIR_CADA
+segundos. Como en resumen.py, los cambios hechos con QuerySet.update o los
+cambios de tipo de un vehículo solo se ven tras esa lectura completa.
+"""
+import threading
+import time as reloj
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .instrumentacion import medido
+from .models import Reserva, Vehiculo
+from .resumen import ESTADOS_INGRESO
+from .versiones import obtener_version, VERSION_RESERVAS_ELIMINADAS
+
+ESTADOS = [codigo for codigo, _ in Reserva.ESTADOS_RESERVA]
+TIPOS = [codigo for codigo, _ in Vehiculo.TIPOS_VEHICULO]
+_CODIGO_ESTADO = {estado: i for i, estado in enumerate(ESTADOS)}
+_CODIGO_TIPO = {tipo: i for i, tipo in enumerate(TIPOS)}
+
+# Columna de la instantánea: (campo de la consulta, dtype)
+COLUMNAS = {
+    'id': ('id', np.int64),
+    'estado': ('estado', np.int8),
+    'tipo': ('vehiculo__tipo', np.int8),
+    'fecha_reserva': ('fecha_reserva', np.int64),
+    'fecha_inicio': ('fecha_inicio', np.int64),
+    'fecha_fin': ('fecha_fin', np.int64),
+    'precio': ('precio_total', np.int64),
+}
+SEGUNDOS_DIA = 86400
+
+
+def _convertir(columna, valores):
+    if columna in ('estado', 'tipo'):
+        codigos = _CODIGO_ESTADO if columna == 'estado' else _CODIGO_TIPO
+        # -1: valor fuera de las opciones del modelo; no entra en los cortes
+        return [codigos.get(valor, -1) for valor in valores]
+    if columna == 'precio':
+        return [int(valor * 100) for valor in valores]
+    if columna.startswith('fecha_'):
+        return [int(valor.timestamp()) for valor in valores]
+    return valores
+
+
+def leer_columnas(reservas, chunk_size=5000):
+    """Columnas (dict de arreglos, ordenados por id) de un queryset de reservas"""
+    filas = reservas.order_by('pk').values_list(*[campo for campo, _ in COLUMNAS.values()])
+    filas = filas.iterator(chunk_size=chunk_size)
+    trozos = {columna: [] for columna in COLUMNAS}
+    while True:
+        bloque = list(islice(filas, chunk_size))
+        if not bloque:
+            break
+        for (columna, (_, dtype)), valores in zip(COLUMNAS.items(), zip(*bloque)):
+            trozos[columna].append(np.array(_convertir(columna, valores), dtype=dtype))
+    return {
+        columna: np.concatenate(partes) if partes else np.empty(0, dtype=COLUMNAS[columna][1])
+        for columna, partes in trozos.items()
+    }
+
+
+class InstantaneaReservas:
+    """Reservas del proceso en arreglos columnares, con refresco incremental"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Se reemplaza entero en cada refresco: quien lo obtuvo puede seguir
+        # leyéndolo sin bloqueo
+        self.columnas = None
+        self._ultimo_id = 0
+        self._desde = None
+        self._eliminadas = None
+        self._cargada_en = None
+        self.recargas = 0
+        self.refrescos = 0
+
+    def actualizar(self, chunk_size=None):
+        """Trae los cambios desde el último refresco y devuelve las columnas"""
+        chunk_size = chunk_size or getattr(settings, 'ANALITICA_CHUNK_SIZE', 5000)
+        with self._lock:
+            ahora = timezone.now()
+            eliminadas, _ = obtener_version(VERSION_RESERVAS_ELIMINADAS)
+            if self._necesita_recarga(eliminadas):
+                self.columnas = leer_columnas(Reserva.objects.all(), chunk_size)
+                self._eliminadas = eliminadas
+                self._cargada_en = reloj.monotonic()
+                self.recargas += 1
+            else:
+                self._refrescar(chunk_size)
+            ids = self.columnas['id']
+            self._ultimo_id = int(ids[-1]) if len(ids) else 0
+            self._desde = ahora
+            return self.columnas
+
+    def invalidar(self):
+        """Fuerza una lectura completa en el próximo uso"""
+        with self._lock:
+            self.columnas = None
+
+    def _necesita_recarga(self, eliminadas):
+        if self.columnas is None or eliminadas != self._eliminadas:
+            return True
+        if reloj.monotonic() - self._cargada_en > getattr(settings, 'ANALITICA_RECONSTRUIR_CADA', 3600):
+            return True
+        # Reservas borradas sin señal (o una transacción revertida en tests)
+        maximo = Reserva.objects.aggregate(maximo=Max('id'))['maximo'] or 0
+        return maximo < self._ultimo_id
+
+    def _refrescar(self, chunk_size):
+        margen = timedelta(seconds=getattr(settings, 'ANALITICA_MARGEN_SEGUNDOS', 60))
+        cambios = leer_columnas(
+            Reserva.objects.filter(Q(pk__gt=self._ultimo_id) | Q(fecha_actualizacion__gte=self._desde - margen)),
+            chunk_size,
+        )
+        if not len(cambios['id']):
+            return
+        actuales = self.columnas
+        ids = actuales['id']
+        posiciones = np.searchsorted(ids, cambios['id'])
+        existe = posiciones < len(ids)
+        existe[existe] = ids[posiciones[existe]] == cambios['id'][existe]
+
+        # Las modificadas se sobrescriben en su fila y las nuevas van al final;
+        # concatenate crea arreglos nuevos, los anteriores no se tocan
+        nuevas = {}
+        for columna, valores in actuales.items():
+            nuevas[columna] = np.concatenate([valores, cambios[columna][~existe]])
+            nuevas[columna][posiciones[existe]] = cambios[columna][existe]
+        altas = cambios['id'][~existe]
+        if len(altas) and len(ids) and altas[0] < ids[-1]:
+            orden = np.argsort(nuevas['id'], kind='stable')
+            nuevas = {columna: valores[orden] for columna, valores in nuevas.items()}
+        self.columnas = nuevas
+        self.refrescos += 1
+
+
+instantanea_reservas = InstantaneaReservas()
+
+
+def _medianoche(dia):
+    """Timestamp de la medianoche local de un día"""
+    return int(timezone.make_aware(datetime.combine(dia, time.min)).timestamp())
+
+
+def _dia_local(timestamp):
+    return datetime.fromtimestamp(int(timestamp), timezone.get_current_timezone()).date()
+
+
+def _tasa(parte, total):
+    return round(float(parte) / float(total) * 100, 2) if total else 0
+
+
+def _media(valores):
+    return round(float(valores.mean()), 2) if len(valores) else 0
+
+
+@medido('TENDENCIAS')
+def generar_reporte_tendencias(fecha_inicio=None, fecha_fin=None):
+    """
+    Tendencias por semana ISO de inicio del alquiler (fecha_inicio), entre
+    fecha_inicio y fecha_fin (días locales, ambos incluidos; por defecto, el
+    rango de la instantánea): ingresos por semana y tipo de vehículo, duración
+    media, anticipación entre la reserva y el inicio, y tasa de cancelación.
+    """
+    columnas = instantanea_reservas.actualizar()
+    inicios = columnas['fecha_inicio']
+    validas = (columnas['estado'] >= 0) & (columnas['tipo'] >= 0)
+    if (fecha_inicio is None or fecha_fin is None) and validas.any():
+        fecha_inicio = fecha_inicio or _dia_local(inicios[validas].min())
+        fecha_fin = fecha_fin or _dia_local(inicios[validas].max())
+    if fecha_inicio is None or fecha_fin is None or fecha_fin < fecha_inicio:
+        return _tendencias_vacias(fecha_inicio, fecha_fin)
+
+    mascara = validas & (inicios >= _medianoche(fecha_inicio)) & (inicios < _medianoche(fecha_fin + timedelta(days=1)))
+    estado = columnas['estado'][mascara]
+    tipo = columnas['tipo'][mascara].astype(np.int64)
+    inicio = inicios[mascara]
+    fin = columnas['fecha_fin'][mascara]
+    reservada = columnas['fecha_reserva'][mascara]
+    precio = columnas['precio'][mascara]
+
+    # Semanas ISO (de lunes a lunes) que tocan el periodo
+    semanas = [fecha_inicio - timedelta(days=fecha_inicio.weekday())]
+    while semanas[-1] + timedelta(days=7) <= fecha_fin:
+        semanas.append(semanas[-1] + timedelta(days=7))
+    limites = np.array([_medianoche(lunes) for lunes in semanas], dtype=np.int64)
+    semana = np.searchsorted(limites, inicio, side='right') - 1
+    n_semanas, n_tipos = len(semanas), len(TIPOS)
+
+    cancelada = estado == _CODIGO_ESTADO['CANCELADA']
+    efectiva = ~cancelada
+    ingreso = np.isin(estado, [_CODIGO_ESTADO[e] for e in ESTADOS_INGRESO])
+    # Igual que precios.dias_facturables: días completos, mínimo uno
+    dias = np.maximum(1, (fin - inicio) // SEGUNDOS_DIA)
+    anticipacion = (inicio - reservada) / SEGUNDOS_DIA
+
+    # Agrupaciones: una clave entera por celda y un bincount por métrica
+    ingresos_semana_tipo = np.bincount(
+        semana[ingreso] * n_tipos + tipo[ingreso], weights=precio[ingreso], minlength=n_semanas * n_tipos
+    ).reshape(n_semanas, n_tipos) / 100
+    reservas_semana = np.bincount(semana, minlength=n_semanas)
+    canceladas_semana = np.bincount(semana[cancelada], minlength=n_semanas)
+
+    reservas_tipo = np.bincount(tipo, minlength=n_tipos)
+    canceladas_tipo = np.bincount(tipo[cancelada], minlength=n_tipos)
+    efectivas_tipo = np.bincount(tipo[efectiva], minlength=n_tipos)
+    dias_tipo = np.bincount(tipo[efectiva], weights=dias[efectiva], minlength=n_tipos)
+    anticipacion_tipo = np.bincount(tipo[efectiva], weights=anticipacion[efectiva], minlength=n_tipos)
+    ingresos_tipo = ingresos_semana_tipo.sum(axis=0)
+
+    presentes = np.flatnonzero(reservas_tipo)
+    ingresos_por_semana = []
+    for i, lunes in enumerate(semanas):
+        año, numero, _ = lunes.isocalendar()
+        ingresos_por_semana.append({
+            'semana': f'{año}-W{numero:02d}',
+            'inicio': lunes.isoformat(),
+            'ingresos': [round(float(ingresos_semana_tipo[i, t]), 2) for t in presentes],
+            'total': round(float(ingresos_semana_tipo[i].sum()), 2),
+            'reservas': int(reservas_semana[i]),
+            'canceladas': int(canceladas_semana[i]),
+            'tasa_cancelacion': _tasa(canceladas_semana[i], reservas_semana[i]),
+        })
+
+    anticipacion_efectiva = anticipacion[efectiva]
+    return {
+        'total_reservas': int(len(estado)),
+        'total_ingresos': round(float(ingresos_tipo.sum()), 2),
+        'tasa_cancelacion': _tasa(cancelada.sum(), len(estado)),
+        'duracion_media_dias': _media(dias[efectiva]),
+        'anticipacion_media_dias': _media(anticipacion_efectiva),
+        'anticipacion_mediana_dias': (
+            round(float(np.median(anticipacion_efectiva)), 2) if len(anticipacion_efectiva) else 0
+        ),
+        'anticipacion_p90_dias': (
+            round(float(np.percentile(anticipacion_efectiva, 90)), 2) if len(anticipacion_efectiva) else 0
+        ),
+        'tipos': [TIPOS[t] for t in presentes],
+        'ingresos_por_semana': ingresos_por_semana,
+        'por_tipo': [
+            {
+                'tipo': TIPOS[t],
+                'reservas': int(reservas_tipo[t]),
+                'canceladas': int(canceladas_tipo[t]),
+                'tasa_cancelacion': _tasa(canceladas_tipo[t], reservas_tipo[t]),
+                'ingresos': round(float(ingresos_tipo[t]), 2),
+                'duracion_media_dias': round(float(dias_tipo[t] / efectivas_tipo[t]), 2) if efectivas_tipo[t] else 0,
+                'anticipacion_media_dias': (
+                    round(float(anticipacion_tipo[t] / efectivas_tipo[t]), 2) if efectivas_tipo[t] else 0
+                ),
+            }
+            for t in presentes
+        ],
+        'periodo': f'{fecha_inicio} a {fecha_fin}',
+        'fecha_generacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def _tendencias_vacias(fecha_inicio, fecha_fin):
+    return {
+        'total_reservas': 0,
+        'total_ingresos': 0,
+        'tasa_cancelacion': 0,
+        'duracion_media_dias': 0,
+        'anticipacion_media_dias': 0,
+        'anticipacion_mediana_dias': 0,
+        'anticipacion_p90_dias': 0,
+        'tipos': [],
+        'ingresos_por_semana': [],
+        'por_tipo': [],
+        'periodo': f"{fecha_inicio or 'Inicio'} a {fecha_fin or 'Fin'}",
+        'fecha_generacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
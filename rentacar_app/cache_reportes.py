@@ -0,0 +1,142 @@
+"""
+Caché de reportes generados.
+
+Un reporte se identifica por (tipo, fecha_inicio, fecha_fin) y por un sello
+de versión de los datos: el contador VERSION_REPORTES (que las señales de
+Reserva, Vehiculo y Cliente incrementan) más la fecha del día, porque algunos
+datos dependen de hoy (licencias vigentes, periodo por defecto...).
+
+Hay dos niveles:
+- un LRU en memoria por proceso con los últimos REPORTES_CACHE_TAMANO
+  reportes;
+- la tabla Reporte: si ya existe una fila con la misma clave y el mismo
+  sello, se reutilizan sus datos en lugar de recalcularlos.
+
+Un acierto cuesta solo la lectura del contador (y, en el segundo nivel, la
+de la fila del reporte); no se ejecuta ninguna agregación.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from django.conf import settings
+from django.utils import timezone
+
+from .instrumentacion import recolectar_metricas
+from .models import Reporte
+from .utils import (
+    convertir_decimal_a_float, generar_reporte_clientes, generar_reporte_financiero,
+    generar_reporte_reservas, generar_reporte_vehiculos,
+)
+from .versiones import obtener_version, VERSION_REPORTES
+
+# Los reportes de vehículos y clientes no dependen del periodo
+TIPOS_CON_PERIODO = ('FINANCIERO', 'RESERVAS', 'TENDENCIAS')
+
+
+def sello_datos():
+    valor, _ = obtener_version(VERSION_REPORTES)
+    return f'{valor}:{timezone.localdate().isoformat()}'
+
+
+def normalizar_parametros(tipo, fecha_inicio, fecha_fin):
+    """
+    Valida el tipo y convierte las fechas (AAAA-MM-DD o vacías) a date;
+    lanza ValueError si algo no es válido.
+    """
+    # El detalle de reservas y los contratos no tienen datos agregados: se
+    # encolan con tareas.encolar_detalle y tareas.encolar_contratos
+    if tipo not in dict(Reporte.TIPOS_REPORTE) or tipo in ('DETALLE', 'CONTRATOS'):
+        raise ValueError('Tipo de reporte inválido')
+    if tipo not in TIPOS_CON_PERIODO:
+        return tipo, None, None
+    fecha_inicio = date.fromisoformat(str(fecha_inicio)) if fecha_inicio else None
+    fecha_fin = date.fromisoformat(str(fecha_fin)) if fecha_fin else None
+    return tipo, fecha_inicio, fecha_fin
+
+
+def generar_datos_reporte(tipo, fecha_inicio, fecha_fin):
+    """Calcula los datos de un reporte (sin caché), listos para JSON"""
+    if tipo == 'FINANCIERO':
+        datos = generar_reporte_financiero(fecha_inicio, fecha_fin)
+    elif tipo == 'RESERVAS':
+        datos = generar_reporte_reservas(fecha_inicio, fecha_fin)
+    elif tipo == 'TENDENCIAS':
+        # analitica trae NumPy: solo se importa al pedir este reporte
+        from .analitica import generar_reporte_tendencias
+        datos = generar_reporte_tendencias(fecha_inicio, fecha_fin)
+    elif tipo == 'VEHICULOS':
+        datos = generar_reporte_vehiculos()
+    else:
+        datos = generar_reporte_clientes()
+    return convertir_decimal_a_float(datos)
+
+
+class CacheReportes:
+    """LRU en memoria delante de la tabla Reporte"""
+
+    def __init__(self, tamano=None):
+        self._tamano = tamano
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.aciertos_bd = 0
+        self.fallos = 0
+
+    def tamano(self):
+        return self._tamano or getattr(settings, 'REPORTES_CACHE_TAMANO', 64)
+
+    def _leer(self, clave):
+        with self._lock:
+            reporte = self._entradas.get(clave)
+            if reporte is not None:
+                self._entradas.move_to_end(clave)
+            return reporte
+
+    def _guardar(self, clave, reporte):
+        with self._lock:
+            self._entradas[clave] = reporte
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano():
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def obtener(self, tipo, fecha_inicio, fecha_fin, usuario):
+        """
+        Devuelve el Reporte de (tipo, fechas) para la versión actual de los
+        datos, generándolo y guardándolo solo si no existe.
+        """
+        tipo, fecha_inicio, fecha_fin = normalizar_parametros(tipo, fecha_inicio, fecha_fin)
+        sello = sello_datos()
+        clave = (tipo, fecha_inicio, fecha_fin, sello)
+
+        reporte = self._leer(clave)
+        if reporte is not None:
+            self.aciertos += 1
+            return reporte
+
+        reporte = Reporte.objects.filter(
+            tipo=tipo, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, version_datos=sello, estado='COMPLETADO'
+        ).order_by('-id').first()
+        if reporte is not None:
+            self.aciertos_bd += 1
+        else:
+            self.fallos += 1
+            with recolectar_metricas() as recolector:
+                reporte = Reporte.objects.create(
+                    tipo=tipo,
+                    fecha_inicio=fecha_inicio,
+                    fecha_fin=fecha_fin,
+                    datos=generar_datos_reporte(tipo, fecha_inicio, fecha_fin),
+                    version_datos=sello,
+                    generado_por=usuario,
+                )
+                recolector.reporte = reporte
+        self._guardar(clave, reporte)
+        return reporte
+
+
+cache_reportes = CacheReportes()
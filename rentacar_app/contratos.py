@@ -0,0 +1,232 @@
+"""
+Contratos en PDF guardados.
+
+El contrato de una reserva se genera una vez (al confirmarla o en la primera
+descarga) y se guarda en Contrato.archivo_pdf junto con el SHA-256 del PDF
+(hash_pdf, que es el ETag de la descarga) y el de los datos que imprime
+(huella_datos, sobre datos_contrato). Antes de servirlo se recalcula la
+huella con la reserva, el cliente y el vehículo ya cargados, y solo se
+vuelve a generar si cambió algún campo impreso o si falta el archivo: los
+cambios de estado, kilometraje, etc. no lo invalidan. La fecha de emisión
+del contrato es la de la generación. El PDF se genera en el pool de
+procesos.py, así que contrato_vigente puede lanzar ColaLlena o TiempoAgotado
+cuando el pool está saturado. Si el archivo no se puede guardar (ver
+almacenamiento.py) el contrato queda sin archivo pero con su hash_pdf, y el
+PDF recién generado se sirve igual.
+
+generar_lote_contratos junta en un ZIP o en un único PDF los contratos de
+las reservas que empiezan en un rango de fechas (o de una lista de códigos):
+las reservas se leen en una sola consulta, los PDF ya guardados y vigentes
+se reutilizan y el resto se reparte en lotes entre el pool de procesos de
+procesos.py, así que el tiempo baja con el número de núcleos. Los contratos
+generados quedan guardados como los de la descarga individual. La vista lo
+encola en tareas.py (encolar_contratos) en lugar de esperarlo; el comando
+generar_contratos lo llama directamente.
+"""
+import hashlib
+import io
+import json
+import logging
+import math
+import zipfile
+from datetime import datetime
+
+from django.conf import settings
+from pypdf import PdfWriter
+
+from .almacenamiento import archivo_disponible, guardar_archivo
+from .instrumentacion import guardar_metricas
+from .models import Contrato, Reserva
+from .procesos import ejecutar_en_proceso, esperar, renderizar, renderizar_contratos
+from .utils import TERMINOS_CONTRATO, datos_contrato, filtros_periodo
+
+logger = logging.getLogger(__name__)
+
+
+def huella_datos(datos):
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def guardar_contrato(reserva, contrato=None, datos=None):
+    """
+    Genera el PDF del contrato de `reserva` y lo guarda (creando el Contrato
+    si no existe); devuelve (contrato, bytes del PDF)
+    """
+    if datos is None:
+        datos = datos_contrato(reserva)
+    (pdf,), metricas = renderizar(renderizar_contratos, [datos], datetime.now())
+    guardar_metricas(metricas)
+    if contrato is None:
+        contrato, _ = Contrato.objects.get_or_create(
+            reserva=reserva, defaults={'terminos_condiciones': '\n'.join(TERMINOS_CONTRATO)}
+        )
+    guardar_archivo(contrato.archivo_pdf, f'contrato_{reserva.codigo_reserva}.pdf', pdf)
+    contrato.hash_pdf = hashlib.sha256(pdf).hexdigest()
+    contrato.huella_datos = huella_datos(datos)
+    contrato.save(update_fields=['archivo_pdf', 'hash_pdf', 'huella_datos'])
+    return contrato, pdf
+
+
+def contrato_vigente(reserva):
+    """
+    (contrato, bytes del PDF) de `reserva`, con un PDF que corresponde a sus
+    datos actuales; lo genera solo si hace falta. Los bytes son None cuando
+    se usa el archivo guardado. Conviene pasar la reserva con
+    select_related('cliente__usuario', 'vehiculo').
+    """
+    datos = datos_contrato(reserva)
+    contrato = Contrato.objects.filter(reserva=reserva).first()
+    if contrato is not None and contrato.huella_datos == huella_datos(datos) and archivo_disponible(contrato.archivo_pdf):
+        return contrato, None
+    return guardar_contrato(reserva, contrato, datos)
+
+
+def preparar_contrato(reserva):
+    """
+    contrato_vigente sin propagar errores: si falla, o si el PDF no se pudo
+    guardar, se vuelve a generar en la descarga
+    """
+    try:
+        contrato, _ = contrato_vigente(reserva)
+    except Exception:
+        logger.exception('No se pudo generar el contrato de la reserva %s', reserva.pk)
+        return None
+    if not contrato.archivo_pdf:
+        logger.warning('El contrato de la reserva %s no quedó guardado; se generará en la descarga', reserva.pk)
+    return contrato
+
+
+FORMATOS_LOTE_CONTRATOS = {
+    'zip': 'application/zip',
+    'pdf': 'application/pdf',
+}
+
+
+def reservas_lote(fecha_inicio=None, fecha_fin=None, codigos=None):
+    """
+    Reservas (no canceladas) que empiezan entre fecha_inicio y fecha_fin, días
+    locales incluidos, o las de `codigos`; con cliente y vehículo en la misma
+    consulta. Lanza ValueError si no hay ningún filtro.
+    """
+    if codigos:
+        reservas = Reserva.objects.filter(codigo_reserva__in=codigos)
+    elif fecha_inicio or fecha_fin:
+        reservas = Reserva.objects.filter(**filtros_periodo('fecha_inicio', fecha_inicio, fecha_fin)).exclude(
+            estado='CANCELADA'
+        )
+    else:
+        raise ValueError('Indique un rango de fechas o códigos de reserva')
+    return reservas.select_related('cliente__usuario', 'vehiculo').order_by('fecha_inicio', 'codigo_reserva')
+
+
+def _contratos_existentes(reservas, datos):
+    """
+    ({reserva_id: Contrato} de las reservas que ya tienen uno, {reserva_id:
+    bytes} de los que tienen un PDF guardado que sigue valiendo)
+    """
+    existentes = {
+        contrato.reserva_id: contrato
+        for contrato in Contrato.objects.filter(reserva__in=[reserva.pk for reserva in reservas])
+    }
+    vigentes = {}
+    for reserva_id, contrato in existentes.items():
+        if contrato.huella_datos == huella_datos(datos[reserva_id]) and archivo_disponible(contrato.archivo_pdf):
+            with contrato.archivo_pdf.open('rb') as archivo:
+                vigentes[reserva_id] = archivo.read()
+    return existentes, vigentes
+
+
+def _guardar_lote(reservas, pdfs, datos, existentes):
+    """guardar_contrato para muchos contratos, con una inserción y una actualización en bloque"""
+    nuevos = Contrato.objects.bulk_create(
+        [
+            Contrato(reserva=reserva, terminos_condiciones='\n'.join(TERMINOS_CONTRATO))
+            for reserva in reservas if reserva.pk not in existentes
+        ],
+        ignore_conflicts=True,
+    )
+    if any(contrato.pk is None for contrato in nuevos):
+        # ignore_conflicts no devuelve las claves en todos los motores
+        existentes = {
+            contrato.reserva_id: contrato
+            for contrato in Contrato.objects.filter(reserva__in=[reserva.pk for reserva in reservas])
+        }
+    else:
+        existentes = {**existentes, **{contrato.reserva_id: contrato for contrato in nuevos}}
+
+    contratos = []
+    for reserva in reservas:
+        contrato = existentes[reserva.pk]
+        pdf = pdfs[reserva.pk]
+        guardar_archivo(contrato.archivo_pdf, f'contrato_{reserva.codigo_reserva}.pdf', pdf)
+        contrato.hash_pdf = hashlib.sha256(pdf).hexdigest()
+        contrato.huella_datos = huella_datos(datos[reserva.pk])
+        contratos.append(contrato)
+    Contrato.objects.bulk_update(contratos, ['archivo_pdf', 'hash_pdf', 'huella_datos'], batch_size=500)
+
+
+def _tamano_lote(pendientes):
+    # Unos cuatro lotes por proceso para repartir bien la carga, sin pasar de 25 contratos
+    procesos = max(1, getattr(settings, 'REPORTES_PROCESOS', 2))
+    return max(1, min(25, math.ceil(pendientes / (procesos * 4))))
+
+
+def _comprobar_cantidad(cantidad):
+    if not cantidad:
+        raise ValueError('No hay reservas que cumplan el filtro')
+    maximo = getattr(settings, 'CONTRATOS_LOTE_MAXIMO', 1000)
+    if cantidad > maximo:
+        raise ValueError(f'El lote supera el máximo de {maximo} contratos')
+
+
+def comprobar_lote_contratos(fecha_inicio=None, fecha_fin=None, codigos=None, formato='zip'):
+    """Las mismas comprobaciones que generar_lote_contratos, con un COUNT en lugar de leer las reservas"""
+    if formato not in FORMATOS_LOTE_CONTRATOS:
+        raise ValueError('Formato inválido')
+    _comprobar_cantidad(reservas_lote(fecha_inicio, fecha_fin, codigos).count())
+
+
+def generar_lote_contratos(fecha_inicio=None, fecha_fin=None, codigos=None, formato='zip'):
+    """
+    Devuelve (contenido, nombre de archivo, número de contratos) con los
+    contratos de reservas_lote en `formato` ('zip' o 'pdf'). Lanza ValueError
+    si el formato o los filtros no son válidos o si no hay reservas.
+    """
+    if formato not in FORMATOS_LOTE_CONTRATOS:
+        raise ValueError('Formato inválido')
+    reservas = list(reservas_lote(fecha_inicio, fecha_fin, codigos))
+    _comprobar_cantidad(len(reservas))
+
+    datos = {reserva.pk: datos_contrato(reserva) for reserva in reservas}
+    existentes, pdfs = _contratos_existentes(reservas, datos)
+    pendientes = [reserva for reserva in reservas if reserva.pk not in pdfs]
+
+    emision = datetime.now()
+    tamano = _tamano_lote(len(pendientes))
+    lotes = [pendientes[i:i + tamano] for i in range(0, len(pendientes), tamano)]
+    futuros = [
+        ejecutar_en_proceso(renderizar_contratos, [datos[reserva.pk] for reserva in lote], emision)
+        for lote in lotes
+    ]
+    for lote, futuro in zip(lotes, futuros):
+        generados, metricas = esperar(futuro, renderizar_contratos, [datos[reserva.pk] for reserva in lote], emision)
+        guardar_metricas(metricas)
+        pdfs.update((reserva.pk, pdf) for reserva, pdf in zip(lote, generados))
+    if pendientes:
+        _guardar_lote(pendientes, pdfs, datos, existentes)
+
+    sufijo = '_'.join(str(parte) for parte in (fecha_inicio, fecha_fin) if parte) or f'{len(reservas)}_reservas'
+    if formato == 'pdf':
+        escritor = PdfWriter()
+        for reserva in reservas:
+            escritor.append(io.BytesIO(pdfs[reserva.pk]))
+        buffer = io.BytesIO()
+        escritor.write(buffer)
+        return buffer.getvalue(), f'contratos_{sufijo}.pdf', len(reservas)
+
+    buffer = io.BytesIO()
+    # Los PDF ya van comprimidos
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for reserva in reservas:
+            archivo_zip.writestr(f'contrato_{reserva.codigo_reserva}.pdf', pdfs[reserva.pk])
+    return buffer.getvalue(), f'contratos_{sufijo}.zip', len(reservas)
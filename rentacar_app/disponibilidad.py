@@ -0,0 +1,648 @@
+"""
+Índice en memoria de disponibilidad de vehículos.
+
+Mantiene, por vehículo, las reservas activas (CONFIRMADA, ACTIVA y PENDIENTE)
+ordenadas por fecha de inicio junto con el máximo acumulado de sus fechas de
+fin. Con eso, saber si un vehículo está libre en [inicio, fin] es una búsqueda
+binaria en lugar de una consulta a la base de datos.
+
+El índice solo carga las reservas que terminan desde el primer día del mes
+en curso; los rangos anteriores se consultan en la base de datos. Se
+construye con una sola consulta la primera vez que se usa y se actualiza de
+forma incremental con las señales de Reserva (ver signals.py). Los cambios
+de otros procesos se detectan con VERSION_DISPONIBILIDAD: cuando el contador
+difiere del que refleja el índice se releen las reservas modificadas desde
+la última lectura (o todas, si hubo borrados). Cada
+DISPONIBILIDAD_INDICE_TTL segundos se reconstruye entero igualmente, por las
+escrituras que no pasan por las señales. Las consultas se hacen fuera del
+lock: mientras se leen, se sigue respondiendo con el índice anterior y los
+cambios locales se guardan para aplicarlos sobre el nuevo.
+
+Para saber qué vehículos están ocupados en un rango no se recorre la flota:
+cada día guarda los vehículos con alguna reserva que lo toca, y solo esos
+candidatos (más los de reservas muy largas) se comprueban.
+
+Sobre el mismo índice, CalendarioOcupacion mantiene un bitset de días
+ocupados por vehículo para la vista mensual de la flota.
+"""
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Reserva, Vehiculo
+from .versiones import obtener_version, VERSION_DISPONIBILIDAD, VERSION_RESERVAS_ELIMINADAS
+
+ESTADOS_ACTIVOS = ['CONFIRMADA', 'ACTIVA', 'PENDIENTE']
+
+
+def _a_timestamp(fecha):
+    """Convierte un datetime (con o sin zona horaria) a segundos epoch"""
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    return fecha.timestamp()
+
+
+class _IntervalosVehiculo:
+    """Reservas activas de un vehículo ordenadas por fecha de inicio"""
+
+    __slots__ = ('inicios', 'fines', 'ids', 'max_fines', 'version')
+
+    def __init__(self):
+        self.inicios = []
+        self.fines = []
+        self.ids = []
+        self.version = 0
+        # max_fines[i] = max(fines[:i + 1]); permite descartar en O(log n)
+        # aunque existan reservas solapadas en los datos
+        self.max_fines = []
+
+    def agregar(self, reserva_id, inicio, fin):
+        i = bisect_right(self.inicios, inicio)
+        self.inicios.insert(i, inicio)
+        self.fines.insert(i, fin)
+        self.ids.insert(i, reserva_id)
+        self._recalcular_desde(i)
+        self.version += 1
+
+    def quitar(self, reserva_id):
+        i = self.ids.index(reserva_id)
+        del self.inicios[i]
+        del self.fines[i]
+        del self.ids[i]
+        self._recalcular_desde(i)
+        self.version += 1
+
+    def _recalcular_desde(self, i):
+        del self.max_fines[i:]
+        actual = self.max_fines[i - 1] if i else float('-inf')
+        for fin in self.fines[i:]:
+            if fin > actual:
+                actual = fin
+            self.max_fines.append(actual)
+
+    def hay_conflicto(self, inicio, fin, excluir=None):
+        # Candidatas: reservas que empiezan antes o en el fin solicitado
+        j = bisect_right(self.inicios, fin)
+        if j == 0 or self.max_fines[j - 1] < inicio:
+            return False
+        if excluir is None:
+            return True
+
+        for k in range(j - 1, -1, -1):
+            if self.max_fines[k] < inicio:
+                break
+            if self.fines[k] >= inicio and self.ids[k] != excluir:
+                return True
+        return False
+
+
+# Segundos de un cubo del índice por días
+DIA = 86400
+# Reservas que abarcan más días no se reparten por cubos: se revisan siempre
+DIAS_MAXIMOS_EN_CUBOS = 62
+
+
+class _DatosIndice:
+    """
+    Reservas activas que terminan desde `desde` (segundos epoch): intervalos
+    por vehículo y, para saber qué vehículos están ocupados sin recorrer toda
+    la flota, cubos por día con los vehículos que tienen alguna reserva ese
+    día (candidatos que luego se comprueban con sus intervalos).
+    """
+
+    def __init__(self, desde):
+        self.desde = desde
+        self.vehiculos = {}
+        # reserva_id -> (vehiculo_id, inicio, fin)
+        self.reservas = {}
+        # día -> {vehiculo_id: reservas de ese vehículo que tocan el día}
+        self.dias = {}
+        # vehiculo_id -> reservas que no están en los cubos por ser largas
+        self.largas = {}
+
+    def _intervalos(self, vehiculo_id):
+        intervalos = self.vehiculos.get(vehiculo_id)
+        if intervalos is None:
+            intervalos = self.vehiculos[vehiculo_id] = _IntervalosVehiculo()
+        return intervalos
+
+    def _contar(self, vehiculo_id, inicio, fin, signo):
+        primero, ultimo = int(inicio // DIA), int(fin // DIA)
+        if ultimo - primero > DIAS_MAXIMOS_EN_CUBOS:
+            claves, cubos = [None], {None: self.largas}
+        else:
+            claves, cubos = range(primero, ultimo + 1), self.dias
+        for clave in claves:
+            cubo = cubos.setdefault(clave, {})
+            cantidad = cubo.get(vehiculo_id, 0) + signo
+            if cantidad:
+                cubo[vehiculo_id] = cantidad
+            else:
+                del cubo[vehiculo_id]
+                if not cubo and clave is not None:
+                    del cubos[clave]
+
+    def cargar(self, reserva_id, vehiculo_id, inicio, fin):
+        """Añade al final: las filas llegan ordenadas por vehículo y fecha de inicio"""
+        intervalos = self._intervalos(vehiculo_id)
+        intervalos.inicios.append(inicio)
+        intervalos.fines.append(fin)
+        intervalos.ids.append(reserva_id)
+        previo = intervalos.max_fines[-1] if intervalos.max_fines else fin
+        intervalos.max_fines.append(max(previo, fin))
+        self.reservas[reserva_id] = (vehiculo_id, inicio, fin)
+        self._contar(vehiculo_id, inicio, fin, 1)
+
+    def agregar(self, reserva_id, vehiculo_id, inicio, fin):
+        self._intervalos(vehiculo_id).agregar(reserva_id, inicio, fin)
+        self.reservas[reserva_id] = (vehiculo_id, inicio, fin)
+        self._contar(vehiculo_id, inicio, fin, 1)
+
+    def quitar(self, reserva_id):
+        datos = self.reservas.pop(reserva_id, None)
+        if datos is not None:
+            vehiculo_id, inicio, fin = datos
+            self.vehiculos[vehiculo_id].quitar(reserva_id)
+            self._contar(vehiculo_id, inicio, fin, -1)
+
+    def aplicar(self, reserva_id, vehiculo_id, estado, inicio, fin):
+        """Estado actual de una reserva guardada (estado None = borrada)"""
+        self.quitar(reserva_id)
+        if estado in ESTADOS_ACTIVOS and inicio is not None and fin is not None and fin >= self.desde:
+            self.agregar(reserva_id, vehiculo_id, inicio, fin)
+
+    def ocupados(self, inicio, fin):
+        candidatos = set(self.largas)
+        for dia in range(int(inicio // DIA), int(fin // DIA) + 1):
+            cubo = self.dias.get(dia)
+            if cubo:
+                candidatos.update(cubo)
+        return {
+            vehiculo_id for vehiculo_id in candidatos
+            if self.vehiculos[vehiculo_id].hay_conflicto(inicio, fin)
+        }
+
+
+class IndiceDisponibilidad:
+    """
+    Índice de intervalos por vehículo sobre las reservas activas que terminan
+    desde el primer día del mes en curso (lo que necesitan las búsquedas y el
+    calendario); para rangos anteriores responde None y se consulta la base.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Una sola carga desde la BD a la vez; la consulta se hace sin _lock
+        self._lock_reconstruccion = threading.Lock()
+        self._datos = None
+        self._construido_en = None
+        self._invalidaciones = 0
+        # Cambios que llegan mientras se carga desde la BD
+        self._pendientes = None
+        self.generacion = 0
+        # VERSION_DISPONIBILIDAD (valor, actualizado) que refleja el índice
+        self._version = (0, None)
+        self._eliminadas = None
+        # Momento en que empezó la última lectura, para el refresco incremental
+        self._leido_desde = None
+        self._verificado_en = None
+
+    def _asegurar(self, verificar=False):
+        """
+        Reconstruye si hace falta y, como mucho cada
+        DISPONIBILIDAD_VERIFICAR_CADA segundos (siempre con verificar=True),
+        compara VERSION_DISPONIBILIDAD con la que refleja el índice para traer
+        los cambios de otros procesos. Si el índice solo caducó o está
+        atrasado, los demás hilos siguen respondiendo con él mientras uno lo
+        pone al día; si se invalidó o aún no existe, esperan a que esté listo.
+        """
+        ttl = getattr(settings, 'DISPONIBILIDAD_INDICE_TTL', 300)
+        construido_en = self._construido_en
+        if construido_en is None:
+            with self._lock_reconstruccion:
+                if self._construido_en is None:
+                    self._actualizar_desde_bd(completa=True)
+            return
+        ahora = time.monotonic()
+        if ahora - construido_en > ttl:
+            self._intentar_actualizar(completa=True)
+            return
+        cada = getattr(settings, 'DISPONIBILIDAD_VERIFICAR_CADA', 1)
+        if not verificar and self._verificado_en is not None and ahora - self._verificado_en < cada:
+            return
+        self._verificado_en = ahora
+        if obtener_version(VERSION_DISPONIBILIDAD) != self._version:
+            self._intentar_actualizar(completa=False)
+
+    def _intentar_actualizar(self, completa):
+        if self._lock_reconstruccion.acquire(blocking=False):
+            try:
+                self._actualizar_desde_bd(completa)
+            finally:
+                self._lock_reconstruccion.release()
+
+    def sincronizar(self):
+        """
+        Pone el índice al día con VERSION_DISPONIBILIDAD y devuelve la versión
+        (valor, actualizado) que refleja, para ETag y Last-Modified
+        """
+        self._asegurar(verificar=True)
+        return self._version
+
+    def reconstruir(self):
+        """Carga las reservas activas vigentes con una única consulta"""
+        with self._lock_reconstruccion:
+            self._actualizar_desde_bd(completa=True)
+
+    def _actualizar_desde_bd(self, completa):
+        """
+        Carga completa, o solo las reservas modificadas desde la última
+        lectura (con DISPONIBILIDAD_MARGEN_SEGUNDOS de holgura por las
+        transacciones que confirman tarde). Un borrado no deja fila que leer,
+        así que tras VERSION_RESERVAS_ELIMINADAS se carga todo de nuevo.
+        """
+        with self._lock:
+            self._pendientes = []
+            invalidaciones = self._invalidaciones
+        try:
+            # Las versiones se leen antes que las reservas: si cambian durante
+            # la consulta, la próxima verificación vuelve a refrescar
+            version = obtener_version(VERSION_DISPONIBILIDAD)
+            eliminadas, _ = obtener_version(VERSION_RESERVAS_ELIMINADAS)
+            leido_desde = timezone.now()
+            completa = completa or self._datos is None or eliminadas != self._eliminadas
+            if completa:
+                datos = self._cargar()
+            else:
+                margen = timedelta(seconds=getattr(settings, 'DISPONIBILIDAD_MARGEN_SEGUNDOS', 60))
+                cambios = list(Reserva.objects.filter(
+                    fecha_actualizacion__gte=self._leido_desde - margen,
+                ).values_list('id', 'vehiculo_id', 'estado', 'fecha_inicio', 'fecha_fin'))
+
+            with self._lock:
+                if not completa:
+                    datos = self._datos
+                    for reserva_id, vehiculo_id, estado, inicio, fin in cambios:
+                        datos.aplicar(reserva_id, vehiculo_id, estado, _a_timestamp(inicio), _a_timestamp(fin))
+                # Cambios confirmados mientras se leía: pueden estar o no en
+                # la consulta, aplicarlos de nuevo no cambia el resultado
+                for cambio in self._pendientes:
+                    datos.aplicar(*cambio)
+                self._datos = datos
+                self._version, self._eliminadas, self._leido_desde = version, eliminadas, leido_desde
+                # Si se invalidó durante la carga, la consulta pudo no verlo
+                if self._invalidaciones != invalidaciones:
+                    self._construido_en = None
+                elif completa:
+                    self._construido_en = time.monotonic()
+                    self.generacion += 1
+        finally:
+            with self._lock:
+                self._pendientes = None
+
+    def _cargar(self):
+        desde = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        filas = Reserva.objects.filter(
+            estado__in=ESTADOS_ACTIVOS, fecha_fin__gte=desde,
+        ).order_by('vehiculo_id', 'fecha_inicio').values_list(
+            'id', 'vehiculo_id', 'fecha_inicio', 'fecha_fin'
+        )
+        datos = _DatosIndice(desde.timestamp())
+        for reserva_id, vehiculo_id, inicio, fin in filas.iterator(chunk_size=5000):
+            datos.cargar(reserva_id, vehiculo_id, _a_timestamp(inicio), _a_timestamp(fin))
+        return datos
+
+    def invalidar(self):
+        """Fuerza la reconstrucción en el próximo uso"""
+        with self._lock:
+            self._construido_en = None
+            self._invalidaciones += 1
+
+    def _aplicar(self, *cambio):
+        with self._lock:
+            if self._pendientes is not None:
+                self._pendientes.append(cambio)
+            if self._datos is not None and self._construido_en is not None:
+                self._datos.aplicar(*cambio)
+
+    def actualizar_reserva(self, reserva_id, vehiculo_id, estado, fecha_inicio, fecha_fin):
+        """Refleja en el índice el estado actual de una reserva guardada"""
+        activa = estado in ESTADOS_ACTIVOS and fecha_inicio and fecha_fin
+        self._aplicar(
+            reserva_id, vehiculo_id, estado,
+            _a_timestamp(fecha_inicio) if activa else None, _a_timestamp(fecha_fin) if activa else None,
+        )
+
+    def eliminar_reserva(self, reserva_id):
+        self._aplicar(reserva_id, None, None, None, None)
+
+    def cubre(self, fecha_inicio):
+        """True si el índice tiene todas las reservas que pueden cruzarse con un rango desde fecha_inicio"""
+        self._asegurar()
+        with self._lock:
+            return _a_timestamp(fecha_inicio) >= self._datos.desde
+
+    def esta_disponible(self, vehiculo_id, fecha_inicio, fecha_fin, excluir=None):
+        """
+        True si el vehículo no tiene reservas activas que se crucen con el
+        rango; None si el rango empieza antes de lo que cubre el índice
+        """
+        inicio = _a_timestamp(fecha_inicio)
+        self._asegurar()
+        with self._lock:
+            if inicio < self._datos.desde:
+                return None
+            intervalos = self._datos.vehiculos.get(vehiculo_id)
+            if intervalos is None:
+                return True
+            return not intervalos.hay_conflicto(inicio, _a_timestamp(fecha_fin), excluir)
+
+    def version_vehiculo(self, vehiculo_id):
+        """Cambia cada vez que se modifica alguna reserva activa del vehículo"""
+        self._asegurar()
+        with self._lock:
+            intervalos = self._datos.vehiculos.get(vehiculo_id)
+            return (self.generacion, intervalos.version if intervalos else 0)
+
+    def intervalos_vehiculo(self, vehiculo_id):
+        """
+        Devuelve (version, [(inicio, fin), ...]) del vehículo en segundos epoch
+        (solo reservas que terminan desde el inicio del mes del índice)
+        """
+        self._asegurar()
+        with self._lock:
+            intervalos = self._datos.vehiculos.get(vehiculo_id)
+            if intervalos is None:
+                return (self.generacion, 0), []
+            return (self.generacion, intervalos.version), list(zip(intervalos.inicios, intervalos.fines))
+
+    def vehiculos_ocupados(self, fecha_inicio, fecha_fin):
+        """
+        Conjunto de IDs de vehículos con alguna reserva activa en el rango;
+        None si el rango empieza antes de lo que cubre el índice
+        """
+        inicio = _a_timestamp(fecha_inicio)
+        fin = _a_timestamp(fecha_fin)
+        self._asegurar()
+        with self._lock:
+            if inicio < self._datos.desde:
+                return None
+            return self._datos.ocupados(inicio, fin)
+
+
+indice_disponibilidad = IndiceDisponibilidad()
+
+
+class CalendarioOcupacion:
+    """
+    Bitset de días ocupados por vehículo sobre un horizonte móvil.
+
+    El bit i representa el día base + i, donde base es el primer día del mes
+    actual. Cada bitset se guarda junto con la versión de las reservas del
+    vehículo en el índice y su estado, y solo se recalcula cuando alguno de
+    los dos cambió.
+    """
+
+    ESTADOS_BLOQUEADOS = ('MANTENIMIENTO', 'INACTIVO')
+
+    def __init__(self, indice):
+        self._indice = indice
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._base = None
+
+    @staticmethod
+    def horizonte():
+        return getattr(settings, 'DISPONIBILIDAD_HORIZONTE_DIAS', 365)
+
+    def base(self):
+        return timezone.localdate().replace(day=1)
+
+    def bits_vehiculo(self, vehiculo_id, estado):
+        base = self.base()
+        horizonte = self.horizonte()
+        clave = (self._indice.version_vehiculo(vehiculo_id), estado)
+
+        with self._lock:
+            if self._base != base:
+                self._cache = {}
+                self._base = base
+            en_cache = self._cache.get(vehiculo_id)
+            if en_cache is not None and en_cache[0] == clave:
+                return en_cache[1]
+
+        version, intervalos = self._indice.intervalos_vehiculo(vehiculo_id)
+        clave = (version, estado)
+
+        if estado in self.ESTADOS_BLOQUEADOS:
+            bits = (1 << horizonte) - 1
+        else:
+            bits = 0
+            zona = timezone.get_current_timezone()
+            for inicio, fin in intervalos:
+                d0 = (datetime.fromtimestamp(inicio, zona).date() - base).days
+                d1 = (datetime.fromtimestamp(fin, zona).date() - base).days
+                d0 = max(d0, 0)
+                d1 = min(d1, horizonte - 1)
+                if d0 <= d1:
+                    bits |= ((1 << (d1 - d0 + 1)) - 1) << d0
+
+        with self._lock:
+            self._cache[vehiculo_id] = (clave, bits)
+        return bits
+
+    def ocupacion_mes(self, vehiculo_id, estado, año, mes):
+        """Cadena '0'/'1' con un carácter por día del mes ('1' = ocupado)"""
+        base = self.base()
+        inicio_mes = date(año, mes, 1)
+        fin_mes = (inicio_mes + timedelta(days=32)).replace(day=1)
+        desplazamiento = (inicio_mes - base).days
+        dias = (fin_mes - inicio_mes).days
+        if desplazamiento < 0 or desplazamiento + dias > self.horizonte():
+            raise ValueError('Mes fuera del horizonte del calendario')
+
+        bits = (self.bits_vehiculo(vehiculo_id, estado) >> desplazamiento) & ((1 << dias) - 1)
+        return format(bits, f'0{dias}b')[::-1]
+
+
+calendario_ocupacion = CalendarioOcupacion(indice_disponibilidad)
+
+
+def hay_conflicto_en_bd(vehiculo_id, fecha_inicio, fecha_fin, excluir_id=None):
+    """Consulta directa a la base de datos (respaldo y verificación del índice)"""
+    reservas_conflictivas = Reserva.objects.filter(
+        vehiculo_id=vehiculo_id,
+        fecha_inicio__lte=fecha_fin,
+        fecha_fin__gte=fecha_inicio,
+        estado__in=ESTADOS_ACTIVOS
+    )
+    if excluir_id:
+        reservas_conflictivas = reservas_conflictivas.exclude(id=excluir_id)
+    return reservas_conflictivas.exists()
+
+
+def vehiculos_disponibles_qs(fecha_inicio, fecha_fin):
+    """
+    Vehículos DISPONIBLE sin reservas activas en el rango, resuelto en SQL con
+    NOT EXISTS. Útil cuando el filtrado, el orden y la paginación deben
+    quedarse en la base de datos.
+    """
+    reservas_conflictivas = Reserva.objects.filter(
+        vehiculo=OuterRef('pk'),
+        fecha_inicio__lte=fecha_fin,
+        fecha_fin__gte=fecha_inicio,
+        estado__in=ESTADOS_ACTIVOS
+    )
+    return Vehiculo.objects.filter(~Exists(reservas_conflictivas), estado='DISPONIBLE')
+
+
+def vehiculo_disponible(vehiculo_id, fecha_inicio, fecha_fin, excluir_id=None, verificar_en_bd=False):
+    """
+    Indica si un vehículo está libre en [fecha_inicio, fecha_fin].
+
+    Responde con el índice en memoria. Con verificar_en_bd=True, una respuesta
+    positiva del índice se confirma contra la base de datos; es lo que usan
+    los caminos de escritura, donde un índice desactualizado no puede permitir
+    una doble reserva.
+    """
+    if not getattr(settings, 'DISPONIBILIDAD_USAR_INDICE', True):
+        return not hay_conflicto_en_bd(vehiculo_id, fecha_inicio, fecha_fin, excluir_id)
+
+    disponible = indice_disponibilidad.esta_disponible(vehiculo_id, fecha_inicio, fecha_fin, excluir_id)
+    if disponible is None:
+        return not hay_conflicto_en_bd(vehiculo_id, fecha_inicio, fecha_fin, excluir_id)
+    if not disponible:
+        return False
+    if verificar_en_bd:
+        return not hay_conflicto_en_bd(vehiculo_id, fecha_inicio, fecha_fin, excluir_id)
+    return True
+
+
+def vehiculos_ocupados(fecha_inicio, fecha_fin):
+    """IDs de vehículos con reservas activas que se cruzan con el rango"""
+    if getattr(settings, 'DISPONIBILIDAD_USAR_INDICE', True):
+        ocupados = indice_disponibilidad.vehiculos_ocupados(fecha_inicio, fecha_fin)
+        if ocupados is not None:
+            return ocupados
+    return set(Reserva.objects.filter(
+        fecha_inicio__lte=fecha_fin,
+        fecha_fin__gte=fecha_inicio,
+        estado__in=ESTADOS_ACTIVOS
+    ).values_list('vehiculo_id', flat=True))
+
+
+def vehiculos_ocupados_lote(rangos):
+    """
+    Vehículos ocupados para varios rangos [(inicio, fin), ...] a la vez.
+
+    Con el índice activo no toca la base de datos si todos los rangos caen
+    dentro de lo que cubre; si no, carga en una sola consulta las reservas
+    que cubren el intervalo total y resuelve cada rango en memoria.
+    """
+    if not rangos:
+        return []
+    if getattr(settings, 'DISPONIBILIDAD_USAR_INDICE', True):
+        if indice_disponibilidad.cubre(min(inicio for inicio, _ in rangos)):
+            return [indice_disponibilidad.vehiculos_ocupados(inicio, fin) for inicio, fin in rangos]
+
+    minimo = min(inicio for inicio, _ in rangos)
+    maximo = max(fin for _, fin in rangos)
+    reservas = list(Reserva.objects.filter(
+        fecha_inicio__lte=maximo,
+        fecha_fin__gte=minimo,
+        estado__in=ESTADOS_ACTIVOS
+    ).values_list('vehiculo_id', 'fecha_inicio', 'fecha_fin'))
+    reservas = [(v, _a_timestamp(i), _a_timestamp(f)) for v, i, f in reservas]
+
+    resultado = []
+    for inicio, fin in rangos:
+        a, b = _a_timestamp(inicio), _a_timestamp(fin)
+        resultado.append({v for v, i, f in reservas if i <= b and f >= a})
+    return resultado
+
+
+def _hacia_arriba(delta, paso):
+    """Techo de delta / paso para timedeltas"""
+    return -(-delta // paso)
+
+
+def ventanas_libres(vehiculo_id, fecha_inicio, fecha_fin, k=3, excluir_id=None):
+    """
+    Las k ventanas libres más cercanas a [fecha_inicio, fecha_fin] para el
+    vehículo, con la misma duración y desplazadas días enteros (la propia
+    ventana pedida se incluye si está libre).
+
+    Hace una sola consulta ordenada de las reservas activas del vehículo
+    dentro de ±DISPONIBILIDAD_VENTANAS_DIAS y recorre los huecos entre ellas;
+    para cada hueco calcula directamente qué desplazamientos caben. No se
+    sugieren ventanas que empiecen en el pasado.
+    """
+    if timezone.is_naive(fecha_inicio):
+        fecha_inicio = timezone.make_aware(fecha_inicio)
+    if timezone.is_naive(fecha_fin):
+        fecha_fin = timezone.make_aware(fecha_fin)
+    duracion = fecha_fin - fecha_inicio
+    dia = timedelta(days=1)
+    margen = timedelta(days=getattr(settings, 'DISPONIBILIDAD_VENTANAS_DIAS', 90))
+
+    # Desplazamientos (en días) permitidos por el horizonte de búsqueda
+    desde = max(timezone.now(), fecha_inicio - margen)
+    hasta = fecha_fin + margen
+    minimo = _hacia_arriba(desde - fecha_inicio, dia)
+    maximo = (hasta - fecha_fin) // dia
+
+    reservas = Reserva.objects.filter(
+        vehiculo_id=vehiculo_id,
+        estado__in=ESTADOS_ACTIVOS,
+        fecha_fin__gte=desde,
+        fecha_inicio__lte=hasta,
+    )
+    if excluir_id:
+        reservas = reservas.exclude(pk=excluir_id)
+
+    # Huecos abiertos (fin anterior, inicio siguiente); None = sin límite
+    huecos = []
+    cubierto_hasta = None
+    for inicio, fin in reservas.order_by('fecha_inicio').values_list('fecha_inicio', 'fecha_fin'):
+        if cubierto_hasta is None or inicio > cubierto_hasta:
+            huecos.append((cubierto_hasta, inicio))
+        if cubierto_hasta is None or fin > cubierto_hasta:
+            cubierto_hasta = fin
+    huecos.append((cubierto_hasta, None))
+
+    # Conflicto si reserva.inicio <= fin y reserva.fin >= inicio, así que la
+    # ventana debe empezar después del hueco y terminar antes de su final
+    candidatos = []
+    for anterior, siguiente in huecos:
+        bajo = minimo if anterior is None else max(minimo, (anterior - fecha_inicio) // dia + 1)
+        alto = maximo if siguiente is None else min(maximo, _hacia_arriba(siguiente - fecha_fin, dia) - 1)
+        if bajo > alto:
+            continue
+        # Los k desplazamientos del rango más cercanos a cero
+        centro = min(max(0, bajo), alto)
+        izquierda, derecha = centro - 1, centro
+        for _ in range(k):
+            if derecha <= alto and (izquierda < bajo or abs(derecha) <= abs(izquierda)):
+                candidatos.append(derecha)
+                derecha += 1
+            elif izquierda >= bajo:
+                candidatos.append(izquierda)
+                izquierda -= 1
+            else:
+                break
+
+    candidatos.sort(key=lambda n: (abs(n), n))
+    return [(fecha_inicio + n * dia, fecha_fin + n * dia) for n in candidatos[:k]]
+
+
+def vehiculos_alternativos(vehiculo, fecha_inicio, fecha_fin, k=3):
+    """Vehículos libres en el mismo rango, del mismo tipo y con igual o mayor capacidad"""
+    return vehiculos_disponibles_qs(fecha_inicio, fecha_fin).filter(
+        tipo=vehiculo.tipo,
+        capacidad_pasajeros__gte=vehiculo.capacidad_pasajeros,
+    ).exclude(pk=vehiculo.pk).order_by('precio_dia', 'id')[:k]
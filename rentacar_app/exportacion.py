@@ -0,0 +1,168 @@
+"""
+Exportación del detalle completo de reservas en CSV, NDJSON o PDF.
+
+Las filas se leen con values_list().iterator(chunk_size=...), que en
+PostgreSQL usa un cursor del lado del servidor, y se van escribiendo a medida
+que llegan: la memoria no depende del número de reservas exportadas y la
+cabecera sale antes de que la consulta termine. Las columnas de cliente y
+vehículo vienen en la misma consulta (JOIN), sin una consulta por fila.
+
+El PDF sale de la misma consulta: escribir_tabla_pdf va creando LongTable de
+PDF_FILAS_POR_TABLA filas a medida que ReportLab las maqueta y el documento
+se escribe en un archivo (exportar_pdf). Puede tener miles de páginas, así
+que se genera como trabajo en segundo plano (tareas.encolar_detalle) y se
+guarda como archivo del Reporte. Ni la tabla ni el PDF completo pasan por la
+memoria del proceso.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+from reportlab.lib.units import inch
+
+from .instrumentacion import medir
+from .models import Reserva
+from .utils import escribir_tabla_pdf, filtros_periodo
+
+FORMATOS_EXPORTACION = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'pdf': 'application/pdf',
+}
+
+# (columna exportada, campo de la consulta)
+COLUMNAS_EXPORTACION = [
+    ('codigo_reserva', 'codigo_reserva'),
+    ('estado', 'estado'),
+    ('fecha_reserva', 'fecha_reserva'),
+    ('fecha_inicio', 'fecha_inicio'),
+    ('fecha_fin', 'fecha_fin'),
+    ('precio_total', 'precio_total'),
+    ('cliente_cedula', 'cliente__cedula_identidad'),
+    ('cliente_nombre', 'cliente__usuario__first_name'),
+    ('cliente_apellido', 'cliente__usuario__last_name'),
+    ('cliente_email', 'cliente__usuario__email'),
+    ('cliente_telefono', 'cliente__telefono'),
+    ('vehiculo_placa', 'vehiculo__placa'),
+    ('vehiculo_marca', 'vehiculo__marca'),
+    ('vehiculo_modelo', 'vehiculo__modelo'),
+    ('vehiculo_tipo', 'vehiculo__tipo'),
+]
+
+# Columnas del PDF (apaisado): (encabezado, ancho en pulgadas)
+COLUMNAS_PDF = [
+    ('Código', 0.85), ('Estado', 0.9), ('Reserva', 0.75), ('Inicio', 0.75), ('Fin', 0.75),
+    ('Cliente', 1.7), ('Cédula', 0.8), ('Vehículo', 1.5), ('Placa', 0.7), ('Tipo', 0.8),
+    ('Total (Bs.)', 0.9),
+]
+CAMPOS_PDF = [
+    'codigo_reserva', 'estado', 'fecha_reserva', 'fecha_inicio', 'fecha_fin',
+    'cliente__usuario__first_name', 'cliente__usuario__last_name', 'cliente__cedula_identidad',
+    'vehiculo__marca', 'vehiculo__modelo', 'vehiculo__placa', 'vehiculo__tipo', 'precio_total',
+]
+
+# Tamaño aproximado (en caracteres) de cada trozo enviado al cliente
+TAMANO_BLOQUE = 64 * 1024
+
+
+def reservas_exportacion(fecha_inicio=None, fecha_fin=None, estados=None, campos=None):
+    """
+    Reservas con fecha_reserva entre fecha_inicio y fecha_fin (días locales,
+    ambos incluidos) y en `estados` (todos si está vacío), como tuplas con
+    `campos` (por defecto, en el orden de COLUMNAS_EXPORTACION).
+    """
+    reservas = Reserva.objects.filter(**filtros_periodo('fecha_reserva', fecha_inicio, fecha_fin))
+    if estados:
+        reservas = reservas.filter(estado__in=estados)
+    return reservas.order_by('pk').values_list(*(campos or [campo for _, campo in COLUMNAS_EXPORTACION]))
+
+
+def _valor(valor):
+    """Fechas en hora local ISO 8601; decimales como texto para no perder precisión"""
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _filas(reservas, chunk_size):
+    chunk_size = chunk_size or getattr(settings, 'EXPORTACION_CHUNK_SIZE', 2000)
+    for fila in reservas.iterator(chunk_size=chunk_size):
+        yield [_valor(valor) for valor in fila]
+
+
+def exportar_csv(reservas, chunk_size=None):
+    """Genera el CSV (con cabecera) en trozos de unos TAMANO_BLOQUE caracteres"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow([columna for columna, _ in COLUMNAS_EXPORTACION])
+    # La cabecera sale antes de ejecutar la consulta
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for fila in _filas(reservas, chunk_size):
+        escritor.writerow(fila)
+        if buffer.tell() >= TAMANO_BLOQUE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def exportar_ndjson(reservas, chunk_size=None):
+    """Genera un objeto JSON por línea, agrupados en trozos de unos TAMANO_BLOQUE caracteres"""
+    columnas = [columna for columna, _ in COLUMNAS_EXPORTACION]
+    bloque = []
+    tamano = 0
+    for fila in _filas(reservas, chunk_size):
+        linea = json.dumps(dict(zip(columnas, fila)), ensure_ascii=False) + '\n'
+        bloque.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_BLOQUE:
+            yield ''.join(bloque)
+            bloque = []
+            tamano = 0
+    if bloque:
+        yield ''.join(bloque)
+
+
+def _fecha_pdf(valor):
+    return timezone.localtime(valor).strftime('%d/%m/%Y')
+
+
+def _filas_pdf(reservas, chunk_size):
+    chunk_size = chunk_size or getattr(settings, 'EXPORTACION_CHUNK_SIZE', 2000)
+    for (codigo, estado, reserva, inicio, fin, nombre, apellido, cedula,
+         marca, modelo, placa, tipo, total) in reservas.iterator(chunk_size=chunk_size):
+        yield [
+            codigo, estado, _fecha_pdf(reserva), _fecha_pdf(inicio), _fecha_pdf(fin),
+            f'{nombre} {apellido}'[:32], cedula, f'{marca} {modelo}'[:28], placa, tipo, f'{total:,.2f}',
+        ]
+
+
+def exportar_pdf(ruta, fecha_inicio=None, fecha_fin=None, estados=None, chunk_size=None):
+    """
+    Escribe en `ruta` (un archivo ya creado, p. ej. con mkstemp) el detalle de
+    reservas en PDF; devuelve el número de filas. Si el archivo ya no existe
+    lanza FileNotFoundError sin crearlo.
+    """
+    reservas = reservas_exportacion(fecha_inicio, fecha_fin, estados, CAMPOS_PDF)
+    subtitulo = f"Reservas del {fecha_inicio or 'inicio'} al {fecha_fin or 'fin'}"
+    if estados:
+        subtitulo += f" - Estados: {', '.join(estados)}"
+    with medir('DETALLE', 'PDF') as medicion, open(ruta, 'r+b') as archivo:
+        filas = escribir_tabla_pdf(
+            archivo, 'DETALLE DE RESERVAS', subtitulo,
+            [encabezado for encabezado, _ in COLUMNAS_PDF], _filas_pdf(reservas, chunk_size),
+            [ancho * inch for _, ancho in COLUMNAS_PDF],
+        )
+        archivo.truncate()
+        medicion.tamano_pdf = archivo.tell()
+    return filas
+
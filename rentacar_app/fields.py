@@ -0,0 +1,48 @@
+"""Campos de modelo propios"""
+import json
+import zlib
+
+from django.db import models
+
+
+def serializar_json(valor):
+    """JSON compacto en UTF-8, tal como se comprime en JSONComprimidoField"""
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class JSONComprimidoField(models.BinaryField):
+    """
+    Valor JSON guardado comprimido con zlib (bytea / BLOB). En Python se usa
+    igual que un JSONField, pero no admite consultas sobre su contenido.
+    """
+    description = 'JSON comprimido'
+
+    def __init__(self, *args, nivel=6, **kwargs):
+        self.nivel = nivel
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.nivel != 6:
+            kwargs['nivel'] = self.nivel
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return json.loads(zlib.decompress(bytes(value)))
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return json.loads(zlib.decompress(bytes(value)))
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return zlib.compress(serializar_json(value), self.nivel)
+
+    def value_to_string(self, obj):
+        # Como JSONField: los serializadores JSON/YAML (dumpdata) escriben el
+        # valor tal cual y loaddata lo devuelve igual, sin pasar por texto
+        return self.value_from_object(obj)
@@ -3,6 +3,9 @@ from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django.utils import timezone
 from .models import Cliente, Vehiculo, Reserva, Empleado
+from .disponibilidad import vehiculo_disponible, ventanas_libres, vehiculos_alternativos
+
+SUGERENCIAS_DISPONIBILIDAD = 3
 
 class UserForm(UserCreationForm):
     first_name = forms.CharField(max_length=30, required=True)
@@ -59,19 +62,39 @@ class ReservaForm(forms.ModelForm):
                 raise forms.ValidationError("La fecha de fin debe ser posterior a la fecha de inicio")
             
             if vehiculo:
-                reservas_conflictivas = Reserva.objects.filter(
-                    vehiculo=vehiculo,
-                    fecha_inicio__lte=fecha_fin,
-                    fecha_fin__gte=fecha_inicio,
-                    estado__in=['CONFIRMADA', 'ACTIVA', 'PENDIENTE']
-                ).exclude(pk=self.instance.pk if self.instance else None)
+                disponible = vehiculo_disponible(
+                    vehiculo.id, fecha_inicio, fecha_fin,
+                    excluir_id=self.instance.pk if self.instance else None,
+                    verificar_en_bd=True
+                )
                 
-                if reservas_conflictivas.exists():
-                    raise forms.ValidationError(
-                        f"El vehículo no está disponible en las fechas seleccionadas."
-                    )
+                if not disponible:
+                    raise forms.ValidationError(self._mensaje_no_disponible(vehiculo, fecha_inicio, fecha_fin))
         
         return cleaned_data
+    
+    def _mensaje_no_disponible(self, vehiculo, fecha_inicio, fecha_fin):
+        """Mensaje de conflicto con las ventanas libres más cercanas y vehículos similares"""
+        self.ventanas_sugeridas = ventanas_libres(
+            vehiculo.id, fecha_inicio, fecha_fin,
+            k=SUGERENCIAS_DISPONIBILIDAD, excluir_id=self.instance.pk,
+        )
+        self.vehiculos_sugeridos = list(
+            vehiculos_alternativos(vehiculo, fecha_inicio, fecha_fin, k=SUGERENCIAS_DISPONIBILIDAD)
+        )
+        
+        formato = '%d/%m/%Y %H:%M'
+        mensaje = "El vehículo no está disponible en las fechas seleccionadas."
+        if self.ventanas_sugeridas:
+            fechas = ', '.join(
+                f"{timezone.localtime(inicio).strftime(formato)} - {timezone.localtime(fin).strftime(formato)}"
+                for inicio, fin in self.ventanas_sugeridas
+            )
+            mensaje += f" Fechas libres más cercanas: {fechas}."
+        if self.vehiculos_sugeridos:
+            vehiculos = ', '.join(f"{v.marca} {v.modelo} ({v.placa})" for v in self.vehiculos_sugeridos)
+            mensaje += f" Vehículos similares libres en esas fechas: {vehiculos}."
+        return mensaje
 
 class EmpleadoUserForm(UserCreationForm):
     first_name = forms.CharField(max_length=30, required=True)
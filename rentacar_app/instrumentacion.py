@@ -0,0 +1,202 @@
+"""
+Métricas de rendimiento de reportes y contratos.
+
+Cada generar_reporte_* (datos), generar_reporte_pdf y generar_contrato_pdf
+se mide con @medido o con medir(): tiempo total, tiempo en la base de datos,
+número de consultas y filas leídas (con un execute_wrapper sobre la conexión
+del hilo, que además cuenta las filas de fetchone/fetchmany/fetchall) y, para
+los PDF, su tamaño.
+
+Las mediciones se guardan como MetricaReporte solo dentro de
+recolectar_metricas(), que las asocia al Reporte que se estaba generando.
+Fuera de él (benchmarks, shell, pruebas) se miden pero no se guardan, así
+que las funciones de reporte no escriben en la base de datos.
+
+resumen_metricas() da los percentiles por tipo y operación para el panel y
+la API de métricas.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connection
+
+from .models import MetricaReporte
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 95, 99)
+CAMPOS_RESUMEN = ('duracion_ms', 'tiempo_bd_ms', 'consultas', 'filas', 'tamano_pdf')
+
+# Mediciones en curso en este hilo (las anidadas también cuentan en las externas)
+_mediciones = ContextVar('mediciones', default=())
+_recolector = ContextVar('recolector', default=None)
+
+
+class Recolector:
+    """Mediciones tomadas dentro de recolectar_metricas()"""
+
+    def __init__(self, reporte=None):
+        self.reporte = reporte
+        self.metricas = []
+
+
+def _contar_filas(cursor, mediciones):
+    # Los cursores que usa el ORM son de una sola consulta; uno reutilizado ya
+    # cuenta para las mediciones con que se envolvió la primera vez
+    if getattr(cursor, '_filas_contadas', False):
+        return
+    cursor._filas_contadas = True
+    for nombre in ('fetchone', 'fetchmany', 'fetchall'):
+        original = getattr(cursor, nombre)
+
+        def leer(*args, _original=original, _uno=nombre == 'fetchone', **kwargs):
+            inicio = time.perf_counter()
+            filas = _original(*args, **kwargs)
+            duracion = time.perf_counter() - inicio
+            cantidad = (filas is not None) if _uno else len(filas)
+            for medicion in mediciones:
+                medicion.tiempo_bd += duracion
+                medicion.filas += cantidad
+            return filas
+
+        setattr(cursor, nombre, leer)
+
+
+def _envoltorio_consultas(execute, sql, params, many, context):
+    mediciones = _mediciones.get()
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        for medicion in mediciones:
+            medicion.tiempo_bd += duracion
+            medicion.consultas += 1
+        _contar_filas(context['cursor'], mediciones)
+
+
+class Medicion:
+    def __init__(self, tipo, operacion):
+        self.tipo = tipo
+        self.operacion = operacion
+        self.tiempo_bd = 0.0
+        self.consultas = 0
+        self.filas = 0
+        self.tamano_pdf = None
+
+
+@contextmanager
+def medir(tipo, operacion):
+    """
+    Mide el bloque (asignar tamano_pdf a la medición si genera un PDF). Si
+    termina sin errores y hay un recolector activo, le añade la MetricaReporte.
+    """
+    if not getattr(settings, 'INSTRUMENTACION_REPORTES', True):
+        yield Medicion(tipo, operacion)
+        return
+    medicion = Medicion(tipo, operacion)
+    anteriores = _mediciones.get()
+    token = _mediciones.set(anteriores + (medicion,))
+    inicio = time.perf_counter()
+    try:
+        if anteriores:
+            yield medicion
+        else:
+            with connection.execute_wrapper(_envoltorio_consultas):
+                yield medicion
+    finally:
+        _mediciones.reset(token)
+    duracion = time.perf_counter() - inicio
+
+    recolector = _recolector.get()
+    if recolector is not None:
+        recolector.metricas.append(MetricaReporte(
+            tipo=tipo,
+            operacion=operacion,
+            duracion_ms=duracion * 1000,
+            tiempo_bd_ms=medicion.tiempo_bd * 1000,
+            consultas=medicion.consultas,
+            filas=medicion.filas,
+            tamano_pdf=medicion.tamano_pdf,
+        ))
+
+
+def medido(tipo, operacion='DATOS'):
+    """Decorador: mide cada llamada; si devuelve un BytesIO, registra su tamaño como PDF"""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(tipo, operacion) as medicion:
+                resultado = funcion(*args, **kwargs)
+                if isinstance(resultado, BytesIO):
+                    medicion.tamano_pdf = resultado.getbuffer().nbytes
+            return resultado
+        return envoltura
+    return decorador
+
+
+def guardar_metricas(metricas, reporte=None):
+    """Guarda las mediciones (asociadas a `reporte` si se indica); un fallo solo se registra en el log"""
+    if not metricas:
+        return
+    for metrica in metricas:
+        metrica.reporte = reporte
+    try:
+        MetricaReporte.objects.bulk_create(metricas)
+    except Exception:
+        logger.exception('No se pudieron guardar las métricas de reportes')
+
+
+@contextmanager
+def recolectar_metricas(reporte=None, guardar=True):
+    """
+    Recoge las mediciones del bloque y al salir las guarda asociadas a
+    recolector.reporte (se puede asignar dentro del bloque, una vez creado).
+    Con guardar=False quedan en recolector.metricas para guardarlas en otro
+    proceso.
+    """
+    recolector = Recolector(reporte)
+    token = _recolector.set(recolector)
+    try:
+        yield recolector
+    finally:
+        _recolector.reset(token)
+        if guardar:
+            guardar_metricas(recolector.metricas, recolector.reporte)
+
+
+def _percentiles(valores):
+    if not len(valores):
+        return None
+    # NumPy solo hace falta en el panel de métricas, no en cada petición
+    import numpy as np
+    return {f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(valores, PERCENTILES))}
+
+
+def resumen_metricas(desde=None):
+    """
+    Percentiles de cada campo de CAMPOS_RESUMEN por (tipo, operación), con
+    las mediciones desde la fecha `desde` (todas si es None).
+    """
+    metricas = MetricaReporte.objects.order_by()
+    if desde is not None:
+        metricas = metricas.filter(fecha__gte=desde)
+    grupos = {}
+    for fila in metricas.values_list('tipo', 'operacion', *CAMPOS_RESUMEN).iterator(chunk_size=5000):
+        columnas = grupos.setdefault(fila[:2], [[] for _ in CAMPOS_RESUMEN])
+        for columna, valor in zip(columnas, fila[2:]):
+            if valor is not None:
+                columna.append(valor)
+
+    resumen = []
+    for (tipo, operacion), columnas in sorted(grupos.items()):
+        item = {'tipo': tipo, 'operacion': operacion, 'muestras': len(columnas[0])}
+        for campo, valores in zip(CAMPOS_RESUMEN, columnas):
+            item[campo] = _percentiles(valores)
+        resumen.append(item)
+    return resumen
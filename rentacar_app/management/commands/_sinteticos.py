@@ -0,0 +1,93 @@
+"""Datos sintéticos compartidos por los comandos de benchmark"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from rentacar_app.models import Cliente, Vehiculo, Reserva
+
+TIPOS = [codigo for codigo, _ in Vehiculo.TIPOS_VEHICULO]
+ESTADOS_RESERVA = ['PENDIENTE', 'CONFIRMADA', 'ACTIVA', 'COMPLETADA', 'CANCELADA']
+
+
+def crear_clientes(cantidad, prefijo='bench'):
+    usuarios = User.objects.bulk_create([
+        User(username=f'{prefijo}_{i}', first_name='Cliente', last_name=str(i))
+        for i in range(cantidad)
+    ], batch_size=2000)
+    if usuarios and usuarios[0].pk is None:
+        usuarios = list(User.objects.filter(username__startswith=f'{prefijo}_'))
+    vencimiento = timezone.localdate() + timedelta(days=365)
+    return Cliente.objects.bulk_create([
+        Cliente(
+            usuario=usuario,
+            cedula_identidad=f'{prefijo[:3]}{i}',
+            telefono='70000000',
+            direccion='Santa Cruz',
+            licencia_conducir=f'L{i}',
+            fecha_vencimiento_licencia=vencimiento,
+        )
+        for i, usuario in enumerate(usuarios)
+    ], batch_size=2000)
+
+
+def crear_flota(cantidad, prefijo='B'):
+    return Vehiculo.objects.bulk_create([
+        Vehiculo(
+            placa=f'{prefijo}{i:06d}',
+            marca='Marca',
+            modelo=f'Modelo {i % 50}',
+            año=2015 + i % 10,
+            tipo=TIPOS[i % len(TIPOS)],
+            capacidad_pasajeros=2 + i % 7,
+            precio_dia=Decimal(150 + (i % 20) * 25),
+            estado='DISPONIBLE',
+        )
+        for i in range(cantidad)
+    ], batch_size=2000)
+
+
+def crear_reservas(vehiculos, clientes, cantidad, dias_rango=730, semilla=42, prefijo='Z'):
+    """
+    Reservas aleatorias alrededor de hoy. Cada vehículo recibe una agenda
+    consecutiva sin solapamientos (lo exige la restricción
+    reserva_sin_solapamiento), así que el rango real crece con la densidad.
+    """
+    rnd = random.Random(semilla)
+    por_vehiculo = -(-cantidad // len(vehiculos))
+    lote = []
+    creadas = 0
+    for vehiculo in vehiculos:
+        inicio = timezone.now() - timedelta(days=dias_rango // 2, hours=rnd.randrange(24 * 7))
+        for _ in range(por_vehiculo):
+            if creadas + len(lote) == cantidad:
+                break
+            inicio += timedelta(hours=rnd.randint(1, 48))
+            dias = rnd.randint(1, 6)
+            fin = inicio + timedelta(days=dias)
+            lote.append(Reserva(
+                cliente=rnd.choice(clientes),
+                vehiculo=vehiculo,
+                fecha_inicio=inicio,
+                fecha_fin=fin,
+                estado=rnd.choice(ESTADOS_RESERVA),
+                precio_total=vehiculo.precio_dia * dias,
+                codigo_reserva=f'{prefijo}{creadas + len(lote):08d}',
+            ))
+            inicio = fin
+            if len(lote) == 5000:
+                Reserva.objects.bulk_create(lote)
+                creadas += len(lote)
+                lote = []
+    if lote:
+        Reserva.objects.bulk_create(lote)
+        creadas += len(lote)
+    return creadas
+
+
+def rango_aleatorio(rnd, dias_rango=730):
+    base = timezone.now() - timedelta(days=dias_rango // 2)
+    inicio = base + timedelta(hours=rnd.randrange(dias_rango * 24))
+    return inicio, inicio + timedelta(days=rnd.randint(1, 7))
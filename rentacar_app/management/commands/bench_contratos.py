@@ -0,0 +1,128 @@
+import time
+from datetime import datetime
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+
+from rentacar_app.models import Reserva
+from rentacar_app.utils import datos_contrato, generar_contrato_pdf
+from ._sinteticos import crear_clientes, crear_flota, crear_reservas
+
+
+def contrato_sin_plantilla(datos, emision):
+    """El contrato como se generaba antes: estilos y párrafos nuevos en cada llamada"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    styles = getSampleStyleSheet()
+    story = []
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=16, spaceAfter=30,
+                                 alignment=1, textColor=colors.HexColor('#2c3e50'))
+    story.append(Paragraph("CONTRATO DE ALQUILER DE VEHÍCULO", title_style))
+    empresa_style = ParagraphStyle('Empresa', parent=styles['Normal'], fontSize=12, spaceAfter=12, alignment=1)
+    story.append(Paragraph(
+        "<b>RENTACAR</b><br/>Calle Raúl Otero Reich y Vía Puerto Suárez<br/>Teléfono: +591-XXX-XXXX", empresa_style
+    ))
+    story.append(Spacer(1, 20))
+    info_style = ParagraphStyle('Info', parent=styles['Normal'], fontSize=10, spaceAfter=6)
+    story.append(Paragraph(f"<b>Número de Contrato:</b> {datos['codigo_reserva']}", info_style))
+    story.append(Paragraph(f"<b>Fecha de Emisión:</b> {emision.strftime('%d/%m/%Y %H:%M')}", info_style))
+    story.append(Spacer(1, 15))
+    story.append(Paragraph("<b>DATOS DEL CLIENTE</b>", styles['Heading2']))
+    story.append(Paragraph(f"<b>Nombre Completo:</b> {datos['cliente_nombre']}", info_style))
+    story.append(Paragraph(f"<b>Cédula de Identidad:</b> {datos['cliente_cedula']}", info_style))
+    story.append(Paragraph(f"<b>Licencia de Conducir:</b> {datos['cliente_licencia']}", info_style))
+    story.append(Paragraph(f"<b>Teléfono:</b> {datos['cliente_telefono']}", info_style))
+    story.append(Paragraph(f"<b>Dirección:</b> {datos['cliente_direccion']}", info_style))
+    story.append(Spacer(1, 15))
+    story.append(Paragraph("<b>DATOS DEL VEHÍCULO</b>", styles['Heading2']))
+    story.append(Paragraph(f"<b>Vehículo:</b> {datos['vehiculo']}", info_style))
+    story.append(Paragraph(f"<b>Placa:</b> {datos['vehiculo_placa']}", info_style))
+    story.append(Paragraph(f"<b>Año:</b> {datos['vehiculo_año']}", info_style))
+    story.append(Paragraph(f"<b>Tipo:</b> {datos['vehiculo_tipo']}", info_style))
+    story.append(Paragraph(f"<b>Capacidad:</b> {datos['vehiculo_capacidad']} pasajeros", info_style))
+    story.append(Spacer(1, 15))
+    story.append(Paragraph("<b>TÉRMINOS DEL ALQUILER</b>", styles['Heading2']))
+    story.append(Paragraph(f"<b>Fecha de Inicio:</b> {datos['fecha_inicio']}", info_style))
+    story.append(Paragraph(f"<b>Fecha de Fin:</b> {datos['fecha_fin']}", info_style))
+    story.append(Paragraph(f"<b>Duración:</b> {datos['dias']} días", info_style))
+    story.append(Paragraph(f"<b>Precio por Día:</b> Bs. {datos['precio_dia']}", info_style))
+    story.append(Paragraph(f"<b>Precio Total:</b> Bs. {datos['precio_total']}", info_style))
+    story.append(Spacer(1, 15))
+    story.append(Paragraph("<b>TÉRMINOS Y CONDICIONES</b>", styles['Heading2']))
+    for termino in datos['terminos']:
+        story.append(Paragraph(termino, info_style))
+    story.append(Spacer(1, 30))
+    firmas_table = Table([
+        ['', ''],
+        ['_________________________', '_________________________'],
+        ['Firma del Cliente', 'Firma del Representante RentaCar'],
+        [datos['cliente_nombre'], 'RentaCar'],
+        [f"CI: {datos['cliente_cedula']}", f'Fecha: {emision.strftime("%d/%m/%Y")}']
+    ], colWidths=[3*inch, 3*inch])
+    firmas_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+    story.append(firmas_table)
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+
+class Command(BaseCommand):
+    help = 'Contratos por segundo con la plantilla precompilada frente a la generación completa anterior'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contratos', type=int, default=300)
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clientes = crear_clientes(50)
+            vehiculos = crear_flota(20)
+            crear_reservas(vehiculos, clientes, options['contratos'])
+            reservas = Reserva.objects.select_related('cliente__usuario', 'vehiculo')[:options['contratos']]
+            contratos = [datos_contrato(reserva) for reserva in reservas]
+            transaction.set_rollback(True)
+        emision = datetime.now()
+
+        # Misma salida byte a byte (invariant fija las fechas e IDs del documento)
+        invariant = rl_config.invariant
+        rl_config.invariant = 1
+        try:
+            diferentes = sum(
+                generar_contrato_pdf(None, datos, emision).getvalue() != contrato_sin_plantilla(datos, emision).getvalue()
+                for datos in contratos[:20]
+            )
+        finally:
+            rl_config.invariant = invariant
+        estilo = self.style.SUCCESS if not diferentes else self.style.WARNING
+        self.stdout.write(estilo(f'PDF distintos entre ambas versiones: {diferentes} de {min(20, len(contratos))}'))
+
+        resultados = {}
+        for nombre, funcion in (
+            ('sin plantilla', lambda datos: contrato_sin_plantilla(datos, emision)),
+            ('precompilado', lambda datos: generar_contrato_pdf(None, datos, emision)),
+        ):
+            funcion(contratos[0])
+            mejor = None
+            for _ in range(options['repeticiones']):
+                inicio = time.perf_counter()
+                for datos in contratos:
+                    funcion(datos)
+                duracion = time.perf_counter() - inicio
+                mejor = duracion if mejor is None else min(mejor, duracion)
+            resultados[nombre] = len(contratos) / mejor
+            self.stdout.write(
+                f'{nombre:>14}: {resultados[nombre]:.0f} contratos/s  ({mejor / len(contratos) * 1000:.2f} ms por contrato)'
+            )
+        self.stdout.write(f"Mejora: {resultados['precompilado'] / resultados['sin plantilla']:.2f}x")
@@ -0,0 +1,73 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from rentacar_app.models import Reserva
+from rentacar_app.precios import cotizar
+from rentacar_app.reservas import crear_reservas_en_lote
+from ._sinteticos import crear_clientes, crear_flota
+
+
+def guardar_como_antes(reserva):
+    """Reproduce el save() anterior: lectura del vehículo, INSERT y UPDATE del código"""
+    reserva.precio_total = cotizar(
+        reserva.vehiculo.precio_dia, reserva.vehiculo.tipo, reserva.fecha_inicio, reserva.fecha_fin
+    )
+    models.Model.save(reserva)
+    reserva.codigo_reserva = f"R{reserva.id:06d}"
+    models.Model.save(reserva, update_fields=['codigo_reserva'])
+
+
+class Command(BaseCommand):
+    help = 'Compara el save() anterior de Reserva con el de una escritura y con crear_reservas_en_lote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservas', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._ejecutar(options['reservas'])
+            transaction.set_rollback(True)
+
+    def _ejecutar(self, cantidad):
+        clientes = crear_clientes(10)
+        vehiculos = crear_flota(100)
+        cursor_fechas = {'siguiente': timezone.now() + timedelta(days=1)}
+
+        def nuevas():
+            # Cada lote usa fechas posteriores a las del anterior para no solaparse
+            base = cursor_fechas['siguiente']
+            reservas = []
+            for i in range(cantidad):
+                inicio = base + timedelta(days=3 * (i // len(vehiculos)))
+                reservas.append(Reserva(
+                    cliente_id=clientes[i % len(clientes)].pk,
+                    vehiculo_id=vehiculos[i % len(vehiculos)].pk,
+                    fecha_inicio=inicio,
+                    fecha_fin=inicio + timedelta(days=2),
+                ))
+            cursor_fechas['siguiente'] = base + timedelta(days=3 * (cantidad // len(vehiculos) + 1))
+            return reservas
+
+        casos = [
+            ('save() anterior', lambda rs: [guardar_como_antes(r) for r in rs]),
+            ('save() actual', lambda rs: [r.save() for r in rs]),
+            ('crear_reservas_en_lote', crear_reservas_en_lote),
+        ]
+        for nombre, funcion in casos:
+            reservas = nuevas()
+            consultas = []
+            # execute_wrapper en lugar de CaptureQueriesContext: el registro de
+            # consultas de Django se corta a las 9000 entradas
+            with connection.execute_wrapper(lambda execute, sql, *a: consultas.append(sql) or execute(sql, *a)):
+                inicio = time.perf_counter()
+                funcion(reservas)
+                duracion = time.perf_counter() - inicio
+            sin_codigo = sum(1 for r in reservas if not r.codigo_reserva)
+            self.stdout.write(
+                f'{nombre:24} {cantidad / duracion:9.0f} reservas/s  '
+                f'{len(consultas) / cantidad:6.3f} consultas/reserva  sin código: {sin_codigo}'
+            )
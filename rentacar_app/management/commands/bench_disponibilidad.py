@@ -0,0 +1,77 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rentacar_app.disponibilidad import IndiceDisponibilidad, hay_conflicto_en_bd, ESTADOS_ACTIVOS
+from rentacar_app.models import Reserva, Vehiculo
+from ._sinteticos import crear_clientes, crear_flota, crear_reservas, rango_aleatorio
+
+
+class Command(BaseCommand):
+    help = 'Compara el índice de disponibilidad en memoria con la consulta ORM (los datos se descartan al final)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehiculos', type=int, default=1000)
+        parser.add_argument('--reservas', type=int, default=200000)
+        parser.add_argument('--consultas', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._ejecutar(options)
+            transaction.set_rollback(True)
+
+    def _ejecutar(self, options):
+        self.stdout.write('Generando datos sintéticos...')
+        clientes = crear_clientes(50)
+        vehiculos = crear_flota(options['vehiculos'])
+        crear_reservas(vehiculos, clientes, options['reservas'])
+        ids = [v.id for v in vehiculos]
+
+        # Índice en memoria
+        indice = IndiceDisponibilidad()
+        inicio = time.perf_counter()
+        indice.reconstruir()
+        t_construccion = time.perf_counter() - inicio
+
+        # Solo rangos que cubre el índice (desde el mes en curso)
+        rnd = random.Random(7)
+        consultas = []
+        while len(consultas) < options['consultas']:
+            a, b = rango_aleatorio(rnd)
+            if indice.cubre(a):
+                consultas.append((rnd.choice(ids), a, b))
+
+        # Camino ORM actual
+        inicio = time.perf_counter()
+        libres_orm = [not hay_conflicto_en_bd(v, a, b) for v, a, b in consultas]
+        t_orm = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        flota_orm = []
+        for _, a, b in consultas[:50]:
+            ocupados = Reserva.objects.filter(
+                fecha_inicio__lte=b, fecha_fin__gte=a, estado__in=ESTADOS_ACTIVOS
+            ).values_list('vehiculo_id', flat=True)
+            flota_orm.append(set(Vehiculo.objects.exclude(id__in=ocupados).values_list('id', flat=True)))
+        t_flota_orm = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        libres_indice = [indice.esta_disponible(v, a, b) for v, a, b in consultas]
+        t_indice = time.perf_counter() - inicio
+
+        todos = set(Vehiculo.objects.values_list('id', flat=True))
+        inicio = time.perf_counter()
+        flota_indice = [todos - indice.vehiculos_ocupados(a, b) for _, a, b in consultas[:50]]
+        t_flota_indice = time.perf_counter() - inicio
+
+        if libres_orm != libres_indice or flota_orm != flota_indice:
+            self.stderr.write(self.style.ERROR('El índice y la consulta ORM no coinciden'))
+
+        n = len(consultas)
+        self.stdout.write(f'Construcción del índice: {t_construccion * 1000:.1f} ms')
+        self.stdout.write(f'¿Vehículo libre? ORM:    {t_orm / n * 1e6:10.1f} µs/consulta')
+        self.stdout.write(f'¿Vehículo libre? índice: {t_indice / n * 1e6:10.1f} µs/consulta')
+        self.stdout.write(f'Flota libre ORM:         {t_flota_orm / 50 * 1000:10.2f} ms/consulta')
+        self.stdout.write(f'Flota libre índice:      {t_flota_indice / 50 * 1000:10.2f} ms/consulta')
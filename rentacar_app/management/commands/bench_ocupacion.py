@@ -0,0 +1,47 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rentacar_app.ocupacion import calcular_ocupacion
+from ._sinteticos import crear_clientes, crear_flota, crear_reservas
+
+
+class Command(BaseCommand):
+    help = 'Mide calcular_ocupacion sobre una flota y un historial de reservas sintéticos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehiculos', type=int, default=500)
+        parser.add_argument('--reservas', type=int, default=200000)
+        parser.add_argument('--dias', type=int, default=1095, help='Rango (en días) en el que caen las reservas')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._ejecutar(options)
+            transaction.set_rollback(True)
+
+    def _ejecutar(self, options):
+        clientes = crear_clientes(20)
+        vehiculos = crear_flota(options['vehiculos'])
+        creadas = crear_reservas(vehiculos, clientes, options['reservas'], dias_rango=options['dias'])
+        self.stdout.write(f'{creadas} reservas sobre {len(vehiculos)} vehículos')
+
+        inicio = time.perf_counter()
+        ocupacion = calcular_ocupacion()
+        duracion = time.perf_counter() - inicio
+
+        # Segunda pasada solo para medir memoria: tracemalloc ralentiza la primera
+        tracemalloc.start()
+        calcular_ocupacion()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(
+            f'Periodo {ocupacion["periodo_inicio"]} a {ocupacion["periodo_fin"]}: '
+            f'{len(ocupacion["por_semana"])} semanas, ocupación {ocupacion["tasa"]}%'
+        )
+        self.stdout.write(
+            f'calcular_ocupacion: {duracion:.2f} s  ({creadas / duracion:.0f} reservas/s)  '
+            f'pico de memoria: {pico / 1024 / 1024:.1f} MiB'
+        )
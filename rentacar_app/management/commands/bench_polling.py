@@ -0,0 +1,88 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rentacar_app import views
+from rentacar_app.models import Reserva
+from rentacar_app.reservas import guardar_reserva_atomica, ReservaNoDisponible
+from ._sinteticos import crear_clientes, crear_flota, crear_reservas
+
+
+class Command(BaseCommand):
+    help = 'Simula kioscos consultando la disponibilidad con y sin ETag y cuenta las consultas a la BD'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kioscos', type=int, default=20)
+        parser.add_argument('--sondeos', type=int, default=50, help='Sondeos por kiosco')
+        parser.add_argument('--cambios-cada', type=int, default=100,
+                            help='Se crea una reserva cada N sondeos en total')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._ejecutar(options)
+            transaction.set_rollback(True)
+
+    def _ejecutar(self, options):
+        clientes = crear_clientes(10)
+        vehiculos = crear_flota(200)
+        crear_reservas(vehiculos, clientes, 5000)
+        usuario = User.objects.create_user('bench_kiosco')
+
+        hoy = timezone.localdate()
+        url = f'/api/disponibilidad/?fecha_inicio={hoy}&fecha_fin={hoy + timedelta(days=3)}'
+        vistas = [
+            ('api_disponibilidad', views.api_disponibilidad, url),
+            ('disponibilidad_vehiculos', views.disponibilidad_vehiculos, url.replace('/api', '/vehiculos')),
+        ]
+
+        for nombre, vista, ruta in vistas:
+            for condicional in (False, True):
+                total, a_reservas, no_modificadas = self._simular(
+                    vista, ruta, usuario, clientes, vehiculos, condicional, options
+                )
+                modo = 'con ETag' if condicional else 'sin ETag'
+                self.stdout.write(
+                    f'{nombre:26} {modo:9} consultas={total:6}  a reservas={a_reservas:6}  304={no_modificadas}'
+                )
+
+    def _simular(self, vista, ruta, usuario, clientes, vehiculos, condicional, options):
+        factory = RequestFactory()
+        rnd = random.Random(1)
+        etags = {}
+        no_modificadas = 0
+        sondeo = 0
+
+        with CaptureQueriesContext(connection) as consultas:
+            for _ in range(options['sondeos']):
+                for kiosco in range(options['kioscos']):
+                    sondeo += 1
+                    if sondeo % options['cambios_cada'] == 0:
+                        inicio = timezone.now() + timedelta(days=rnd.randint(0, 30))
+                        try:
+                            guardar_reserva_atomica(Reserva(
+                                cliente=rnd.choice(clientes), vehiculo=rnd.choice(vehiculos),
+                                fecha_inicio=inicio, fecha_fin=inicio + timedelta(days=2),
+                            ))
+                        except ReservaNoDisponible:
+                            pass
+
+                    cabeceras = {}
+                    if condicional and kiosco in etags:
+                        cabeceras['HTTP_IF_NONE_MATCH'] = etags[kiosco]
+                    request = factory.get(ruta, **cabeceras)
+                    request.user = usuario
+                    respuesta = vista(request)
+                    if respuesta.status_code == 304:
+                        no_modificadas += 1
+                    if respuesta.has_header('ETag'):
+                        etags[kiosco] = respuesta['ETag']
+
+        sql = [q['sql'] for q in consultas.captured_queries if not q['sql'].startswith(('INSERT', 'UPDATE', 'SAVEPOINT', 'RELEASE'))]
+        a_reservas = sum(1 for q in sql if 'rentacar_app_reserva' in q)
+        return len(sql), a_reservas, no_modificadas
@@ -0,0 +1,134 @@
+import time
+from datetime import datetime, time as hora, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from rentacar_app.analitica import generar_reporte_tendencias, instantanea_reservas, leer_columnas
+from rentacar_app.models import Reserva
+from rentacar_app.resumen import ESTADOS_INGRESO
+from ._sinteticos import crear_clientes, crear_flota, crear_reservas
+
+
+def tendencias_orm(fecha_inicio, fecha_fin):
+    """Los mismos cortes del reporte de tendencias con agrupaciones del ORM"""
+    reservas = Reserva.objects.filter(
+        fecha_inicio__gte=timezone.make_aware(datetime.combine(fecha_inicio, hora.min)),
+        fecha_inicio__lt=timezone.make_aware(datetime.combine(fecha_fin + timedelta(days=1), hora.min)),
+    ).order_by()
+    no_cancelada = ~Q(estado='CANCELADA')
+    ingresos_semana_tipo = list(
+        reservas.filter(estado__in=ESTADOS_INGRESO).annotate(semana=TruncWeek('fecha_inicio'))
+        .values('semana', 'vehiculo__tipo').annotate(total=Sum('precio_total'))
+    )
+    por_semana = list(
+        reservas.annotate(semana=TruncWeek('fecha_inicio')).values('semana').annotate(
+            reservas=Count('id'), canceladas=Count('id', filter=Q(estado='CANCELADA')),
+        )
+    )
+    por_tipo = list(reservas.values('vehiculo__tipo').annotate(
+        reservas=Count('id'),
+        canceladas=Count('id', filter=Q(estado='CANCELADA')),
+        ingresos=Sum('precio_total', filter=Q(estado__in=ESTADOS_INGRESO)),
+        duracion=Avg(ExpressionWrapper(F('fecha_fin') - F('fecha_inicio'), output_field=DurationField()),
+                     filter=no_cancelada),
+        anticipacion=Avg(ExpressionWrapper(F('fecha_inicio') - F('fecha_reserva'), output_field=DurationField()),
+                         filter=no_cancelada),
+    ))
+    return ingresos_semana_tipo, por_semana, por_tipo
+
+
+class Command(BaseCommand):
+    help = 'Compara el reporte de tendencias (instantánea NumPy) con las agrupaciones equivalentes del ORM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehiculos', type=int, default=500)
+        parser.add_argument('--reservas', type=int, default=200000)
+        parser.add_argument('--cambios', type=int, default=1000,
+                            help='Reservas nuevas y modificadas antes de medir el refresco incremental')
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._ejecutar(options)
+            transaction.set_rollback(True)
+
+    def _medir(self, funcion, repeticiones):
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return resultado, mejor
+
+    def _ejecutar(self, options):
+        clientes = crear_clientes(20)
+        vehiculos = crear_flota(options['vehiculos'])
+        creadas = crear_reservas(vehiculos, clientes, options['reservas'])
+        self.stdout.write(f'{creadas} reservas sobre {len(vehiculos)} vehículos')
+        # Historial antiguo: si no, todo cae dentro de ANALITICA_MARGEN_SEGUNDOS
+        # y cada refresco lo volvería a leer
+        Reserva.objects.update(fecha_actualizacion=timezone.now() - timedelta(days=1))
+
+        instantanea_reservas.invalidar()
+        inicio = time.perf_counter()
+        columnas = instantanea_reservas.actualizar()
+        carga = time.perf_counter() - inicio
+        memoria = sum(columna.nbytes for columna in columnas.values())
+        self.stdout.write(
+            f'Carga completa de la instantánea: {carga:.2f} s  ({memoria / 1024 / 1024:.1f} MiB en columnas)'
+        )
+
+        datos, vectorizado = self._medir(generar_reporte_tendencias, options['repeticiones'])
+        fecha_inicio, fecha_fin = (datetime.strptime(f, '%Y-%m-%d').date() for f in datos['periodo'].split(' a '))
+        (ingresos_orm, semanas_orm, tipos_orm), orm = self._medir(
+            lambda: tendencias_orm(fecha_inicio, fecha_fin), options['repeticiones']
+        )
+        self.stdout.write(
+            f'Reporte ({len(datos["ingresos_por_semana"])} semanas x {len(datos["tipos"])} tipos): '
+            f'NumPy {vectorizado * 1000:.1f} ms (refresco incluido)  ORM {orm * 1000:.1f} ms  '
+            f'({orm / vectorizado:.1f}x)'
+        )
+
+        # Los dos caminos deben dar los mismos números
+        tipos = datos['tipos']
+        por_semana = {item['inicio']: item for item in datos['ingresos_por_semana']}
+        diferencias = 0
+        for fila in ingresos_orm:
+            semana = por_semana[timezone.localtime(fila['semana']).date().isoformat()]
+            if abs(semana['ingresos'][tipos.index(fila['vehiculo__tipo'])] - float(fila['total'])) > 0.005:
+                diferencias += 1
+        for fila in semanas_orm:
+            semana = por_semana[timezone.localtime(fila['semana']).date().isoformat()]
+            if (semana['reservas'], semana['canceladas']) != (fila['reservas'], fila['canceladas']):
+                diferencias += 1
+        por_tipo = {item['tipo']: item for item in datos['por_tipo']}
+        for fila in tipos_orm:
+            item = por_tipo[fila['vehiculo__tipo']]
+            if (item['reservas'], item['canceladas']) != (fila['reservas'], fila['canceladas']):
+                diferencias += 1
+            if abs(item['ingresos'] - float(fila['ingresos'] or 0)) > 0.005:
+                diferencias += 1
+        estilo = self.style.SUCCESS if not diferencias else self.style.ERROR
+        self.stdout.write(estilo(f'Diferencias entre NumPy y ORM: {diferencias}'))
+
+        # Refresco incremental: altas nuevas más modificaciones de estado
+        cambios = options['cambios']
+        crear_reservas(crear_flota(max(1, cambios // 20), prefijo='N'), clientes, cambios, prefijo='N')
+        modificadas = list(Reserva.objects.order_by('?').values_list('pk', flat=True)[:cambios])
+        Reserva.objects.filter(pk__in=modificadas).update(estado='CANCELADA', fecha_actualizacion=timezone.now())
+        inicio = time.perf_counter()
+        columnas = instantanea_reservas.actualizar()
+        incremental = time.perf_counter() - inicio
+        self.stdout.write(
+            f'Refresco incremental ({cambios} altas, {len(modificadas)} modificadas): {incremental * 1000:.1f} ms  '
+            f'-> {len(columnas["id"])} reservas en la instantánea'
+        )
+        completa = leer_columnas(Reserva.objects.all())
+        iguales = all((columnas[nombre] == completa[nombre]).all() for nombre in completa)
+        estilo = self.style.SUCCESS if iguales else self.style.ERROR
+        self.stdout.write(estilo(f'Instantánea refrescada igual a una carga completa: {"sí" if iguales else "no"}'))
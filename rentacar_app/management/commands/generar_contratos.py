@@ -0,0 +1,40 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rentacar_app.contratos import FORMATOS_LOTE_CONTRATOS, generar_lote_contratos
+
+
+class Command(BaseCommand):
+    help = 'Genera en un ZIP o en un único PDF los contratos de un rango de fechas de inicio o de una lista de códigos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día de inicio (AAAA-MM-DD)')
+        parser.add_argument('--hasta', help='Último día de inicio (AAAA-MM-DD)')
+        parser.add_argument('--codigos', nargs='+', default=[], help='Códigos de reserva')
+        parser.add_argument('--formato', choices=list(FORMATOS_LOTE_CONTRATOS), default='zip')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto, el nombre generado en el directorio actual)')
+        parser.add_argument('--procesos', type=int, default=None,
+                            help='Procesos que generan los PDF (por defecto, uno por núcleo)')
+
+    def handle(self, *args, **options):
+        # El pool se crea en el primer uso, con este tamaño
+        settings.REPORTES_PROCESOS = options['procesos'] if options['procesos'] is not None else os.cpu_count() or 1
+        inicio = time.perf_counter()
+        try:
+            contenido, filename, cantidad = generar_lote_contratos(
+                options['desde'], options['hasta'], options['codigos'], options['formato']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        duracion = time.perf_counter() - inicio
+
+        salida = options['salida'] or filename
+        with open(salida, 'wb') as archivo:
+            archivo.write(contenido)
+        self.stdout.write(self.style.SUCCESS(
+            f'{cantidad} contratos en {salida} ({len(contenido) / 1024:.0f} KiB) en {duracion:.2f} s '
+            f'({cantidad / duracion:.0f} contratos/s con {settings.REPORTES_PROCESOS} procesos)'
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rentacar_app.tareas import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Genera los reportes encolados en segundo plano (PENDIENTE) y guarda sus PDF'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--maximo', type=int, default=None,
+                            help='Número máximo de reportes a procesar')
+        parser.add_argument('--continuo', action='store_true',
+                            help='No terminar al vaciar la cola; volver a consultarla periódicamente')
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos entre consultas en modo continuo')
+
+    def handle(self, *args, **options):
+        while True:
+            inicio = time.perf_counter()
+            procesados = procesar_pendientes(options['maximo'])
+            if procesados:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{procesados} reportes generados en {time.perf_counter() - inicio:.2f} s'
+                ))
+            if not options['continuo']:
+                if not procesados:
+                    self.stdout.write('No hay reportes pendientes')
+                return
+            time.sleep(options['intervalo'])
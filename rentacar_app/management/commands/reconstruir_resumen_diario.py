@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rentacar_app.resumen import reconstruir_resumen
+
+
+class Command(BaseCommand):
+    help = 'Recalcula la tabla ResumenDiario a partir de todas las reservas'
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        filas = reconstruir_resumen()
+        self.stdout.write(self.style.SUCCESS(
+            f'Resumen diario reconstruido: {filas} filas en {time.perf_counter() - inicio:.2f} s'
+        ))
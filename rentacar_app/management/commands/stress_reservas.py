@@ -0,0 +1,93 @@
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, OperationalError
+from django.utils import timezone
+
+from rentacar_app.models import Cliente, Vehiculo, Reserva
+from rentacar_app.reservas import contar_solapamientos, guardar_reserva_atomica, ReservaNoDisponible
+from ._sinteticos import crear_clientes, crear_flota
+
+PREFIJO = 'STRS'
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el rendimiento de reservas solapadas desde varios hilos contra la base de datos '
+        'configurada, comprueba que no haya dobles reservas y elimina los datos al terminar '
+        '(la prueba de que no hay dobles reservas está en los tests: ReservasConcurrentesTests)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=16)
+        parser.add_argument('--intentos', type=int, default=3000, help='Intentos de reserva en total')
+        parser.add_argument('--vehiculos', type=int, default=20)
+        parser.add_argument('--dias', type=int, default=60, help='Ventana en la que caen las reservas')
+
+    def handle(self, *args, **options):
+        if Vehiculo.objects.filter(placa__startswith=PREFIJO).exists():
+            raise CommandError(f'Quedan datos de una ejecución anterior (placas {PREFIJO}*)')
+
+        clientes = crear_clientes(5, prefijo='strs')
+        vehiculos = crear_flota(options['vehiculos'], prefijo=PREFIJO)
+        try:
+            self._ejecutar(options, [c.pk for c in clientes], [v.pk for v in vehiculos])
+        finally:
+            Vehiculo.objects.filter(placa__startswith=PREFIJO).delete()
+            for cliente in Cliente.objects.filter(pk__in=[c.pk for c in clientes]).select_related('usuario'):
+                cliente.usuario.delete()
+
+    def _ejecutar(self, options, clientes, vehiculos):
+        contadores = {'creadas': 0, 'rechazadas': 0, 'bloqueos': 0}
+        lock = threading.Lock()
+        base = timezone.now() + timedelta(days=1)
+        por_hilo = options['intentos'] // options['hilos']
+
+        def trabajador(semilla):
+            rnd = random.Random(semilla)
+            try:
+                for _ in range(por_hilo):
+                    inicio = base + timedelta(hours=rnd.randrange(options['dias'] * 24))
+                    reserva = Reserva(
+                        cliente_id=rnd.choice(clientes),
+                        vehiculo_id=rnd.choice(vehiculos),
+                        fecha_inicio=inicio,
+                        fecha_fin=inicio + timedelta(days=rnd.randint(1, 5)),
+                        estado='CONFIRMADA',
+                    )
+                    try:
+                        guardar_reserva_atomica(reserva)
+                        resultado = 'creadas'
+                    except ReservaNoDisponible:
+                        resultado = 'rechazadas'
+                    except OperationalError:
+                        # SQLite: tiempo de espera del bloqueo de escritura agotado
+                        resultado = 'bloqueos'
+                    with lock:
+                        contadores[resultado] += 1
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(options['hilos'])]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        dobles = contar_solapamientos(vehiculos)
+        intentos = por_hilo * options['hilos']
+        self.stdout.write(f'Motor: {connection.vendor}  hilos: {options["hilos"]}  intentos: {intentos}')
+        self.stdout.write(
+            f'Creadas: {contadores["creadas"]}  rechazadas: {contadores["rechazadas"]}  '
+            f'bloqueos agotados: {contadores["bloqueos"]}'
+        )
+        self.stdout.write(f'Duración: {duracion:.2f} s  ({intentos / duracion:.0f} intentos/s, '
+                          f'{contadores["creadas"] / duracion:.0f} reservas/s)')
+        if dobles:
+            raise CommandError(f'{dobles} pares de reservas solapadas')
+        self.stdout.write(self.style.SUCCESS('Sin dobles reservas'))
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0002_empleado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Contador de Versión',
+                'verbose_name_plural': 'Contadores de Versión',
+            },
+        ),
+    ]
@@ -0,0 +1,129 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+ESTADOS_ACTIVOS = "('PENDIENTE', 'CONFIRMADA', 'ACTIVA')"
+
+# La restricción necesita btree_gist (igualdad sobre vehiculo_id en un índice
+# gist). Si la extensión no está instalada y el usuario no puede crearla
+# (superusuario, o extensión de confianza con permiso CREATE en la base), la
+# migración no crea la restricción: las reservas siguen protegidas por el
+# SELECT ... FOR UPDATE y la comprobación de reservas.py
+POSTGRESQL_BTREE_GIST = """
+    SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'btree_gist')
+        OR EXISTS (
+            SELECT 1 FROM pg_available_extension_versions
+            WHERE name = 'btree_gist' AND (
+                (SELECT rolsuper FROM pg_roles WHERE rolname = current_user)
+                OR (trusted AND has_database_privilege(current_database(), 'CREATE'))
+            )
+        )
+"""
+POSTGRESQL_CREAR = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    f"""
+    ALTER TABLE rentacar_app_reserva ADD CONSTRAINT reserva_sin_solapamiento
+    EXCLUDE USING gist (vehiculo_id WITH =, tstzrange(fecha_inicio, fecha_fin, '[]') WITH &&)
+    WHERE (estado IN {ESTADOS_ACTIVOS})
+    """,
+]
+POSTGRESQL_BORRAR = [
+    "ALTER TABLE rentacar_app_reserva DROP CONSTRAINT IF EXISTS reserva_sin_solapamiento",
+]
+
+# SQLite no tiene restricciones de exclusión: se emulan con disparadores que
+# abortan la sentencia con el mismo nombre que usa la restricción de PostgreSQL
+SQLITE_CONFLICTO = f"""
+    SELECT RAISE(ABORT, 'reserva_sin_solapamiento')
+    WHERE EXISTS (
+        SELECT 1 FROM rentacar_app_reserva r
+        WHERE r.vehiculo_id = NEW.vehiculo_id
+          AND r.id <> NEW.id
+          AND r.estado IN {ESTADOS_ACTIVOS}
+          AND r.fecha_inicio <= NEW.fecha_fin
+          AND r.fecha_fin >= NEW.fecha_inicio
+    );
+"""
+SQLITE_CREAR = [
+    f"""
+    CREATE TRIGGER reserva_sin_solapamiento_insert
+    BEFORE INSERT ON rentacar_app_reserva
+    WHEN NEW.estado IN {ESTADOS_ACTIVOS}
+    BEGIN {SQLITE_CONFLICTO} END
+    """,
+    f"""
+    CREATE TRIGGER reserva_sin_solapamiento_update
+    BEFORE UPDATE OF vehiculo_id, fecha_inicio, fecha_fin, estado ON rentacar_app_reserva
+    WHEN NEW.estado IN {ESTADOS_ACTIVOS} AND (
+        OLD.estado NOT IN {ESTADOS_ACTIVOS}
+        OR NEW.vehiculo_id <> OLD.vehiculo_id
+        OR NEW.fecha_inicio <> OLD.fecha_inicio
+        OR NEW.fecha_fin <> OLD.fecha_fin
+    )
+    BEGIN {SQLITE_CONFLICTO} END
+    """,
+]
+SQLITE_BORRAR = [
+    "DROP TRIGGER IF EXISTS reserva_sin_solapamiento_insert",
+    "DROP TRIGGER IF EXISTS reserva_sin_solapamiento_update",
+]
+
+
+def _ejecutar(schema_editor, sentencias):
+    for sentencia in sentencias.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia)
+
+
+def comprobar_solapamientos(apps):
+    """
+    La restricción no se puede crear (PostgreSQL) o bloquea la edición de las
+    reservas afectadas (SQLite) si ya hay reservas activas solapadas: se
+    aborta la migración indicando cuáles hay que corregir o cancelar
+    """
+    Reserva = apps.get_model('rentacar_app', 'Reserva')
+    activas = Reserva.objects.filter(estado__in=['PENDIENTE', 'CONFIRMADA', 'ACTIVA'])
+    solapadas = activas.filter(Exists(
+        activas.filter(
+            vehiculo_id=OuterRef('vehiculo_id'),
+            fecha_inicio__lte=OuterRef('fecha_fin'),
+            fecha_fin__gte=OuterRef('fecha_inicio'),
+        ).exclude(pk=OuterRef('pk'))
+    )).order_by('vehiculo_id', 'fecha_inicio')
+    codigos = list(solapadas.values_list('codigo_reserva', flat=True)[:21])
+    if codigos:
+        muestra = ', '.join(codigos[:20]) + (', ...' if len(codigos) > 20 else '')
+        raise RuntimeError(
+            'Hay reservas activas que se solapan con otras del mismo vehículo; corríjalas o '
+            f'cancélelas antes de migrar: {muestra}'
+        )
+
+
+def btree_gist_disponible(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRESQL_BTREE_GIST)
+        return cursor.fetchone()[0]
+
+
+def crear_restriccion(apps, schema_editor):
+    comprobar_solapamientos(apps)
+    if schema_editor.connection.vendor == 'postgresql' and not btree_gist_disponible(schema_editor.connection):
+        print(
+            '\n  btree_gist no está disponible o no se puede crear: se omite la restricción '
+            'reserva_sin_solapamiento (ver reservas.py)'
+        )
+        return
+    _ejecutar(schema_editor, {'postgresql': POSTGRESQL_CREAR, 'sqlite': SQLITE_CREAR})
+
+
+def borrar_restriccion(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': POSTGRESQL_BORRAR, 'sqlite': SQLITE_BORRAR})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0003_contadorversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_restriccion, borrar_restriccion),
+    ]
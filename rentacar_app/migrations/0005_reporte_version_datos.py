@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0004_reserva_sin_solapamiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='version_datos',
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='fecha_fin',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='fecha_inicio',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
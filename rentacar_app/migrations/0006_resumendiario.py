@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:48
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def poblar_resumen(apps, schema_editor):
+    """Carga inicial del resumen (misma lógica que resumen.reconstruir_resumen)"""
+    Reserva = apps.get_model('rentacar_app', 'Reserva')
+    Vehiculo = apps.get_model('rentacar_app', 'Vehiculo')
+    ResumenDiario = apps.get_model('rentacar_app', 'ResumenDiario')
+
+    tipos = dict(Vehiculo.objects.values_list('pk', 'tipo'))
+    filas = defaultdict(lambda: [0, Decimal(0), 0])
+    reservas = Reserva.objects.order_by().values_list(
+        'fecha_reserva', 'vehiculo_id', 'estado', 'precio_total', 'fecha_inicio', 'fecha_fin'
+    )
+    for fecha_reserva, vehiculo_id, estado, precio_total, fecha_inicio, fecha_fin in reservas.iterator(chunk_size=5000):
+        fila = filas[(timezone.localdate(fecha_reserva), tipos[vehiculo_id], estado)]
+        fila[0] += 1
+        fila[1] += precio_total or 0
+        fila[2] += max(1, (fecha_fin - fecha_inicio).days)
+
+    ResumenDiario.objects.bulk_create([
+        ResumenDiario(
+            fecha=fecha, tipo_vehiculo=tipo, estado=estado,
+            reservas=cantidad, ingresos=ingresos, dias_reservados=dias,
+        )
+        for (fecha, tipo, estado), (cantidad, ingresos, dias) in filas.items()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0005_reporte_version_datos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo_vehiculo', models.CharField(choices=[('SEDAN', 'Sedán'), ('SUV', 'SUV'), ('PICKUP', 'Pickup'), ('VAN', 'Van'), ('DEPORTIVO', 'Deportivo')], max_length=20)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('CONFIRMADA', 'Confirmada'), ('ACTIVA', 'Activa'), ('COMPLETADA', 'Completada'), ('CANCELADA', 'Cancelada')], max_length=20)),
+                ('reservas', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('dias_reservados', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resumen diario',
+                'verbose_name_plural': 'Resúmenes diarios',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'tipo_vehiculo', 'estado'), name='resumen_diario_unico')],
+            },
+        ),
+        migrations.RunPython(poblar_resumen, migrations.RunPython.noop),
+    ]
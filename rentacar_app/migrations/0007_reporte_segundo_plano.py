@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0006_resumendiario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='archivo_pdf',
+            field=models.FileField(blank=True, null=True, upload_to='reportes/'),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADO', 'Completado'), ('ERROR', 'Error')], db_index=True, default='COMPLETADO', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='fecha_proceso',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='datos',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
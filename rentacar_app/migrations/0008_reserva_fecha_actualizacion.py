@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0007_reporte_segundo_plano'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='reporte',
+            name='tipo',
+            field=models.CharField(choices=[('FINANCIERO', 'Reporte Financiero'), ('VEHICULOS', 'Reporte de Vehículos'), ('CLIENTES', 'Reporte de Clientes'), ('RESERVAS', 'Reporte de Reservas'), ('TENDENCIAS', 'Reporte de Tendencias')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+import rentacar_app.fields
+
+
+def comprimir_datos(apps, schema_editor):
+    Reporte = apps.get_model('rentacar_app', 'Reporte')
+    filas = Reporte.objects.filter(datos__isnull=False).values_list('pk', 'datos')
+    for pk, datos in filas.iterator(chunk_size=100):
+        Reporte.objects.filter(pk=pk).update(
+            datos_comprimidos=datos,
+            tamano_datos=len(rentacar_app.fields.serializar_json(datos)),
+        )
+
+
+def descomprimir_datos(apps, schema_editor):
+    Reporte = apps.get_model('rentacar_app', 'Reporte')
+    filas = Reporte.objects.filter(datos_comprimidos__isnull=False).values_list('pk', 'datos_comprimidos')
+    for pk, datos in filas.iterator(chunk_size=100):
+        Reporte.objects.filter(pk=pk).update(datos=datos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0008_reserva_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reporte',
+            name='datos_comprimidos',
+            field=rentacar_app.fields.JSONComprimidoField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reporte',
+            name='tamano_datos',
+            field=models.PositiveIntegerField(default=0, help_text='Bytes del JSON sin comprimir'),
+        ),
+        migrations.RunPython(comprimir_datos, descomprimir_datos),
+        migrations.RemoveField(
+            model_name='reporte',
+            name='datos',
+        ),
+        migrations.RenameField(
+            model_name='reporte',
+            old_name='datos_comprimidos',
+            new_name='datos',
+        ),
+    ]
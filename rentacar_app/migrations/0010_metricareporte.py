@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0009_reporte_datos_comprimidos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricaReporte',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=20)),
+                ('operacion', models.CharField(choices=[('DATOS', 'Cálculo de datos'), ('PDF', 'Generación de PDF')], max_length=10)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('duracion_ms', models.FloatField()),
+                ('tiempo_bd_ms', models.FloatField(default=0)),
+                ('consultas', models.PositiveIntegerField(default=0)),
+                ('filas', models.PositiveIntegerField(default=0)),
+                ('tamano_pdf', models.PositiveIntegerField(blank=True, help_text='Bytes del PDF generado', null=True)),
+                ('reporte', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='metricas', to='rentacar_app.reporte')),
+            ],
+            options={
+                'verbose_name': 'Métrica de reporte',
+                'verbose_name_plural': 'Métricas de reportes',
+                'indexes': [models.Index(fields=['tipo', 'operacion', 'fecha'], name='metrica_tipo_fecha')],
+            },
+        ),
+    ]
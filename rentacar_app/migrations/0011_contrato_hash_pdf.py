@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0010_metricareporte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contrato',
+            name='hash_pdf',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='contrato',
+            name='huella_datos',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
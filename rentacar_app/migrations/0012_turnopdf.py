@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0011_contrato_hash_pdf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoPDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveSmallIntegerField(unique=True)),
+                ('ocupado_hasta', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Turno de PDF',
+                'verbose_name_plural': 'Turnos de PDF',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentacar_app', '0013_reporte_tipo_detalle'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reporte',
+            name='tipo',
+            field=models.CharField(choices=[('FINANCIERO', 'Reporte Financiero'), ('VEHICULOS', 'Reporte de Vehículos'), ('CLIENTES', 'Reporte de Clientes'), ('RESERVAS', 'Reporte de Reservas'), ('TENDENCIAS', 'Reporte de Tendencias'), ('DETALLE', 'Detalle de Reservas'), ('CONTRATOS', 'Lote de Contratos')], max_length=20),
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from datetime import date
 
+from .fields import JSONComprimidoField, serializar_json
+from .precios import cotizar
+
 class Cliente(models.Model):
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cliente')
     cedula_identidad = models.CharField(max_length=15, unique=True)
@@ -81,6 +84,11 @@ class Reserva(models.Model):
     precio_total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     observaciones = models.TextField(blank=True)
     codigo_reserva = models.CharField(max_length=10, unique=True, blank=True)
+    # Última escritura con save() o bulk_create (la instantánea de analitica.py
+    # relee solo las reservas modificadas desde su último refresco)
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True)
+    
+    CAMPOS_RESUMEN = ('fecha_reserva', 'vehiculo_id', 'estado', 'precio_total', 'fecha_inicio', 'fecha_fin')
     
     class Meta:
         verbose_name = "Reserva"
@@ -90,30 +98,76 @@ class Reserva(models.Model):
     def __str__(self):
         return f"Reserva {self.codigo_reserva} - {self.cliente}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Valores que determinan el precio, para no recalcularlo (ni leer el
+        # vehículo) cuando solo cambia el estado u otros campos
+        instancia._valores_precio = (
+            instancia.__dict__.get('vehiculo_id'),
+            instancia.__dict__.get('fecha_inicio'),
+            instancia.__dict__.get('fecha_fin'),
+        )
+        # Valores con los que la reserva cuenta en ResumenDiario (ver resumen.py)
+        instancia._valores_resumen = tuple(
+            instancia.__dict__.get(campo) for campo in Reserva.CAMPOS_RESUMEN
+        )
+        return instancia
+    
     def save(self, *args, **kwargs):
-        # Calcular precio total si tenemos las fechas y el vehículo
-        if self.fecha_inicio and self.fecha_fin and self.vehiculo:
-            dias = (self.fecha_fin - self.fecha_inicio).days
-            if dias < 1:
-                dias = 1
-            self.precio_total = dias * self.vehiculo.precio_dia
+        # Calcular precio total si es nueva o cambiaron las fechas o el vehículo
+        valores_precio = (self.vehiculo_id, self.fecha_inicio, self.fecha_fin)
+        if (self.fecha_inicio and self.fecha_fin and self.vehiculo_id
+                and getattr(self, '_valores_precio', None) != valores_precio):
+            if Reserva.vehiculo.is_cached(self):
+                precio_dia, tipo = self.vehiculo.precio_dia, self.vehiculo.tipo
+            else:
+                precio_dia, tipo = Vehiculo.objects.values_list('precio_dia', 'tipo').get(pk=self.vehiculo_id)
+            self.precio_total = cotizar(precio_dia, tipo, self.fecha_inicio, self.fecha_fin)
+        
+        # Un registro nuevo recibe su ID antes del INSERT para poder generar el
+        # código de reserva sin un segundo UPDATE
+        asignado = self.pk is None
+        codigo_generado = not self.codigo_reserva
+        provisional = False
+        if asignado:
+            from .reservas import asignar_ids_reserva, codigo_provisional
+            ids = asignar_ids_reserva(1)
+            self._valores_resumen = None
+            kwargs['force_insert'] = True
+            if ids is not None:
+                self.pk = ids[0]
+            elif codigo_generado:
+                # La base no da el ID antes del INSERT: código provisional y
+                # UPDATE con el definitivo, en la misma transacción
+                self.codigo_reserva = codigo_provisional()
+                provisional = True
+        if codigo_generado and not provisional:
+            self.codigo_reserva = f"R{self.pk:06d}"
         
-        # Si es un nuevo registro y no tiene código de reserva
-        if not self.pk and not self.codigo_reserva:
-            # Guardamos primero para obtener el ID (sin el código)
-            super().save(*args, **kwargs)
-            # Generamos el código con el ID
-            self.codigo_reserva = f"R{self.id:06d}"
-            # Actualizamos el registro con el código
-            super().save(update_fields=['codigo_reserva'])
-        else:
-            # Para actualizaciones o si ya tiene código
-            if not self.codigo_reserva and self.id:
-                self.codigo_reserva = f"R{self.id:06d}"
-            super().save(*args, **kwargs)
+        try:
+            if provisional:
+                with transaction.atomic(using=kwargs.get('using')):
+                    super().save(*args, **kwargs)
+                    self.codigo_reserva = f"R{self.pk:06d}"
+                    super().save(using=kwargs.get('using'), update_fields=['codigo_reserva'])
+            else:
+                super().save(*args, **kwargs)
+        except Exception:
+            # Si el INSERT falla, la instancia vuelve a ser nueva (un reintento
+            # recibe otro ID)
+            if asignado:
+                self.pk = None
+                self._state.adding = True
+            if codigo_generado:
+                self.codigo_reserva = ''
+            raise
+        self._valores_precio = valores_precio
     
     @property
     def duracion_dias(self):
+        # Días completos entre las fechas (0 si es en el mismo día); lo que se
+        # cobra es dias_facturables, con un mínimo de un día
         if self.fecha_inicio and self.fecha_fin:
             return (self.fecha_fin - self.fecha_inicio).days
         return 0
@@ -125,6 +179,10 @@ class Contrato(models.Model):
     firmado = models.BooleanField(default=False)
     fecha_firma = models.DateTimeField(null=True, blank=True)
     archivo_pdf = models.FileField(upload_to='contratos/', null=True, blank=True)
+    # PDF guardado (ver contratos.py): SHA-256 del archivo (ETag de la descarga)
+    # y de los datos impresos con que se generó
+    hash_pdf = models.CharField(max_length=64, blank=True)
+    huella_datos = models.CharField(max_length=64, blank=True)
     
     class Meta:
         verbose_name = "Contrato"
@@ -139,14 +197,35 @@ class Reporte(models.Model):
         ('VEHICULOS', 'Reporte de Vehículos'),
         ('CLIENTES', 'Reporte de Clientes'),
         ('RESERVAS', 'Reporte de Reservas'),
+        ('TENDENCIAS', 'Reporte de Tendencias'),
+        # PDF con todas las reservas filtradas (ver tareas.encolar_detalle)
+        ('DETALLE', 'Detalle de Reservas'),
+        # ZIP o PDF con los contratos de un lote (ver tareas.encolar_contratos)
+        ('CONTRATOS', 'Lote de Contratos'),
+    ]
+    
+    ESTADOS_REPORTE = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('COMPLETADO', 'Completado'),
+        ('ERROR', 'Error'),
     ]
     
     tipo = models.CharField(max_length=20, choices=TIPOS_REPORTE)
     fecha_generacion = models.DateTimeField(auto_now_add=True)
-    fecha_inicio = models.DateField()
-    fecha_fin = models.DateField()
-    datos = models.JSONField()
+    fecha_inicio = models.DateField(null=True, blank=True)
+    fecha_fin = models.DateField(null=True, blank=True)
+    # Comprimido: el historial guarda años de reportes; los listados lo difieren
+    datos = JSONComprimidoField(null=True, blank=True)
+    tamano_datos = models.PositiveIntegerField(default=0, help_text='Bytes del JSON sin comprimir')
     generado_por = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Sello de los datos con que se generó (ver cache_reportes.py)
+    version_datos = models.CharField(max_length=40, blank=True, db_index=True)
+    # Generación en segundo plano (ver tareas.py)
+    estado = models.CharField(max_length=20, choices=ESTADOS_REPORTE, default='COMPLETADO', db_index=True)
+    archivo_pdf = models.FileField(upload_to='reportes/', null=True, blank=True)
+    error = models.TextField(blank=True)
+    fecha_proceso = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         verbose_name = "Reporte"
@@ -154,6 +233,61 @@ class Reporte(models.Model):
     
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.fecha_generacion.strftime('%d/%m/%Y')}"
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if 'datos' not in self.get_deferred_fields() and (update_fields is None or 'datos' in update_fields):
+            self.tamano_datos = len(serializar_json(self.datos)) if self.datos is not None else 0
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'tamano_datos'}
+        super().save(*args, **kwargs)
+
+class ResumenDiario(models.Model):
+    """Reservas, ingresos y días reservados por fecha de reserva, tipo de vehículo y estado"""
+    fecha = models.DateField()
+    tipo_vehiculo = models.CharField(max_length=20, choices=Vehiculo.TIPOS_VEHICULO)
+    estado = models.CharField(max_length=20, choices=Reserva.ESTADOS_RESERVA)
+    reservas = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    dias_reservados = models.IntegerField(default=0)
+    
+    class Meta:
+        verbose_name = "Resumen diario"
+        verbose_name_plural = "Resúmenes diarios"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'tipo_vehiculo', 'estado'], name='resumen_diario_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.fecha} {self.tipo_vehiculo} {self.estado}: {self.reservas}"
+
+class MetricaReporte(models.Model):
+    """Tiempos y consultas de una generación de datos o de un PDF (ver instrumentacion.py)"""
+    OPERACIONES = [
+        ('DATOS', 'Cálculo de datos'),
+        ('PDF', 'Generación de PDF'),
+    ]
+    
+    # Tipo de reporte, o CONTRATO
+    tipo = models.CharField(max_length=20)
+    operacion = models.CharField(max_length=10, choices=OPERACIONES)
+    reporte = models.ForeignKey(Reporte, on_delete=models.SET_NULL, null=True, blank=True, related_name='metricas')
+    fecha = models.DateTimeField(auto_now_add=True)
+    duracion_ms = models.FloatField()
+    tiempo_bd_ms = models.FloatField(default=0)
+    consultas = models.PositiveIntegerField(default=0)
+    filas = models.PositiveIntegerField(default=0)
+    tamano_pdf = models.PositiveIntegerField(null=True, blank=True, help_text='Bytes del PDF generado')
+    
+    class Meta:
+        verbose_name = "Métrica de reporte"
+        verbose_name_plural = "Métricas de reportes"
+        indexes = [
+            models.Index(fields=['tipo', 'operacion', 'fecha'], name='metrica_tipo_fecha'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo} {self.operacion}: {self.duracion_ms:.0f} ms"
 
 class Empleado(models.Model):
     usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='empleado')
@@ -167,4 +301,29 @@ class Empleado(models.Model):
         verbose_name_plural = "Empleados"
     
     def __str__(self):
-        return f"{self.usuario.get_full_name()}"
\ No newline at end of file
+        return f"{self.usuario.get_full_name()}"
+
+class TurnoPDF(models.Model):
+    """Un PDF en generación en algún proceso web (ver turnos.py); libre si ocupado_hasta es nulo o ya pasó"""
+    numero = models.PositiveSmallIntegerField(unique=True)
+    ocupado_hasta = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = "Turno de PDF"
+        verbose_name_plural = "Turnos de PDF"
+    
+    def __str__(self):
+        return f"Turno {self.numero}"
+
+class ContadorVersion(models.Model):
+    """Contador con nombre: versiones de datos y secuencias de IDs"""
+    nombre = models.CharField(max_length=50, unique=True)
+    valor = models.BigIntegerField(default=0)
+    actualizado = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Contador de Versión"
+        verbose_name_plural = "Contadores de Versión"
+    
+    def __str__(self):
+        return f"{self.nombre} v{self.valor}"
@@ -0,0 +1,180 @@
+"""
+Tasa de ocupación de la flota.
+
+Ocupación = días-vehículo reservados / días-vehículo disponibles en un
+periodo. Las reservas se leen en streaming ordenadas por fecha de inicio y se
+recorren con una línea de barrido: por cada vehículo solo se guarda hasta
+dónde está ya cubierto, de modo que los tramos solapados no se cuentan dos
+veces y no se crea ningún objeto por día. La memoria depende del tamaño de la
+flota y del número de semanas del periodo, no del número de reservas.
+
+Un vehículo cuenta como disponible desde su fecha de adquisición (o desde su
+primera reserva, si es anterior) hasta el final del periodo.
+"""
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import Reserva, Vehiculo
+
+ESTADOS_OCUPACION = ['CONFIRMADA', 'ACTIVA', 'COMPLETADA']
+SEGUNDOS_DIA = 86400
+
+
+def _inicio_dia(dia):
+    """Timestamp de la medianoche local de un día"""
+    return timezone.make_aware(datetime.combine(dia, time.min)).timestamp()
+
+
+def _tasa(reservados, disponibles):
+    return round(reservados / disponibles * 100, 2) if disponibles else 0
+
+
+def _fila(reservados, disponibles, **extra):
+    return dict(
+        extra,
+        dias_reservados=round(reservados / SEGUNDOS_DIA, 2),
+        dias_disponibles=round(disponibles / SEGUNDOS_DIA, 2),
+        tasa=_tasa(reservados, disponibles),
+    )
+
+
+def periodo_por_defecto(estados=ESTADOS_OCUPACION):
+    """Primer y último día cubiertos por alguna reserva; (None, None) si no hay"""
+    rango = Reserva.objects.filter(estado__in=estados).aggregate(
+        inicio=Min('fecha_inicio'), fin=Max('fecha_fin')
+    )
+    if rango['inicio'] is None:
+        return None, None
+    return timezone.localdate(rango['inicio']), timezone.localdate(rango['fin'])
+
+
+def calcular_ocupacion(fecha_inicio=None, fecha_fin=None, estados=ESTADOS_OCUPACION, chunk_size=5000):
+    """
+    Ocupación entre fecha_inicio y fecha_fin (días locales, ambos incluidos),
+    total y desglosada por vehículo, por tipo y por semana ISO. Si falta alguna
+    fecha se usa la de la primera o última reserva.
+    """
+    if fecha_inicio is None or fecha_fin is None:
+        primera, ultima = periodo_por_defecto(estados)
+        fecha_inicio = fecha_inicio or primera
+        fecha_fin = fecha_fin or ultima
+    if fecha_inicio is None or fecha_fin is None or fecha_fin < fecha_inicio:
+        return _resultado_vacio(fecha_inicio, fecha_fin)
+
+    periodo_ini = _inicio_dia(fecha_inicio)
+    periodo_fin = _inicio_dia(fecha_fin + timedelta(days=1))
+
+    # Semanas ISO (de lunes a lunes) que tocan el periodo
+    lunes = fecha_inicio - timedelta(days=fecha_inicio.weekday())
+    semanas = []
+    limites = []
+    dia = lunes
+    while True:
+        limite = _inicio_dia(dia)
+        limites.append(min(max(limite, periodo_ini), periodo_fin))
+        if limite >= periodo_fin:
+            break
+        semanas.append(dia)
+        dia += timedelta(days=7)
+    reservado_semana = [0.0] * len(semanas)
+
+    flota = {
+        fila[0]: fila
+        for fila in Vehiculo.objects.values_list('id', 'placa', 'marca', 'modelo', 'tipo', 'fecha_adquisicion')
+    }
+
+    cubierto_hasta = {}
+    primer_inicio = {}
+    reservado = {}
+    reservas = Reserva.objects.filter(
+        estado__in=estados,
+        fecha_inicio__lt=datetime.fromtimestamp(periodo_fin, timezone.get_current_timezone()),
+        fecha_fin__gt=datetime.fromtimestamp(periodo_ini, timezone.get_current_timezone()),
+    ).order_by('fecha_inicio').values_list('vehiculo_id', 'fecha_inicio', 'fecha_fin')
+
+    for vehiculo_id, inicio, fin in reservas.iterator(chunk_size=chunk_size):
+        inicio = inicio.timestamp()
+        fin = min(fin.timestamp(), periodo_fin)
+        if vehiculo_id not in primer_inicio:
+            primer_inicio[vehiculo_id] = inicio
+        # Lo ya contado para este vehículo no se vuelve a sumar
+        inicio = max(inicio, periodo_ini, cubierto_hasta.get(vehiculo_id, periodo_ini))
+        if fin <= inicio:
+            continue
+        cubierto_hasta[vehiculo_id] = fin
+        reservado[vehiculo_id] = reservado.get(vehiculo_id, 0.0) + (fin - inicio)
+
+        semana = bisect_right(limites, inicio) - 1
+        while inicio < fin:
+            corte = min(fin, limites[semana + 1])
+            reservado_semana[semana] += corte - inicio
+            inicio = corte
+            semana += 1
+
+    # Capacidad: cada vehículo aporta desde que está en la flota. Por semana se
+    # usa un arreglo de diferencias: tramo parcial en su primera semana y una
+    # semana completa en todas las siguientes.
+    disponible = {}
+    parcial_semana = [0.0] * len(semanas)
+    altas_semana = [0] * (len(semanas) + 1)
+    for vehiculo_id, (_, _, _, _, _, adquisicion) in flota.items():
+        desde = _inicio_dia(adquisicion) if adquisicion else periodo_ini
+        desde = max(periodo_ini, min(desde, primer_inicio.get(vehiculo_id, desde)))
+        if desde >= periodo_fin:
+            continue
+        disponible[vehiculo_id] = periodo_fin - desde
+        semana = bisect_right(limites, desde) - 1
+        parcial_semana[semana] += limites[semana + 1] - desde
+        altas_semana[semana + 1] += 1
+
+    por_semana = []
+    activos = 0
+    for i, lunes_semana in enumerate(semanas):
+        activos += altas_semana[i]
+        capacidad = parcial_semana[i] + activos * (limites[i + 1] - limites[i])
+        año, numero, _ = lunes_semana.isocalendar()
+        por_semana.append(_fila(
+            reservado_semana[i], capacidad,
+            semana=f'{año}-W{numero:02d}', inicio=lunes_semana.isoformat(),
+        ))
+
+    por_tipo = {}
+    por_vehiculo = []
+    for vehiculo_id, capacidad in disponible.items():
+        _, placa, marca, modelo, tipo, _ = flota[vehiculo_id]
+        segundos = reservado.get(vehiculo_id, 0.0)
+        acumulado = por_tipo.setdefault(tipo, [0.0, 0.0])
+        acumulado[0] += segundos
+        acumulado[1] += capacidad
+        por_vehiculo.append(_fila(
+            segundos, capacidad, vehiculo_id=vehiculo_id, placa=placa, marca=marca, modelo=modelo, tipo=tipo,
+        ))
+    por_vehiculo.sort(key=lambda fila: (-fila['tasa'], fila['vehiculo_id']))
+
+    total_reservado = sum(reservado.values())
+    total_disponible = sum(disponible.values())
+    return {
+        'periodo_inicio': fecha_inicio.isoformat(),
+        'periodo_fin': fecha_fin.isoformat(),
+        **_fila(total_reservado, total_disponible),
+        'por_vehiculo': por_vehiculo,
+        'por_tipo': [
+            _fila(segundos, capacidad, tipo=tipo)
+            for tipo, (segundos, capacidad) in sorted(por_tipo.items())
+        ],
+        'por_semana': por_semana,
+    }
+
+
+def _resultado_vacio(fecha_inicio, fecha_fin):
+    return {
+        'periodo_inicio': fecha_inicio.isoformat() if isinstance(fecha_inicio, date) else None,
+        'periodo_fin': fecha_fin.isoformat() if isinstance(fecha_fin, date) else None,
+        **_fila(0, 0),
+        'por_vehiculo': [],
+        'por_tipo': [],
+        'por_semana': [],
+    }
@@ -0,0 +1,79 @@
+"""
+Paquete de cierre: los cuatro reportes de un mismo periodo en un ZIP o en un
+único PDF.
+
+Los datos se piden a cache_reportes, así que se reutilizan los reportes ya
+generados, desde un pool de hilos (cada hilo con su propia conexión, que
+cierra al terminar). Los hilos solo solapan las esperas a la base de datos:
+las agregaciones en Python (sobre todo la ocupación del reporte de reservas)
+comparten el GIL, de modo que un paquete sin caché tarda en la fase de datos
+más o menos la suma de los cuatro cálculos. Lo que sí avanza en paralelo es
+el PDF: cada uno se envía al pool de procesos en cuanto sus datos están
+listos, mientras los hilos siguen con los demás reportes.
+"""
+import io
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from django.db import connections
+
+from .almacenamiento import archivo_disponible
+from .cache_reportes import cache_reportes, normalizar_parametros
+from .instrumentacion import guardar_metricas
+from .procesos import ejecutar_en_proceso, esperar, renderizar_paquete_pdf, renderizar_pdf
+
+TIPOS_PAQUETE = ('FINANCIERO', 'RESERVAS', 'VEHICULOS', 'CLIENTES')
+FORMATOS_PAQUETE = {
+    'zip': 'application/zip',
+    'pdf': 'application/pdf',
+}
+
+
+def _obtener_reporte(tipo, fecha_inicio, fecha_fin, usuario):
+    try:
+        return cache_reportes.obtener(tipo, fecha_inicio, fecha_fin, usuario)
+    finally:
+        connections.close_all()
+
+
+def generar_paquete(fecha_inicio, fecha_fin, usuario, formato='zip'):
+    """
+    Devuelve (contenido, nombre de archivo) del paquete en `formato` ('zip' o
+    'pdf'). Lanza ValueError si las fechas o el formato no son válidos.
+    """
+    if formato not in FORMATOS_PAQUETE:
+        raise ValueError('Formato de paquete inválido')
+    _, fecha_inicio, fecha_fin = normalizar_parametros('FINANCIERO', fecha_inicio, fecha_fin)
+    sufijo = f"{fecha_inicio or 'inicio'}_{fecha_fin or 'fin'}"
+
+    with ThreadPoolExecutor(max_workers=len(TIPOS_PAQUETE), thread_name_prefix='paquete') as hilos:
+        futuros = {
+            hilos.submit(_obtener_reporte, tipo, fecha_inicio, fecha_fin, usuario): tipo
+            for tipo in TIPOS_PAQUETE
+        }
+        if formato == 'pdf':
+            reportes = {futuros[futuro]: futuro.result() for futuro in as_completed(futuros)}
+            secciones = [(reportes[tipo].datos, tipo) for tipo in TIPOS_PAQUETE]
+            pdf = esperar(ejecutar_en_proceso(renderizar_paquete_pdf, secciones), renderizar_paquete_pdf, secciones)
+            return pdf, f'paquete_reportes_{sufijo}.pdf'
+
+        reportes = {}
+        pdfs = {}
+        for futuro in as_completed(futuros):
+            tipo = futuros[futuro]
+            reporte = reportes[tipo] = futuro.result()
+            if archivo_disponible(reporte.archivo_pdf):
+                # Ya generado en segundo plano con la misma versión de los datos
+                pdfs[tipo] = Future()
+                with reporte.archivo_pdf.open('rb') as archivo:
+                    pdfs[tipo].set_result((archivo.read(), []))
+            else:
+                pdfs[tipo] = ejecutar_en_proceso(renderizar_pdf, reporte.datos, tipo)
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archivo_zip:
+        for tipo in TIPOS_PAQUETE:
+            pdf, metricas = esperar(pdfs[tipo], renderizar_pdf, reportes[tipo].datos, tipo)
+            guardar_metricas(metricas, reportes[tipo])
+            archivo_zip.writestr(f'reporte_{tipo}_{sufijo}.pdf', pdf)
+    return buffer.getvalue(), f'paquete_reportes_{sufijo}.zip'
@@ -0,0 +1,171 @@
+"""
+Motor de precios de alquiler.
+
+Las reglas de tarifa (recargo por tipo de vehículo, fin de semana, temporada
+por mes y descuento por alquiler largo) se leen de settings y se compilan una
+vez por proceso en tablas:
+
+- un factor por día con su suma acumulada, de modo que el factor de cualquier
+  rango de fechas dentro del horizonte es una resta;
+- los umbrales de descuento ordenados, que se buscan con bisect.
+
+Los factores se guardan como Decimal (convertidos desde su texto en settings),
+así que las sumas acumuladas son exactas y el importe solo se redondea una vez,
+a centavos, al final. Con las tablas compiladas, cotizar_varios calcula
+N vehículos × M rangos con M búsquedas más N × M multiplicaciones en Python
+puro: no está vectorizado, porque con floats se perdería el redondeo exacto.
+Todo cálculo de precio (Reserva.save, edición de reservas, búsquedas de
+disponibilidad y contratos) pasa por aquí.
+"""
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils import timezone
+
+CENTAVOS = Decimal('0.01')
+UNO = Decimal(1)
+AJUSTES_TARIFA = (
+    'TARIFA_FACTOR_TIPO',
+    'TARIFA_FACTOR_FIN_DE_SEMANA',
+    'TARIFA_FACTOR_MES',
+    'TARIFA_DESCUENTOS_DURACION',
+    'TARIFA_HORIZONTE_DIAS',
+)
+
+
+def dias_facturables(fecha_inicio, fecha_fin):
+    """Días completos entre inicio y fin; se cobra como mínimo un día"""
+    return max(1, (fecha_fin - fecha_inicio).days)
+
+
+def _decimal(valor):
+    """Decimal exacto de un número de settings (1.15 -> Decimal('1.15'))"""
+    return valor if isinstance(valor, Decimal) else Decimal(str(valor))
+
+
+def _fecha_local(valor):
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.date()
+    return valor
+
+
+class Tarifario:
+    """Reglas de tarifa compiladas en tablas de consulta"""
+
+    def __init__(self, factor_tipo, factor_fin_de_semana, factor_mes, descuentos, horizonte_dias, hoy=None):
+        self.factor_tipo = {tipo: _decimal(factor) for tipo, factor in factor_tipo.items()}
+        self.factor_fin_de_semana = _decimal(factor_fin_de_semana)
+        self.factor_mes = {int(mes): _decimal(factor) for mes, factor in factor_mes.items()}
+
+        descuentos = sorted((int(dias), _decimal(descuento)) for dias, descuento in descuentos)
+        self.umbrales_descuento = [dias for dias, _ in descuentos]
+        self.descuentos = [descuento for _, descuento in descuentos]
+
+        # Factor de cada día del horizonte (centrado en hoy) y su suma acumulada
+        hoy = hoy or timezone.localdate()
+        self.base = (hoy - timedelta(days=horizonte_dias)).toordinal()
+        dias = 2 * horizonte_dias
+        factores = [self.factor_dia(date.fromordinal(self.base + i)) for i in range(dias)]
+        self.acumulado = [Decimal(0), *accumulate(factores)]
+
+    def factor_dia(self, dia):
+        factor = self.factor_mes.get(dia.month, UNO)
+        if dia.weekday() >= 5:
+            factor *= self.factor_fin_de_semana
+        return factor
+
+    def suma_factores(self, primer_dia, dias):
+        """Suma de los factores diarios de `dias` días desde primer_dia"""
+        desde = primer_dia.toordinal() - self.base
+        hasta = desde + dias
+        if 0 <= desde and hasta < len(self.acumulado):
+            return self.acumulado[hasta] - self.acumulado[desde]
+        # Fuera del horizonte compilado: se suma día a día
+        return sum((self.factor_dia(primer_dia + timedelta(days=i)) for i in range(dias)), Decimal(0))
+
+    def descuento(self, dias):
+        posicion = bisect_right(self.umbrales_descuento, dias)
+        return self.descuentos[posicion - 1] if posicion else Decimal(0)
+
+    def factor_rango(self, fecha_inicio, fecha_fin):
+        """Multiplicador del precio por día para un rango (días, temporada y descuento)"""
+        dias = dias_facturables(fecha_inicio, fecha_fin)
+        return self.suma_factores(_fecha_local(fecha_inicio), dias) * (1 - self.descuento(dias))
+
+    def factor_vehiculo(self, tipo):
+        return self.factor_tipo.get(tipo, UNO)
+
+
+_tarifario = None
+_lock = threading.Lock()
+
+
+def obtener_tarifario():
+    """Tarifario compilado del proceso (se compila en el primer uso)"""
+    global _tarifario
+    tarifario = _tarifario
+    if tarifario is None:
+        with _lock:
+            if _tarifario is None:
+                _tarifario = Tarifario(
+                    settings.TARIFA_FACTOR_TIPO,
+                    settings.TARIFA_FACTOR_FIN_DE_SEMANA,
+                    settings.TARIFA_FACTOR_MES,
+                    settings.TARIFA_DESCUENTOS_DURACION,
+                    settings.TARIFA_HORIZONTE_DIAS,
+                )
+            tarifario = _tarifario
+    return tarifario
+
+
+def reiniciar_tarifario(**kwargs):
+    global _tarifario
+    if kwargs.get('setting') in (None, *AJUSTES_TARIFA):
+        _tarifario = None
+
+
+setting_changed.connect(reiniciar_tarifario)
+
+
+def _importe(precio_dia, factor):
+    return (_decimal(precio_dia) * factor).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+def cotizar(precio_dia, tipo, fecha_inicio, fecha_fin):
+    """Precio total de alquilar un vehículo entre dos fechas"""
+    tarifario = obtener_tarifario()
+    factor = tarifario.factor_vehiculo(tipo) * tarifario.factor_rango(fecha_inicio, fecha_fin)
+    return _importe(precio_dia, factor)
+
+
+def cotizar_varios(vehiculos, rangos):
+    """
+    Cotiza N vehículos × M rangos de fechas en una sola llamada.
+
+    Es un bucle en Python, no un cálculo vectorizado: solo ahorra obtener el
+    tarifario y los factores de tipo y de rango una vez en lugar de por
+    precio. `vehiculos` es una secuencia de pares (precio_dia, tipo) o de
+    dicts con esas claves; `rangos` una secuencia de pares (fecha_inicio,
+    fecha_fin). Devuelve una lista por rango con el precio de cada vehículo,
+    en orden.
+    """
+    tarifario = obtener_tarifario()
+    bases = []
+    for vehiculo in vehiculos:
+        if isinstance(vehiculo, dict):
+            precio_dia, tipo = vehiculo['precio_dia'], vehiculo['tipo']
+        else:
+            precio_dia, tipo = vehiculo
+        bases.append((_decimal(precio_dia), tarifario.factor_vehiculo(tipo)))
+
+    return [
+        [_importe(precio_dia, factor_tipo * factor) for precio_dia, factor_tipo in bases]
+        for factor in (tarifario.factor_rango(inicio, fin) for inicio, fin in rangos)
+    ]
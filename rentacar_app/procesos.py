@@ -0,0 +1,326 @@
+"""
+Pool de procesos para generar PDF.
+
+ReportLab es Python puro y retiene el GIL: varios PDF generados en hilos no
+avanzan en paralelo. Este pool (contexto spawn, para que los hijos no hereden
+conexiones ni hilos del proceso web) recibe datos ya calculados y devuelve
+los bytes del PDF. La excepción es el detalle de reservas
+(renderizar_detalle_pdf): el hijo lee las reservas de la base en streaming y
+escribe el PDF en un archivo, y cierra su conexión al terminar.
+
+Todo el renderizado con ReportLab pasa por aquí, para que una ráfaga de
+descargas no ocupe los hilos que atienden el resto de páginas. La cola está
+acotada: las vistas (renderizar) pueden ocupar los REPORTES_PROCESOS
+procesos más PDF_COLA_MAXIMA trabajos en espera; si no hay sitio se lanza
+ColaLlena al instante (la vista responde 503 con Retry-After) y, si el PDF
+tarda más de PDF_TIEMPO_MAXIMO segundos, TiempoAgotado. Los trabajos por lotes
+y en segundo plano (ejecutar_en_proceso) esperan a que haya un proceso libre
+y no entran en la cola, que queda para las vistas. estado_pool() da la
+profundidad de la cola y los tiempos de los últimos trabajos.
+
+Cola y pool son de cada proceso web. Con un servidor multihilo en un solo
+proceso bastan para acotar la carga, pero con varios procesos (workers de
+gunicorn de un hilo, instancias serverless) cada uno tendría su cola y su
+pool, así que cada trabajo toma además un turno global (turnos.py): como
+mucho PDF_TURNOS PDF a la vez entre todos los procesos que comparten la base
+de datos. Sin turno libre las vistas reciben ColaLlena igual que con la cola
+local llena, y los lotes esperan.
+
+Con REPORTES_PROCESOS = 0, o si el sistema no permite crear procesos (algunos
+entornos serverless no tienen semáforos POSIX y ProcessPoolExecutor falla al
+crearse), el PDF se genera en el propio proceso, sin cola local (pero con
+turno global). Un fallo así se
+recuerda: no se vuelve a intentar crear el pool en cada petición.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+# Lo que lanza Future.result(timeout); hasta Python 3.11 no es el TimeoutError
+# integrado, así que hay que capturar este
+from concurrent.futures import TimeoutError as TiempoAgotado
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_lock = threading.Lock()
+# El sistema no permite crear el pool (se detecta una vez por proceso)
+_pool_no_disponible = False
+
+
+class ColaLlena(Exception):
+    """No hay sitio en la cola de PDF; hay que volver a intentarlo más tarde"""
+
+
+class ColaPDF:
+    """Trabajos del pool en curso o en espera, con sus contadores y tiempos"""
+
+    def __init__(self):
+        self._libre = threading.Condition()
+        self.ocupados = 0
+        self.esperando = 0
+        self.completados = 0
+        self.fallidos = 0
+        self.rechazados = 0
+        self.tiempos_agotados = 0
+        self._duraciones = deque(maxlen=500)
+
+    def limite(self, interactivo):
+        procesos = getattr(settings, 'REPORTES_PROCESOS', 2)
+        return procesos + getattr(settings, 'PDF_COLA_MAXIMA', 8) if interactivo else procesos
+
+    def admitir(self, interactivo):
+        """Reserva un sitio: ColaLlena si es interactivo y no hay; si no, espera uno"""
+        with self._libre:
+            if interactivo:
+                if self.ocupados >= self.limite(True):
+                    self.rechazados += 1
+                    raise ColaLlena()
+            else:
+                self.esperando += 1
+                try:
+                    self._libre.wait_for(lambda: self.ocupados < self.limite(False))
+                finally:
+                    self.esperando -= 1
+            self.ocupados += 1
+
+    def liberar(self, futuro=None, duracion=None):
+        with self._libre:
+            self.ocupados -= 1
+            if futuro is not None:
+                if futuro.cancelled() or futuro.exception() is not None:
+                    self.fallidos += 1
+                else:
+                    self.completados += 1
+                    self._duraciones.append(duracion)
+            self._libre.notify_all()
+
+    def rechazar(self):
+        """Rechazo sin sitio reservado (sin turno global libre)"""
+        with self._libre:
+            self.rechazados += 1
+
+    def tiempo_agotado(self):
+        with self._libre:
+            self.tiempos_agotados += 1
+
+    def estado(self):
+        with self._libre:
+            procesos = getattr(settings, 'REPORTES_PROCESOS', 2)
+            duraciones = list(self._duraciones)
+            estado = {
+                'procesos': procesos,
+                'limite_cola': getattr(settings, 'PDF_COLA_MAXIMA', 8),
+                'en_proceso': min(self.ocupados, procesos),
+                'en_cola': max(0, self.ocupados - procesos),
+                'lotes_esperando': self.esperando,
+                'completados': self.completados,
+                'fallidos': self.fallidos,
+                'rechazados': self.rechazados,
+                'tiempos_agotados': self.tiempos_agotados,
+            }
+        estado['duracion_ms'] = None
+        if duraciones:
+            # NumPy solo al consultar el estado, no en cada petición
+            import numpy as np
+            estado['duracion_ms'] = {
+                f'p{p}': round(float(v) * 1000, 1)
+                for p, v in zip((50, 95, 99), np.percentile(duraciones, (50, 95, 99)))
+            }
+        return estado
+
+
+_cola = ColaPDF()
+
+
+def _inicializar_proceso():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'VercelApp.settings')
+    import django
+    django.setup()
+
+
+# Los hijos importan este módulo antes de django.setup() (al recibir el
+# inicializador), por eso utils se importa dentro de cada tarea
+def renderizar_pdf(datos, tipo):
+    """(bytes del PDF, métricas sin guardar: las guarda el proceso web)"""
+    from .instrumentacion import recolectar_metricas
+    from .utils import generar_reporte_pdf
+    with recolectar_metricas(guardar=False) as recolector:
+        pdf = generar_reporte_pdf(datos, tipo).getvalue()
+    return pdf, recolector.metricas
+
+
+def renderizar_contratos(lote, emision):
+    """PDF de cada contrato de `lote` (datos_contrato) y las métricas sin guardar"""
+    from .instrumentacion import recolectar_metricas
+    from .utils import generar_contrato_pdf
+    with recolectar_metricas(guardar=False) as recolector:
+        pdfs = [generar_contrato_pdf(None, datos, emision).getvalue() for datos in lote]
+    return pdfs, recolector.metricas
+
+
+def renderizar_detalle_pdf(ruta, fecha_inicio, fecha_fin, estados):
+    """Escribe en `ruta` el detalle de reservas en PDF (leído aquí de la base); (filas, métricas)"""
+    from django.db import connections
+    from .exportacion import exportar_pdf
+    from .instrumentacion import recolectar_metricas
+    try:
+        with recolectar_metricas(guardar=False) as recolector:
+            filas = exportar_pdf(ruta, fecha_inicio, fecha_fin, estados)
+        return filas, recolector.metricas
+    finally:
+        # El proceso hijo queda esperando otro PDF: no retiene la conexión
+        # (si se ejecuta en el propio proceso, la conexión es la del hilo)
+        if multiprocessing.parent_process() is not None:
+            connections.close_all()
+
+
+def renderizar_paquete_pdf(reportes):
+    from .utils import generar_paquete_pdf
+    return generar_paquete_pdf(reportes).getvalue()
+
+
+def obtener_pool():
+    """Pool del proceso (se crea en el primer uso); None si está desactivado o no se puede crear"""
+    global _pool
+    procesos = getattr(settings, 'REPORTES_PROCESOS', 2)
+    if procesos <= 0 or _pool_no_disponible:
+        return None
+    with _lock:
+        if _pool is None and not _pool_no_disponible:
+            try:
+                _pool = ProcessPoolExecutor(
+                    max_workers=procesos,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_inicializar_proceso,
+                )
+            except (OSError, ImportError, NotImplementedError):
+                _marcar_no_disponible()
+        return _pool
+
+
+def _marcar_no_disponible():
+    """Llamar con _lock tomado"""
+    global _pool_no_disponible
+    logger.exception('No se pueden crear procesos; los PDF se generan en el proceso web')
+    _pool_no_disponible = True
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _tomar_turno(interactivo):
+    """Turno global (turnos.py); ColaLlena si es interactivo y no hay ninguno libre"""
+    # Importado aquí: los hijos cargan este módulo antes de django.setup()
+    from .turnos import tomar_turno
+    turno = tomar_turno(esperar=not interactivo)
+    if turno is False:
+        _cola.rechazar()
+        raise ColaLlena()
+    return turno
+
+
+def _liberar_turno(turno, hilo=None):
+    from .turnos import liberar_turno
+    # El callback del Future puede ejecutarse en un hilo interno del pool,
+    # que no cierra solo su conexión a la base de datos
+    liberar_turno(turno, cerrar_conexion=hilo is not None and hilo != threading.get_ident())
+
+
+def ejecutar_en_proceso(funcion, *args, interactivo=False):
+    """
+    Future con funcion(*args) en el pool, o ya resuelto si se ejecutó aquí.
+    Espera a que haya un proceso libre y un turno global; con interactivo=True
+    usa también la cola y lanza ColaLlena si está llena o no hay turno.
+    """
+    pool = obtener_pool()
+    if pool is not None:
+        _cola.admitir(interactivo)
+        try:
+            turno = _tomar_turno(interactivo)
+        except BaseException:
+            _cola.liberar()
+            raise
+        inicio = time.perf_counter()
+        hilo = threading.get_ident()
+        try:
+            futuro = pool.submit(funcion, *args)
+        except BrokenProcessPool:
+            _cola.liberar()
+            _liberar_turno(turno)
+            logger.exception('No se pudo usar el pool de procesos; se genera en el proceso actual')
+            _descartar_pool(pool)
+        except OSError:
+            # No se pueden lanzar los procesos hijos: tampoco se reintentará
+            _cola.liberar()
+            _liberar_turno(turno)
+            with _lock:
+                _marcar_no_disponible()
+            _descartar_pool(pool)
+        else:
+            def terminado(f):
+                _cola.liberar(f, time.perf_counter() - inicio)
+                _liberar_turno(turno, hilo)
+            futuro.add_done_callback(terminado)
+            return futuro
+    turno = _tomar_turno(interactivo)
+    futuro = Future()
+    try:
+        futuro.set_result(funcion(*args))
+    except Exception as e:
+        futuro.set_exception(e)
+    finally:
+        _liberar_turno(turno)
+    return futuro
+
+
+def esperar(futuro, funcion, *args, timeout=None):
+    """Resultado de ejecutar_en_proceso; si el pool se rompió, repite la tarea aquí"""
+    try:
+        return futuro.result(timeout)
+    except BrokenProcessPool:
+        logger.exception('El pool de procesos se rompió; se genera en el proceso actual')
+        pool = _pool
+        if pool is not None:
+            _descartar_pool(pool)
+        return funcion(*args)
+
+
+def renderizar(funcion, *args, timeout=None):
+    """
+    funcion(*args) en el pool para una vista: ColaLlena si la cola está
+    llena; TiempoAgotado si tarda más de `timeout` segundos (por defecto
+    PDF_TIEMPO_MAXIMO; el trabajo sigue ocupando su sitio hasta que termina).
+    """
+    futuro = ejecutar_en_proceso(funcion, *args, interactivo=True)
+    if timeout is None:
+        timeout = getattr(settings, 'PDF_TIEMPO_MAXIMO', 30)
+    try:
+        return esperar(futuro, funcion, *args, timeout=timeout)
+    except TiempoAgotado:
+        _cola.tiempo_agotado()
+        raise
+
+
+def estado_pool():
+    """
+    Profundidad de la cola, contadores y percentiles de duración de los
+    últimos trabajos (desde el envío, espera en cola incluida) de este
+    proceso, y turnos globales ocupados por todos los procesos
+    """
+    from .turnos import total_turnos, turnos_ocupados
+    estado = _cola.estado()
+    estado['turnos'] = total_turnos()
+    estado['turnos_ocupados'] = turnos_ocupados() if estado['turnos'] > 0 else None
+    return estado
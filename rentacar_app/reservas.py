@@ -0,0 +1,252 @@
+"""
+Creación y edición de reservas sin dobles reservas bajo concurrencia.
+
+El conflicto se comprueba y la reserva se guarda dentro de una misma
+transacción que bloquea la fila del vehículo (SELECT ... FOR UPDATE), de modo
+que solo se serializan las reservas que compiten por el mismo vehículo. La
+restricción reserva_sin_solapamiento de la base de datos (exclusión en
+PostgreSQL, disparadores en SQLite; ver migración 0004) es la última defensa
+para cualquier escritura que no pase por aquí. En un PostgreSQL sin btree_gist
+la migración no la crea, y crear_reservas_en_lote() bloquea los vehículos y
+comprueba los cruces como guardar_reserva_atomica().
+
+Esto vale para PostgreSQL. SQLite admite un solo escritor a la vez, así que
+ahí todas las transacciones que escriben se serializan igualmente (con
+transaction_mode IMMEDIATE el bloqueo se toma al empezar, en lugar de fallar
+al intentar promoverlo a mitad de la transacción); SQLite es solo para
+desarrollo local.
+
+También toma los IDs de Reserva del contador de la base de datos antes del
+INSERT, de modo que save() y crear_reservas_en_lote() conocen el ID (y por
+tanto codigo_reserva) sin un segundo UPDATE. En bases donde no se puede,
+insertan con un código provisional y lo corrigen después.
+"""
+import secrets
+import threading
+from collections import deque
+
+from django.db import IntegrityError, connection, transaction
+
+from .models import Reserva, Vehiculo
+from .precios import cotizar
+from .resumen import registrar_lote
+from .disponibilidad import ESTADOS_ACTIVOS, hay_conflicto_en_bd, indice_disponibilidad
+from .versiones import incrementar_version, VERSION_DISPONIBILIDAD
+
+TAMANO_BLOQUE_IDS = 50
+
+RESTRICCION_SOLAPAMIENTO = 'reserva_sin_solapamiento'
+
+
+class ReservaNoDisponible(Exception):
+    """El vehículo ya tiene una reserva activa que se cruza con las fechas"""
+
+
+def contar_solapamientos(vehiculo_ids):
+    """Pares de reservas activas solapadas de esos vehículos (debe ser 0)"""
+    reservas = Reserva.objects.filter(
+        vehiculo_id__in=vehiculo_ids, estado__in=ESTADOS_ACTIVOS
+    ).order_by('vehiculo_id', 'fecha_inicio').values_list('vehiculo_id', 'fecha_inicio', 'fecha_fin')
+    return _contar_cruces(reservas)
+
+
+def _contar_cruces(intervalos):
+    """Cruces en (vehiculo_id, inicio, fin) ordenados por vehículo e inicio"""
+    dobles = 0
+    anterior = None
+    for vehiculo_id, inicio, fin in intervalos:
+        if anterior and anterior[0] == vehiculo_id and inicio <= anterior[1]:
+            dobles += 1
+        if not anterior or anterior[0] != vehiculo_id or fin > anterior[1]:
+            anterior = (vehiculo_id, fin)
+    return dobles
+
+
+def restriccion_en_bd():
+    """
+    True si la base tiene reserva_sin_solapamiento; la migración 0004 no la
+    crea en PostgreSQL sin btree_gist
+    """
+    if connection.vendor != 'postgresql':
+        return connection.vendor == 'sqlite'
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = %s)', [RESTRICCION_SOLAPAMIENTO])
+        return cursor.fetchone()[0]
+
+
+def _comprobar_lote(reservas):
+    """
+    Sin la restricción de la base: bloquea los vehículos del lote (como
+    guardar_reserva_atomica) y busca cruces entre el lote y las reservas
+    activas que ya existen
+    """
+    activas = [reserva for reserva in reservas if reserva.estado in ESTADOS_ACTIVOS]
+    if not activas:
+        return
+    vehiculo_ids = {reserva.vehiculo_id for reserva in activas}
+    list(Vehiculo.objects.select_for_update().filter(pk__in=vehiculo_ids).order_by('pk').values_list('pk', flat=True))
+    existentes = Reserva.objects.filter(
+        vehiculo_id__in=vehiculo_ids, estado__in=ESTADOS_ACTIVOS,
+        fecha_fin__gte=min(reserva.fecha_inicio for reserva in activas),
+    ).values_list('vehiculo_id', 'fecha_inicio', 'fecha_fin')
+    intervalos = sorted([
+        *existentes, *((reserva.vehiculo_id, reserva.fecha_inicio, reserva.fecha_fin) for reserva in activas)
+    ])
+    if _contar_cruces(intervalos):
+        raise ReservaNoDisponible()
+
+
+def guardar_reserva_atomica(reserva):
+    """Guarda la reserva o lanza ReservaNoDisponible si el vehículo está ocupado"""
+    try:
+        with transaction.atomic():
+            # Bloquea la fila del vehículo hasta el final de la transacción
+            list(Vehiculo.objects.select_for_update().filter(pk=reserva.vehiculo_id).values_list('pk', flat=True))
+            if reserva.estado in ESTADOS_ACTIVOS and hay_conflicto_en_bd(
+                reserva.vehiculo_id, reserva.fecha_inicio, reserva.fecha_fin, excluir_id=reserva.pk
+            ):
+                raise ReservaNoDisponible()
+            reserva.save()
+    except IntegrityError as e:
+        if RESTRICCION_SOLAPAMIENTO in str(e):
+            raise ReservaNoDisponible() from e
+        raise
+    return reserva
+
+
+class _AsignadorIds:
+    """
+    Reparte IDs de Reserva desde el mismo contador que usan los INSERT sin ID
+    (bulk_create, create, importaciones del admin), así que nunca chocan.
+
+    En PostgreSQL los toma por bloques de la secuencia de la tabla: nextval no
+    se deshace con la transacción y los IDs no usados al terminar el proceso
+    solo dejan huecos en los códigos. En SQLite avanza el contador de
+    AUTOINCREMENT (sqlite_sequence) con un UPDATE ... RETURNING, sin guardar
+    bloques; solo el primer uso sobre una tabla vacía necesita además un
+    INSERT. Con otras bases (o SQLite sin RETURNING) devuelve None y quien
+    guarda hace el INSERT sin ID y pone el código después.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._libres = deque()
+
+    def asignar(self, cantidad):
+        if connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert:
+            return self._reservar_sqlite(cantidad)
+        if connection.vendor != 'postgresql':
+            return None
+        with self._lock:
+            if len(self._libres) < cantidad:
+                self._libres.extend(self._reservar(max(cantidad - len(self._libres), TAMANO_BLOQUE_IDS)))
+            return [self._libres.popleft() for _ in range(cantidad)]
+
+    def _reservar(self, cantidad):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [Reserva._meta.db_table, cantidad]
+            )
+            return [fila[0] for fila in cursor.fetchall()]
+
+    def _reservar_sqlite(self, cantidad):
+        tabla = Reserva._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s RETURNING seq', [cantidad, tabla])
+            fila = cursor.fetchone()
+            if fila is None:
+                # La fila de la tabla aparece con el primer INSERT; hasta
+                # entonces se parte del mayor ID existente
+                cursor.execute(
+                    f'INSERT INTO sqlite_sequence (name, seq) SELECT %s, COALESCE(MAX(id), 0) + %s FROM "{tabla}" '
+                    'RETURNING seq',
+                    [tabla, cantidad]
+                )
+                fila = cursor.fetchone()
+        ultimo = fila[0]
+        return list(range(ultimo - cantidad + 1, ultimo + 1))
+
+
+_asignador_ids = _AsignadorIds()
+
+
+def asignar_ids_reserva(cantidad):
+    """IDs para `cantidad` reservas nuevas, o None si la base no permite tomarlos antes del INSERT"""
+    return _asignador_ids.asignar(cantidad)
+
+
+def codigo_provisional():
+    """Código único mientras se inserta una reserva cuyo ID aún no se conoce"""
+    return f"T{secrets.token_hex(4)}"
+
+
+def _insertar_sin_ids(reservas, batch_size, generados):
+    """
+    INSERT sin IDs asignados: las reservas sin código entran con uno
+    provisional (se añaden a `generados`), los IDs se leen por código (no
+    todas las bases los devuelven en bulk_create) y luego se guardan los
+    códigos definitivos.
+    """
+    for reserva in reservas:
+        if not reserva.codigo_reserva:
+            reserva.codigo_reserva = codigo_provisional()
+            generados.append(reserva)
+    Reserva.objects.bulk_create(reservas, batch_size=batch_size)
+    ids = dict(Reserva.objects.filter(
+        codigo_reserva__in=[reserva.codigo_reserva for reserva in reservas]
+    ).values_list('codigo_reserva', 'pk'))
+    for reserva in reservas:
+        reserva.pk = ids[reserva.codigo_reserva]
+    for reserva in generados:
+        reserva.codigo_reserva = f"R{reserva.pk:06d}"
+    Reserva.objects.bulk_update(generados, ['codigo_reserva'], batch_size=batch_size)
+
+
+def crear_reservas_en_lote(reservas, batch_size=1000):
+    """
+    Inserta muchas reservas con bulk_create, rellenando ID, código y precio.
+
+    Los precios salen de una única consulta de precio_dia y tipo por vehículo. Como
+    bulk_create no emite señales, aquí se invalidan el índice de
+    disponibilidad y las versiones de disponibilidad y de reportes, y se
+    actualiza el resumen diario. Si alguna reserva se cruza con otra activa se
+    lanza ReservaNoDisponible y no se inserta ninguna.
+    """
+    vehiculo_ids = {reserva.vehiculo_id for reserva in reservas}
+    tarifas = {
+        pk: (precio_dia, tipo)
+        for pk, precio_dia, tipo in Vehiculo.objects.filter(pk__in=vehiculo_ids).values_list('pk', 'precio_dia', 'tipo')
+    }
+
+    codigos_generados = []
+    try:
+        with transaction.atomic():
+            if not restriccion_en_bd():
+                _comprobar_lote(reservas)
+            for reserva in reservas:
+                reserva.precio_total = cotizar(*tarifas[reserva.vehiculo_id], reserva.fecha_inicio, reserva.fecha_fin)
+            ids = asignar_ids_reserva(len(reservas))
+            if ids is None:
+                _insertar_sin_ids(reservas, batch_size, codigos_generados)
+            else:
+                for reserva, pk in zip(reservas, ids):
+                    reserva.pk = pk
+                    if not reserva.codigo_reserva:
+                        reserva.codigo_reserva = f"R{pk:06d}"
+                        codigos_generados.append(reserva)
+                Reserva.objects.bulk_create(reservas, batch_size=batch_size)
+            incrementar_version(VERSION_DISPONIBILIDAD)
+            # También incrementa VERSION_REPORTES, después del resumen
+            registrar_lote(reservas)
+            transaction.on_commit(indice_disponibilidad.invalidar)
+    except Exception as e:
+        # Sin INSERT, los IDs asignados no deben quedar en las instancias
+        for reserva in reservas:
+            reserva.pk = None
+        for reserva in codigos_generados:
+            reserva.codigo_reserva = ''
+        if isinstance(e, IntegrityError) and RESTRICCION_SOLAPAMIENTO in str(e):
+            raise ReservaNoDisponible() from e
+        raise
+    return reservas
@@ -0,0 +1,155 @@
+"""
+Resumen diario de reservas (ResumenDiario).
+
+Cada reserva cuenta en la fila (fecha local de fecha_reserva, tipo de su
+vehículo, estado) con 1 reserva, su precio_total y sus días facturables. Las
+señales de Reserva aplican la diferencia entre los valores anteriores y los
+nuevos en cada alta, edición, cambio de estado o borrado, así que el
+dashboard y los reportes agregan sobre días × tipos × estados en lugar de
+sobre todas las reservas.
+
+La diferencia se aplica al confirmarse la transacción de la reserva, en una
+transacción corta propia: las filas del resumen del día las comparten todas
+las reservas, y actualizarlas dentro de la transacción las dejaría
+bloqueadas hasta su final. Si el proceso cae entre el COMMIT y esa
+actualización, o falla (queda en el log), el resumen se desvía hasta que se
+reconstruya. El mismo callback incrementa VERSION_REPORTES después de
+escribir la diferencia: si el incremento fuera antes, un reporte pedido
+entre ambos se calcularía con el resumen anterior y quedaría en caché bajo
+la versión nueva.
+
+Los cambios que no pasan por save()/delete() (QuerySet.update, bulk_create
+fuera de crear_reservas_en_lote, cambios de tipo de un vehículo...) no se
+reflejan; el comando reconstruir_resumen_diario recalcula la tabla completa.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Reserva, ResumenDiario, Vehiculo
+from .precios import dias_facturables
+from .versiones import incrementar_version, VERSION_REPORTES
+
+ESTADOS_INGRESO = ['COMPLETADA', 'ACTIVA']
+
+
+def _contribucion(valores, tipo):
+    """Clave y aporte (reservas, ingresos, días) de una reserva a la tabla"""
+    fecha_reserva, _, estado, precio_total, fecha_inicio, fecha_fin = valores
+    clave = (timezone.localdate(fecha_reserva), tipo, estado)
+    dias = dias_facturables(fecha_inicio, fecha_fin) if fecha_inicio and fecha_fin else 0
+    return clave, (1, Decimal(precio_total or 0), dias)
+
+
+def aplicar_deltas(deltas):
+    """Suma {(fecha, tipo, estado): (reservas, ingresos, días)} a ResumenDiario"""
+    # Siempre en el mismo orden, para que dos procesos no se bloqueen entre sí
+    for (fecha, tipo, estado), (reservas, ingresos, dias) in sorted(deltas.items()):
+        if not (reservas or ingresos or dias):
+            continue
+        filtro = {'fecha': fecha, 'tipo_vehiculo': tipo, 'estado': estado}
+        cambios = {
+            'reservas': F('reservas') + reservas,
+            'ingresos': F('ingresos') + ingresos,
+            'dias_reservados': F('dias_reservados') + dias,
+        }
+        if ResumenDiario.objects.filter(**filtro).update(**cambios):
+            continue
+        try:
+            with transaction.atomic():
+                ResumenDiario.objects.create(**filtro, reservas=reservas, ingresos=ingresos, dias_reservados=dias)
+        except IntegrityError:
+            # Otro proceso creó la fila entre el UPDATE y el INSERT
+            ResumenDiario.objects.filter(**filtro).update(**cambios)
+
+
+def aplicar_al_confirmar(deltas):
+    """
+    aplicar_deltas cuando se confirme la transacción en curso (en el acto si
+    no hay) y, después, el incremento de VERSION_REPORTES
+    """
+    def aplicar():
+        try:
+            with transaction.atomic():
+                aplicar_deltas(deltas)
+        finally:
+            incrementar_version(VERSION_REPORTES)
+    transaction.on_commit(aplicar, robust=True)
+
+
+def _tipos_vehiculos(valores_reservas, instancia=None):
+    ids = {valores[1] for valores in valores_reservas if valores}
+    tipos = {}
+    if instancia is not None and Reserva.vehiculo.is_cached(instancia) and instancia.vehiculo is not None:
+        tipos[instancia.vehiculo.pk] = instancia.vehiculo.tipo
+    faltan = ids - tipos.keys()
+    if faltan:
+        tipos.update(Vehiculo.objects.filter(pk__in=faltan).values_list('pk', 'tipo'))
+    return tipos
+
+
+def valores_resumen(reserva):
+    return tuple(getattr(reserva, campo) for campo in Reserva.CAMPOS_RESUMEN)
+
+
+def registrar_cambio(anteriores, nuevos, instancia=None):
+    """
+    Aplica el paso de una reserva de `anteriores` a `nuevos` (tuplas de
+    Reserva.CAMPOS_RESUMEN; None para alta o borrado).
+    """
+    if anteriores == nuevos:
+        # Sin cambios en el resumen, pero otros campos de los reportes sí
+        incrementar_version(VERSION_REPORTES)
+        return
+    tipos = _tipos_vehiculos([anteriores, nuevos], instancia)
+    deltas = defaultdict(lambda: (0, Decimal(0), 0))
+    for valores, signo in ((anteriores, -1), (nuevos, 1)):
+        if not valores or valores[1] not in tipos:
+            continue
+        clave, (reservas, ingresos, dias) = _contribucion(valores, tipos[valores[1]])
+        acumulado = deltas[clave]
+        deltas[clave] = (acumulado[0] + signo * reservas, acumulado[1] + signo * ingresos, acumulado[2] + signo * dias)
+    aplicar_al_confirmar(dict(deltas))
+
+
+def registrar_lote(reservas):
+    """Suma al resumen reservas recién insertadas en bloque"""
+    valores = [valores_resumen(reserva) for reserva in reservas]
+    tipos = _tipos_vehiculos(valores)
+    deltas = defaultdict(lambda: (0, Decimal(0), 0))
+    for fila in valores:
+        clave, (cantidad, ingresos, dias) = _contribucion(fila, tipos[fila[1]])
+        acumulado = deltas[clave]
+        deltas[clave] = (acumulado[0] + cantidad, acumulado[1] + ingresos, acumulado[2] + dias)
+    aplicar_al_confirmar(dict(deltas))
+
+
+def reconstruir_resumen(chunk_size=5000):
+    """
+    Recalcula ResumenDiario desde cero recorriendo las reservas en streaming;
+    la memoria depende del número de filas del resumen, no de reservas.
+    """
+    with transaction.atomic():
+        tipos = dict(Vehiculo.objects.values_list('pk', 'tipo'))
+        filas = defaultdict(lambda: [0, Decimal(0), 0])
+        reservas = Reserva.objects.order_by().values_list(*Reserva.CAMPOS_RESUMEN)
+        for valores in reservas.iterator(chunk_size=chunk_size):
+            clave, (cantidad, ingresos, dias) = _contribucion(valores, tipos[valores[1]])
+            fila = filas[clave]
+            fila[0] += cantidad
+            fila[1] += ingresos
+            fila[2] += dias
+
+        ResumenDiario.objects.all().delete()
+        ResumenDiario.objects.bulk_create([
+            ResumenDiario(
+                fecha=fecha, tipo_vehiculo=tipo, estado=estado,
+                reservas=cantidad, ingresos=ingresos, dias_reservados=dias,
+            )
+            for (fecha, tipo, estado), (cantidad, ingresos, dias) in filas.items()
+        ], batch_size=2000)
+        incrementar_version(VERSION_REPORTES)
+    return len(filas)
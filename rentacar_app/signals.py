@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Cliente, Reserva, Vehiculo
+from .disponibilidad import indice_disponibilidad
+from .resumen import registrar_cambio, valores_resumen
+from .versiones import (
+    incrementar_version, VERSION_DISPONIBILIDAD, VERSION_REPORTES, VERSION_RESERVAS_ELIMINADAS,
+)
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_indice_reserva(sender, instance, **kwargs):
+    """Actualiza el índice de disponibilidad cuando se confirma la transacción"""
+    datos = (instance.id, instance.vehiculo_id, instance.estado, instance.fecha_inicio, instance.fecha_fin)
+    transaction.on_commit(lambda: indice_disponibilidad.actualizar_reserva(*datos))
+
+
+@receiver(post_delete, sender=Reserva)
+def quitar_reserva_del_indice(sender, instance, **kwargs):
+    reserva_id = instance.id
+    transaction.on_commit(lambda: indice_disponibilidad.eliminar_reserva(reserva_id))
+
+
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+@receiver(post_save, sender=Vehiculo)
+@receiver(post_delete, sender=Vehiculo)
+def incrementar_version_disponibilidad(sender, **kwargs):
+    """Invalida los ETag de las vistas de disponibilidad"""
+    incrementar_version(VERSION_DISPONIBILIDAD)
+
+
+@receiver(post_save, sender=Vehiculo)
+@receiver(post_delete, sender=Vehiculo)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def incrementar_version_reportes(sender, **kwargs):
+    """
+    Invalida los reportes en caché. Para Reserva lo hace resumen.py, después
+    de aplicar la diferencia al resumen diario
+    """
+    incrementar_version(VERSION_REPORTES)
+
+
+@receiver(post_delete, sender=Reserva)
+def incrementar_version_eliminadas(sender, **kwargs):
+    """Las bajas no se pueden detectar por fecha_actualizacion"""
+    incrementar_version(VERSION_RESERVAS_ELIMINADAS)
+
+
+@receiver(pre_save, sender=Reserva)
+def leer_valores_resumen(sender, instance, **kwargs):
+    """Valores previos de una reserva que no se cargó con from_db ni es nueva"""
+    if hasattr(instance, '_valores_resumen'):
+        return
+    instance._valores_resumen = Reserva.objects.filter(pk=instance.pk).values_list(*Reserva.CAMPOS_RESUMEN).first()
+
+
+@receiver(post_save, sender=Reserva)
+def actualizar_resumen_diario(sender, instance, created, **kwargs):
+    anteriores = None if created else getattr(instance, '_valores_resumen', None)
+    nuevos = valores_resumen(instance)
+    registrar_cambio(anteriores, nuevos, instance)
+    instance._valores_resumen = nuevos
+
+
+@receiver(post_delete, sender=Reserva)
+def descontar_resumen_diario(sender, instance, **kwargs):
+    registrar_cambio(getattr(instance, '_valores_resumen', None) or valores_resumen(instance), None, instance)
@@ -0,0 +1,272 @@
+"""
+Generación de reportes en segundo plano.
+
+La cola es la propia tabla Reporte: views.reportes crea una fila PENDIENTE y
+responde de inmediato. Un trabajador la reclama con un UPDATE condicional
+(PENDIENTE -> PROCESANDO), calcula los datos, genera el PDF en el pool de
+procesos.py (esperando turno, sin ocupar la cola de las vistas) y guarda
+ambos en la fila, que queda COMPLETADO o ERROR. El detalle de reservas en
+PDF (encolar_detalle) y los contratos en lote (encolar_contratos), que
+pueden tardar minutos, usan la misma cola.
+No hace falta ningún broker externo.
+
+Cada proceso web tiene un pool de REPORTES_TRABAJADORES hilos que se despierta
+al encolar y al consultar el estado de un trabajo. El comando
+procesar_reportes drena la cola desde otro proceso (cron o trabajador
+dedicado), que es lo que conviene en despliegues serverless, donde los hilos
+no sobreviven a la respuesta. Un trabajo que lleva más de
+REPORTES_TIEMPO_MAXIMO segundos en PROCESANDO se da por abandonado y se vuelve
+a reclamar.
+"""
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .almacenamiento import guardar_archivo
+from .cache_reportes import generar_datos_reporte, normalizar_parametros, sello_datos
+from .contratos import comprobar_lote_contratos, generar_lote_contratos
+from .instrumentacion import guardar_metricas, recolectar_metricas
+from .models import Reporte
+from .procesos import ejecutar_en_proceso, esperar, renderizar_detalle_pdf, renderizar_pdf
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_EN_CURSO = ['PENDIENTE', 'PROCESANDO']
+# Detalle de reservas en PDF (exportacion.exportar_pdf); sus datos son el filtro
+TIPO_DETALLE = 'DETALLE'
+# Contratos en lote (contratos.generar_lote_contratos); sus datos son códigos y formato
+TIPO_CONTRATOS = 'CONTRATOS'
+# Trabajos cuyo resultado es solo el archivo, sin datos que mostrar
+TIPOS_SOLO_ARCHIVO = (TIPO_DETALLE, TIPO_CONTRATOS)
+
+
+def encolar_reporte(tipo, fecha_inicio, fecha_fin, usuario):
+    """
+    Devuelve el trabajo de (tipo, fechas) para la versión actual de los datos:
+    uno en curso o ya terminado con PDF si existe, o uno nuevo PENDIENTE.
+    Lanza ValueError si los parámetros no son válidos.
+    """
+    tipo, fecha_inicio, fecha_fin = normalizar_parametros(tipo, fecha_inicio, fecha_fin)
+    sello = sello_datos()
+    reporte = Reporte.objects.filter(
+        Q(estado__in=ESTADOS_EN_CURSO) | Q(estado='COMPLETADO', archivo_pdf__gt=''),
+        tipo=tipo, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, version_datos=sello,
+    ).order_by('-id').first()
+    if reporte is None:
+        reporte = Reporte.objects.create(
+            tipo=tipo,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            version_datos=sello,
+            estado='PENDIENTE',
+            generado_por=usuario,
+        )
+    if reporte.estado in ESTADOS_EN_CURSO:
+        procesador_reportes.notificar()
+    return reporte
+
+
+def encolar_detalle(fecha_inicio, fecha_fin, estados, usuario):
+    """
+    Trabajo del detalle de reservas en PDF con reserva entre fecha_inicio y
+    fecha_fin y en `estados` (todos si está vacío), para la versión actual de
+    los datos: uno en curso o ya terminado con el mismo filtro si existe, o
+    uno nuevo PENDIENTE. Los estados se guardan en datos.
+    """
+    sello = sello_datos()
+    filtro = {'estados': sorted(set(estados))}
+    candidatos = Reporte.objects.filter(
+        Q(estado__in=ESTADOS_EN_CURSO) | Q(estado='COMPLETADO', archivo_pdf__gt=''),
+        tipo=TIPO_DETALLE, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, version_datos=sello,
+    ).order_by('-id')[:10]
+    reporte = next((candidato for candidato in candidatos if candidato.datos.get('estados') == filtro['estados']), None)
+    if reporte is None:
+        reporte = Reporte.objects.create(
+            tipo=TIPO_DETALLE,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            datos=filtro,
+            version_datos=sello,
+            estado='PENDIENTE',
+            generado_por=usuario,
+        )
+    if reporte.estado in ESTADOS_EN_CURSO:
+        procesador_reportes.notificar()
+    return reporte
+
+
+def encolar_contratos(fecha_inicio, fecha_fin, codigos, formato, usuario):
+    """
+    Trabajo de los contratos de un rango de fechas de inicio o de una lista
+    de códigos, como encolar_detalle. Lanza ValueError si el formato o el
+    filtro no son válidos, o si el lote está vacío o supera
+    CONTRATOS_LOTE_MAXIMO, antes de crear el trabajo.
+    """
+    fecha_inicio = date.fromisoformat(fecha_inicio) if fecha_inicio else None
+    fecha_fin = date.fromisoformat(fecha_fin) if fecha_fin else None
+    codigos = sorted(set(codigos or ()))
+    comprobar_lote_contratos(fecha_inicio, fecha_fin, codigos, formato)
+    sello = sello_datos()
+    filtro = {'codigos': codigos, 'formato': formato}
+    candidatos = Reporte.objects.filter(
+        Q(estado__in=ESTADOS_EN_CURSO) | Q(estado='COMPLETADO', archivo_pdf__gt=''),
+        tipo=TIPO_CONTRATOS, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, version_datos=sello,
+    ).order_by('-id')[:10]
+    reporte = next((
+        candidato for candidato in candidatos
+        if {clave: candidato.datos.get(clave) for clave in filtro} == filtro
+    ), None)
+    if reporte is None:
+        reporte = Reporte.objects.create(
+            tipo=TIPO_CONTRATOS,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            datos=filtro,
+            version_datos=sello,
+            estado='PENDIENTE',
+            generado_por=usuario,
+        )
+    if reporte.estado in ESTADOS_EN_CURSO:
+        procesador_reportes.notificar()
+    return reporte
+
+
+def _reclamables():
+    limite = timezone.now() - timedelta(seconds=getattr(settings, 'REPORTES_TIEMPO_MAXIMO', 600))
+    return Q(estado='PENDIENTE') | Q(estado='PROCESANDO', fecha_proceso__lt=limite)
+
+
+def reclamar_siguiente():
+    """Marca como PROCESANDO el trabajo más antiguo disponible y lo devuelve"""
+    candidatos = list(Reporte.objects.filter(_reclamables()).order_by('id').values_list('pk', flat=True)[:10])
+    for pk in candidatos:
+        # Solo uno de los trabajadores que compiten gana el UPDATE
+        if Reporte.objects.filter(_reclamables(), pk=pk).update(estado='PROCESANDO', fecha_proceso=timezone.now()):
+            return Reporte.objects.get(pk=pk)
+    return None
+
+
+def _datos_existentes(reporte):
+    """Datos de un reporte web ya generado con la misma clave y versión"""
+    return Reporte.objects.filter(
+        tipo=reporte.tipo, fecha_inicio=reporte.fecha_inicio, fecha_fin=reporte.fecha_fin,
+        version_datos=reporte.version_datos, estado='COMPLETADO', datos__isnull=False,
+    ).exclude(pk=reporte.pk).values_list('datos', flat=True).order_by('-id').first()
+
+
+def _procesar_detalle(reporte):
+    """
+    Escribe el PDF del detalle en un archivo temporal desde el pool (esperando
+    turno, como el resto de trabajos) y lo guarda sin cargarlo en memoria
+    """
+    fd, ruta = tempfile.mkstemp(suffix='.pdf')
+    os.close(fd)
+    try:
+        argumentos = (ruta, reporte.fecha_inicio, reporte.fecha_fin, reporte.datos['estados'])
+        filas, metricas = esperar(ejecutar_en_proceso(renderizar_detalle_pdf, *argumentos), renderizar_detalle_pdf, *argumentos)
+        guardar_metricas(metricas, reporte)
+        with open(ruta, 'rb') as archivo:
+            nombre = f'reservas_{reporte.fecha_inicio or "inicio"}_{reporte.fecha_fin or "fin"}_{reporte.pk}.pdf'
+            # No se puede volver a generar en la descarga: sin archivo, el trabajo falla
+            if not guardar_archivo(reporte.archivo_pdf, nombre, File(archivo)):
+                raise OSError('No se pudo guardar el PDF del detalle')
+    finally:
+        os.remove(ruta)
+    reporte.datos = {**reporte.datos, 'filas': filas}
+
+
+def _procesar_contratos(reporte):
+    """Genera el ZIP o PDF del lote y lo guarda; sin archivo, el trabajo falla"""
+    contenido, nombre, cantidad = generar_lote_contratos(
+        reporte.fecha_inicio, reporte.fecha_fin, reporte.datos['codigos'], reporte.datos['formato']
+    )
+    base, extension = os.path.splitext(nombre)
+    if not guardar_archivo(reporte.archivo_pdf, f'{base}_{reporte.pk}{extension}', contenido):
+        raise OSError('No se pudo guardar el archivo de contratos')
+    reporte.datos = {**reporte.datos, 'archivo': nombre, 'contratos': cantidad}
+
+
+def _procesar_datos(reporte):
+    with recolectar_metricas(reporte):
+        datos = _datos_existentes(reporte)
+        if datos is None:
+            datos = generar_datos_reporte(reporte.tipo, reporte.fecha_inicio, reporte.fecha_fin)
+    pdf, metricas = esperar(ejecutar_en_proceso(renderizar_pdf, datos, reporte.tipo), renderizar_pdf, datos, reporte.tipo)
+    guardar_metricas(metricas, reporte)
+    reporte.datos = datos
+    # Si no se puede guardar, la descarga lo vuelve a generar desde los datos
+    guardar_archivo(reporte.archivo_pdf, f'reporte_{reporte.tipo}_{reporte.pk}.pdf', pdf)
+
+
+def procesar_reporte(reporte):
+    """Calcula los datos y el PDF de un trabajo reclamado"""
+    try:
+        if reporte.tipo == TIPO_DETALLE:
+            _procesar_detalle(reporte)
+        elif reporte.tipo == TIPO_CONTRATOS:
+            _procesar_contratos(reporte)
+        else:
+            _procesar_datos(reporte)
+        reporte.estado = 'COMPLETADO'
+        reporte.error = ''
+        reporte.save(update_fields=['datos', 'archivo_pdf', 'estado', 'error'])
+    except Exception as e:
+        logger.exception('Error generando el reporte %s', reporte.pk)
+        Reporte.objects.filter(pk=reporte.pk).update(estado='ERROR', error=str(e)[:1000])
+
+
+def procesar_pendientes(maximo=None):
+    """Procesa trabajos hasta vaciar la cola (o llegar a `maximo`); devuelve cuántos"""
+    procesados = 0
+    while maximo is None or procesados < maximo:
+        reporte = reclamar_siguiente()
+        if reporte is None:
+            break
+        procesar_reporte(reporte)
+        procesados += 1
+    return procesados
+
+
+class ProcesadorReportes:
+    """Pool de hilos del proceso web que drena la cola de reportes"""
+
+    def __init__(self):
+        self._executor = None
+        self._activos = 0
+        self._lock = threading.Lock()
+
+    def trabajadores(self):
+        return getattr(settings, 'REPORTES_TRABAJADORES', 2)
+
+    def notificar(self):
+        """Despierta un hilo si hay alguno libre (no hace nada con 0 trabajadores)"""
+        maximo = self.trabajadores()
+        with self._lock:
+            if maximo <= 0 or self._activos >= maximo:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=maximo, thread_name_prefix='reportes')
+            self._activos += 1
+        self._executor.submit(self._drenar)
+
+    def _drenar(self):
+        try:
+            procesar_pendientes()
+        except Exception:
+            logger.exception('Error en el trabajador de reportes')
+        finally:
+            with self._lock:
+                self._activos -= 1
+            connections.close_all()
+
+
+procesador_reportes = ProcesadorReportes()
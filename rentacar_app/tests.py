@@ -1,3 +1,1151 @@
-from django.test import TestCase
+import calendar
+import csv
+import errno
+import hashlib
+import importlib
+import io
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from xml.sax.saxutils import escape
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import Count, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+from . import procesos, resumen, tareas, utils
+from .cache_reportes import CacheReportes, cache_reportes
+from .contratos import contrato_vigente
+from .disponibilidad import (
+    CalendarioOcupacion, IndiceDisponibilidad, _DatosIndice, _IntervalosVehiculo, vehiculo_disponible, ventanas_libres,
+)
+from .exportacion import COLUMNAS_EXPORTACION, exportar_csv, exportar_ndjson, reservas_exportacion
+from .ocupacion import calcular_ocupacion
+from .paquetes import TIPOS_PAQUETE, generar_paquete
+from .reservas import (
+    ReservaNoDisponible, asignar_ids_reserva, contar_solapamientos, crear_reservas_en_lote, guardar_reserva_atomica,
+)
+from .versiones import incrementar_version, obtener_version, VERSION_DISPONIBILIDAD, VERSION_REPORTES
+from .management.commands import _sinteticos
+from .precios import Tarifario, cotizar, cotizar_varios, dias_facturables
+from .models import Cliente, Contrato, Reporte, Reserva, ResumenDiario, TurnoPDF, Vehiculo
+from .views import MAX_CONSULTAS_LOTE
+from .utils import generar_reporte_clientes, generar_reporte_pdf, generar_reporte_vehiculos
+
+
+def crear_clientes(desde, hasta):
+    """Crea clientes con índices [desde, hasta); la mitad con la licencia vencida"""
+    hoy = timezone.localdate()
+    usuarios = User.objects.bulk_create(
+        [User(username=f'cliente_{i}', first_name='Cliente', last_name=str(i)) for i in range(desde, hasta)],
+        batch_size=5000,
+    )
+    Cliente.objects.bulk_create([
+        Cliente(
+            usuario=usuario,
+            cedula_identidad=str(i),
+            telefono='70000000',
+            direccion='Santa Cruz',
+            licencia_conducir=f'L{i}',
+            fecha_vencimiento_licencia=hoy + timedelta(days=30 if i % 2 else -30),
+        )
+        for i, usuario in zip(range(desde, hasta), usuarios)
+    ], batch_size=5000)
+
+
+class ReporteClientesTests(TestCase):
+    def test_numero_de_consultas_constante(self):
+        crear_clientes(0, 100)
+        with CaptureQueriesContext(connection) as consultas_100:
+            datos = generar_reporte_clientes()
+        self.assertEqual(datos['total_clientes'], 100)
+        self.assertEqual(datos['clientes_con_licencia_valida'], 50)
+        self.assertEqual(datos['clientes_sin_licencia_valida'], 50)
+
+        # Escala reducida (100 -> 10.000) para que la suite siga siendo rápida;
+        # con 100.000 clientes el número de consultas es el mismo, pero solo
+        # crearlos con el ORM tarda unos 17 s.
+        crear_clientes(100, 10_000)
+        with CaptureQueriesContext(connection) as consultas_10k:
+            datos = generar_reporte_clientes()
+        self.assertEqual(datos['total_clientes'], 10_000)
+        self.assertEqual(datos['clientes_con_licencia_valida'], 5_000)
+        self.assertEqual(datos['clientes_sin_licencia_valida'], 5_000)
+
+        self.assertEqual(len(consultas_10k), len(consultas_100))
+        self.assertLessEqual(len(consultas_100), 5)
+
+    def test_altas_por_año_y_mes(self):
+        crear_clientes(0, 10)
+        datos = generar_reporte_clientes()
+        año = timezone.localdate().year
+        self.assertEqual(datos['clientes_por_año'], [{'año': str(año), 'total': 10}])
+        self.assertEqual(len(datos['clientes_por_mes']), 12)
+        self.assertEqual(sum(item['total'] for item in datos['clientes_por_mes']), 10)
+
+
+class ReporteVehiculosTests(TestCase):
+    def setUp(self):
+        clientes = _sinteticos.crear_clientes(3, 'flota')
+        flota = _sinteticos.crear_flota(12, 'F')
+        _sinteticos.crear_reservas(flota[:-2], clientes, 80, dias_rango=120)
+        Vehiculo.objects.filter(pk=flota[0].pk).update(estado='MANTENIMIENTO')
+
+    def test_numero_de_consultas_constante(self):
+        with CaptureQueriesContext(connection) as consultas_12:
+            generar_reporte_vehiculos()
+        clientes = _sinteticos.crear_clientes(3, 'mas')
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(40, 'G'), clientes, 300, dias_rango=120, prefijo='G')
+        with CaptureQueriesContext(connection) as consultas_52:
+            datos = generar_reporte_vehiculos()
+        self.assertEqual(datos['total_vehiculos'], 52)
+        self.assertEqual(len(consultas_52), len(consultas_12))
+        self.assertEqual(len(consultas_12), 1)
+        # El PDF sale solo de los datos, sin tocar la base
+        with self.assertNumQueries(0):
+            pdf = generar_reporte_pdf(datos, 'VEHICULOS')
+        self.assertTrue(pdf.getvalue().startswith(b'%PDF'))
+
+    def test_coincide_con_los_totales_por_vehiculo(self):
+        datos = generar_reporte_vehiculos()
+        # Como antes: una consulta por vehículo
+        reservas = {v.placa: v.reservas.count() for v in Vehiculo.objects.all()}
+        ingresos = {
+            v.placa: v.reservas.aggregate(total=Sum('precio_total'))['total'] for v in Vehiculo.objects.all()
+        }
+        # Los empates pueden salir en otro orden: se comparan valores y placas
+        self.assertEqual(
+            [fila['num_reservas'] for fila in datos['vehiculos_mas_rentados']],
+            sorted(reservas.values(), reverse=True)[:5],
+        )
+        for fila in datos['vehiculos_mas_rentados']:
+            self.assertEqual(fila['num_reservas'], reservas[fila['placa']])
+        self.assertEqual(
+            [fila['total_ingresos'] for fila in datos['ingresos_por_vehiculo']],
+            [float(total) for total in sorted((t for t in ingresos.values() if t is not None), reverse=True)[:5]],
+        )
+        for fila in datos['ingresos_por_vehiculo']:
+            self.assertEqual(fila['total_ingresos'], float(ingresos[fila['placa']]))
+        self.assertEqual(
+            {fila['estado']: fila['total'] for fila in datos['vehiculos_por_estado']},
+            dict(Vehiculo.objects.values_list('estado').annotate(total=Count('id'))),
+        )
+        self.assertEqual(
+            {fila['tipo']: fila['total'] for fila in datos['vehiculos_por_tipo']},
+            dict(Vehiculo.objects.values_list('tipo').annotate(total=Count('id'))),
+        )
+        self.assertEqual((datos['vehiculos_disponibles'], datos['vehiculos_mantenimiento']), (11, 1))
+
+
+class TarifarioTests(SimpleTestCase):
+    @override_settings(TARIFA_FACTOR_TIPO={'SUV': 1.15}, TARIFA_FACTOR_FIN_DE_SEMANA=1.1,
+                       TARIFA_FACTOR_MES={12: 1.2}, TARIFA_DESCUENTOS_DURACION=[(7, 0.05)])
+    def test_los_importes_no_pierden_centavos(self):
+        # Lunes a miércoles de enero: 50.50 × 3 × 1.15 = 174.225
+        inicio = timezone.make_aware(datetime(2027, 1, 4, 10))
+        self.assertEqual(cotizar(Decimal('50.50'), 'SUV', inicio, inicio + timedelta(days=3)), Decimal('174.23'))
+        # Del viernes 24 al jueves 30 de diciembre: (5 × 1.2 + 2 × 1.2 × 1.1) × 0.95
+        inicio = timezone.make_aware(datetime(2027, 12, 24, 10))
+        esperado = (Decimal('333.33') * (5 * Decimal('1.2') + 2 * Decimal('1.32')) * Decimal('0.95')).quantize(Decimal('0.01'))
+        self.assertEqual(cotizar(Decimal('333.33'), 'SEDAN', inicio, inicio + timedelta(days=7)), esperado)
+        self.assertEqual(cotizar_varios([(Decimal('333.33'), 'SEDAN')], [(inicio, inicio + timedelta(days=7))]), [[esperado]])
+
+    def test_fuera_del_horizonte_suma_igual(self):
+        tarifario = Tarifario({}, '1.1', {12: '1.2'}, [], 30, hoy=date(2027, 12, 1))
+        dentro = tarifario.suma_factores(date(2027, 12, 10), 10)
+        tarifario.acumulado = [Decimal(0)]
+        self.assertEqual(tarifario.suma_factores(date(2027, 12, 10), 10), dentro)
+
+    def test_duracion_y_dias_facturables(self):
+        inicio = timezone.now()
+        reserva = Reserva(fecha_inicio=inicio, fecha_fin=inicio + timedelta(hours=5))
+        self.assertEqual(reserva.duracion_dias, 0)
+        self.assertEqual(dias_facturables(reserva.fecha_inicio, reserva.fecha_fin), 1)
+
+
+@override_settings(REPORTES_PROCESOS=2, PDF_TURNOS=0)
+class PoolProcesosTests(SimpleTestCase):
+    def setUp(self):
+        parches = [mock.patch.object(procesos, '_pool', None), mock.patch.object(procesos, '_pool_no_disponible', False)]
+        for parche in parches:
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def test_sin_semaforos_se_genera_en_el_proceso(self):
+        sin_semaforos = OSError(errno.ENOSYS, 'Function not implemented')
+        with mock.patch('multiprocessing.synchronize.SemLock.__init__', side_effect=sin_semaforos), \
+                self.assertLogs('rentacar_app.procesos', 'ERROR'):
+            futuro = procesos.ejecutar_en_proceso(pow, 2, 10)
+        self.assertEqual(futuro.result(), 1024)
+        self.assertTrue(procesos._pool_no_disponible)
+        # No se vuelve a intentar crear el pool
+        with mock.patch.object(procesos, 'ProcessPoolExecutor') as pool:
+            self.assertIsNone(procesos.obtener_pool())
+            self.assertEqual(procesos.renderizar(pow, 3, 2), 9)
+        pool.assert_not_called()
+
+
+class PoolDetenido:
+    """Pool cuyos trabajos no terminan nunca"""
+
+    def submit(self, funcion, *args):
+        return Future()
+
+
+@override_settings(REPORTES_PROCESOS=1, PDF_COLA_MAXIMA=0, PDF_TIEMPO_MAXIMO=0.05, MEDIA_ROOT=tempfile.gettempdir())
+class ColaPDFTests(TestCase):
+    def setUp(self):
+        clientes = _sinteticos.crear_clientes(1, 'pdf')
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'P'), clientes, 2, dias_rango=30)
+        self.reservas = list(Reserva.objects.order_by('pk'))
+        self.client.force_login(User.objects.create_user('empleado_pdf'))
+        for parche in (mock.patch.object(procesos, 'obtener_pool', return_value=PoolDetenido()),
+                       mock.patch.object(procesos, '_cola', procesos.ColaPDF())):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def test_pdf_que_tarda_demasiado_responde_503(self):
+        respuesta = self.client.get(reverse('descargar_contrato', args=[self.reservas[0].pk]))
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta['Retry-After'], '5')
+        self.assertEqual(procesos.estado_pool()['tiempos_agotados'], 1)
+
+    def test_cola_llena_responde_503_sin_esperar(self):
+        # El trabajo que tardó demasiado sigue ocupando el único proceso
+        self.client.get(reverse('descargar_contrato', args=[self.reservas[0].pk]))
+        with mock.patch.object(procesos, 'esperar') as esperar:
+            respuesta = self.client.get(reverse('descargar_contrato', args=[self.reservas[1].pk]))
+        esperar.assert_not_called()
+        self.assertEqual(respuesta.status_code, 503)
+        estado = procesos.estado_pool()
+        self.assertEqual((estado['en_proceso'], estado['rechazados']), (1, 1))
+
+    @override_settings(REPORTES_PROCESOS=2, PDF_TURNOS=1)
+    def test_sin_turno_global_responde_503_aunque_haya_sitio_local(self):
+        # Otro proceso está generando un PDF con el único turno
+        TurnoPDF.objects.create(numero=1, ocupado_hasta=timezone.now() + timedelta(minutes=5))
+        with mock.patch.object(procesos, 'esperar') as esperar:
+            respuesta = self.client.get(reverse('descargar_contrato', args=[self.reservas[0].pk]))
+        esperar.assert_not_called()
+        self.assertEqual(respuesta.status_code, 503)
+        estado = procesos.estado_pool()
+        self.assertEqual((estado['en_proceso'], estado['rechazados'], estado['turnos_ocupados']), (0, 1, 1))
+
+    @override_settings(PDF_TURNOS=1)
+    def test_turno_vencido_se_recupera(self):
+        # El proceso que lo tenía murió sin liberarlo
+        TurnoPDF.objects.create(numero=1, ocupado_hasta=timezone.now() - timedelta(seconds=1))
+        with mock.patch.object(procesos, 'obtener_pool', return_value=None):
+            self.assertEqual(procesos.renderizar(pow, 2, 3), 8)
+        self.assertIsNone(TurnoPDF.objects.get(numero=1).ocupado_hasta)
+
+
+class VersionesTests(TestCase):
+    def test_la_version_se_incrementa_al_confirmar(self):
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'V'), _sinteticos.crear_clientes(1, 'version'), 1, dias_rango=30)
+        reserva = Reserva.objects.get()
+        antes, _ = obtener_version(VERSION_DISPONIBILIDAD)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.estado = 'CONFIRMADA'
+            reserva.save()
+            # Dentro de la transacción la fila del contador no se toca
+            self.assertEqual(obtener_version(VERSION_DISPONIBILIDAD)[0], antes)
+        self.assertGreater(obtener_version(VERSION_DISPONIBILIDAD)[0], antes)
+
+    def test_un_incremento_por_transaccion(self):
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'V'), _sinteticos.crear_clientes(1, 'version'), 2, dias_rango=30)
+        antes, _ = obtener_version(VERSION_REPORTES)
+        with self.captureOnCommitCallbacks(execute=True):
+            for reserva in Reserva.objects.all():
+                reserva.save()
+            Cliente.objects.get().save()
+        self.assertEqual(obtener_version(VERSION_REPORTES)[0], antes + 1)
+
+    def test_un_savepoint_deshecho_no_pierde_ni_repite_incrementos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ReservaNoDisponible), transaction.atomic():
+                incrementar_version('prueba_deshecha')
+                raise ReservaNoDisponible()
+        self.assertEqual(obtener_version('prueba_deshecha')[0], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            incrementar_version('prueba')
+            incrementar_version('prueba')
+        self.assertEqual((obtener_version('prueba')[0], obtener_version('prueba_deshecha')[0]), (1, 1))
+
+
+class ResumenDiarioTests(TestCase):
+    def test_el_resumen_se_actualiza_al_confirmar(self):
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'R'), _sinteticos.crear_clientes(1, 'resumen'), 1, dias_rango=30)
+        datos = Reserva.objects.values('cliente_id', 'vehiculo_id', 'fecha_inicio', 'fecha_fin', 'precio_total').get()
+        Reserva.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = Reserva.objects.create(codigo_reserva='RES1', estado='PENDIENTE', **datos)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.estado = 'CONFIRMADA'
+            reserva.save()
+            # Dentro de la transacción las filas compartidas no se tocan
+            self.assertFalse(ResumenDiario.objects.filter(estado='CONFIRMADA').exists())
+        por_estado = dict(ResumenDiario.objects.values_list('estado', 'reservas'))
+        self.assertEqual(por_estado, {'PENDIENTE': 0, 'CONFIRMADA': 1})
+
+    def test_la_version_de_reportes_sube_despues_del_resumen(self):
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'R'), _sinteticos.crear_clientes(1, 'resumen'), 1, dias_rango=30)
+        reserva = Reserva.objects.get()
+        antes, _ = obtener_version(VERSION_REPORTES)
+        vistas = []
+        original = resumen.aplicar_deltas
+
+        def aplicar_deltas(deltas):
+            vistas.append(obtener_version(VERSION_REPORTES)[0])
+            original(deltas)
+
+        with mock.patch.object(resumen, 'aplicar_deltas', aplicar_deltas), self.captureOnCommitCallbacks(execute=True):
+            reserva.estado = 'CANCELADA' if reserva.estado != 'CANCELADA' else 'CONFIRMADA'
+            reserva.save()
+            Cliente.objects.get().save()
+        # Un reporte pedido mientras se escribe el resumen queda en caché bajo
+        # una versión que se abandona en cuanto el resumen está al día
+        self.assertEqual(len(vistas), 1)
+        self.assertGreater(obtener_version(VERSION_REPORTES)[0], vistas[0])
+
+
+class DisponibilidadApiTests(TestCase):
+    def test_el_cursor_recorre_todos_los_vehiculos(self):
+        flota = _sinteticos.crear_flota(5, 'D')
+        self.client.force_login(User.objects.create_user('empleado_disponibilidad'))
+        hoy = timezone.localdate()
+        url = f"{reverse('api_disponibilidad')}?fecha_inicio={hoy}&fecha_fin={hoy + timedelta(days=2)}&limite=2&orden=precio"
+        ids, cursor, paginas = [], None, 0
+        while True:
+            datos = self.client.get(url + (f'&cursor={cursor}' if cursor else '')).json()
+            ids += [vehiculo['id'] for vehiculo in datos['vehiculos']]
+            paginas += 1
+            cursor = datos['siguiente']
+            if not cursor:
+                break
+        self.assertEqual(paginas, 3)
+        self.assertCountEqual(ids, [vehiculo.pk for vehiculo in flota])
+
+    def _consultar_lote(self, consultas):
+        return self.client.post(
+            reverse('api_disponibilidad_lote'), json.dumps({'consultas': consultas}), content_type='application/json'
+        )
+
+    def test_el_lote_responde_cada_consulta_y_marca_las_invalidas(self):
+        flota = _sinteticos.crear_flota(3, 'B')
+        cliente = _sinteticos.crear_clientes(1, 'lote')[0]
+        self.client.force_login(User.objects.create_user('empleado_lote'))
+        hoy = timezone.localdate()
+        inicio, fin = hoy + timedelta(days=3), hoy + timedelta(days=5)
+        Reserva.objects.create(
+            cliente=cliente, vehiculo=flota[0], estado='CONFIRMADA',
+            fecha_inicio=timezone.make_aware(datetime.combine(inicio, datetime.min.time())),
+            fecha_fin=timezone.make_aware(datetime.combine(fin, datetime.min.time())),
+        )
+        consultas = [
+            {'fecha_inicio': str(inicio), 'fecha_fin': str(fin)},
+            {'fecha_inicio': str(inicio), 'fecha_fin': '2025-02-30'},
+            {'fecha_inicio': str(inicio)},
+            'no es un objeto',
+            {'fecha_inicio': str(inicio), 'fecha_fin': str(fin), 'capacidad_min': 'cinco'},
+            {'fecha_inicio': str(hoy + timedelta(days=30)), 'fecha_fin': str(hoy + timedelta(days=32)),
+             'tipo': flota[0].tipo, 'capacidad_min': 1},
+        ]
+        respuesta = self._consultar_lote(consultas)
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        resultados = datos['resultados']
+        self.assertEqual(len(resultados), len(consultas))
+
+        error = {'error': 'Consulta con fechas o capacidad inválidas'}
+        self.assertEqual(resultados[1:5], [error] * 4)
+        self.assertEqual(resultados[0]['vehiculos'], [flota[1].pk, flota[2].pk])
+        self.assertNotIn('error', resultados[0])
+        self.assertEqual(resultados[5]['vehiculos'], [flota[0].pk])
+        self.assertEqual(resultados[5]['capacidad_min'], 1)
+        self.assertEqual(
+            resultados[5]['precios'][str(flota[0].pk)],
+            float(cotizar(flota[0].precio_dia, flota[0].tipo, *(datetime.strptime(consultas[5][campo], '%Y-%m-%d')
+                                                                 for campo in ('fecha_inicio', 'fecha_fin')))),
+        )
+        self.assertCountEqual(datos['vehiculos'], [str(vehiculo.pk) for vehiculo in flota])
+
+    def test_el_lote_tiene_un_maximo_de_consultas(self):
+        self.client.force_login(User.objects.create_user('empleado_lote'))
+        consulta = {'fecha_inicio': '2030-01-01', 'fecha_fin': '2030-01-03'}
+        self.assertEqual(self._consultar_lote([consulta] * MAX_CONSULTAS_LOTE).status_code, 200)
+        respuesta = self._consultar_lote([consulta] * (MAX_CONSULTAS_LOTE + 1))
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json(), {'error': f'Máximo {MAX_CONSULTAS_LOTE} consultas por petición'})
+        self.assertEqual(self._consultar_lote([]).status_code, 400)
+
+    def test_el_etag_describe_el_indice_con_el_que_se_respondio(self):
+        vehiculo = _sinteticos.crear_flota(1, 'E')[0]
+        cliente = _sinteticos.crear_clientes(1, 'etag')[0]
+        self.client.force_login(User.objects.create_user('empleado_etag'))
+        hoy = timezone.localdate()
+        url = f"{reverse('disponibilidad_vehiculos')}?fecha_inicio={hoy}&fecha_fin={hoy + timedelta(days=2)}"
+        # Índice propio: no recibe las señales, como el de otro proceso
+        indice = IndiceDisponibilidad()
+        with mock.patch('rentacar_app.views.indice_disponibilidad', indice), \
+                mock.patch('rentacar_app.disponibilidad.indice_disponibilidad', indice):
+            respuesta = self.client.get(url)
+            self.assertContains(respuesta, vehiculo.placa)
+            etag = respuesta['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                Reserva.objects.create(
+                    cliente=cliente, vehiculo=vehiculo, estado='CONFIRMADA',
+                    fecha_inicio=timezone.now(), fecha_fin=timezone.now() + timedelta(days=5),
+                )
+            # Otro hilo está refrescando: se responde con el índice anterior
+            # y su versión, así que el navegador puede quedarse con su copia
+            with indice._lock_reconstruccion:
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertNotContains(respuesta, vehiculo.placa)
+            self.assertTrue(respuesta['ETag'].startswith(f'"{obtener_version(VERSION_DISPONIBILIDAD)[0]}-'))
+
+
+class IntervalosVehiculoTests(SimpleTestCase):
+    def test_los_extremos_se_cruzan(self):
+        intervalos = _IntervalosVehiculo()
+        intervalos.agregar(1, 10, 20)
+        self.assertTrue(intervalos.hay_conflicto(20, 30))
+        self.assertTrue(intervalos.hay_conflicto(0, 10))
+        self.assertFalse(intervalos.hay_conflicto(21, 30))
+        self.assertFalse(intervalos.hay_conflicto(0, 9))
+
+    def test_una_reserva_larga_tapa_a_las_siguientes(self):
+        intervalos = _IntervalosVehiculo()
+        for reserva_id, inicio, fin in [(2, 10, 20), (1, 0, 100), (3, 30, 40)]:
+            intervalos.agregar(reserva_id, inicio, fin)
+        self.assertEqual(intervalos.max_fines, [100, 100, 100])
+        # Solo la reserva larga cubre [50, 60]
+        self.assertTrue(intervalos.hay_conflicto(50, 60))
+        self.assertFalse(intervalos.hay_conflicto(50, 60, excluir=1))
+        self.assertTrue(intervalos.hay_conflicto(35, 60, excluir=1))
+        intervalos.quitar(1)
+        self.assertEqual(intervalos.max_fines, [20, 40])
+        self.assertFalse(intervalos.hay_conflicto(50, 60))
+
+    def test_vehiculos_ocupados_por_cubos(self):
+        datos = _DatosIndice(0)
+        dia = 86400
+        datos.agregar(1, 'a', 0, dia)
+        datos.agregar(2, 'b', 5 * dia, 6 * dia)
+        # Más larga que DIAS_MAXIMOS_EN_CUBOS: se revisa en todas las consultas
+        datos.agregar(3, 'c', 0, 400 * dia)
+        self.assertEqual(datos.ocupados(dia // 2, 2 * dia), {'a', 'c'})
+        self.assertEqual(datos.ocupados(500 * dia, 501 * dia), set())
+        datos.aplicar(3, 'c', 'CANCELADA', None, None)
+        datos.aplicar(2, 'b', 'CONFIRMADA', 10 * dia, 11 * dia)
+        self.assertEqual(datos.ocupados(5 * dia, 6 * dia), set())
+        self.assertEqual(datos.ocupados(11 * dia, 12 * dia), {'b'})
+        self.assertEqual((datos.dias, datos.largas), ({0: {'a': 1}, 1: {'a': 1}, 10: {'b': 1}, 11: {'b': 1}}, {}))
+
+
+@override_settings(DISPONIBILIDAD_USAR_INDICE=True)
+class IndiceDisponibilidadTests(TestCase):
+    def setUp(self):
+        clientes = _sinteticos.crear_clientes(5, 'indice')
+        self.flota = _sinteticos.crear_flota(20, 'I')
+        _sinteticos.crear_reservas(self.flota[:-1], clientes, 600, dias_rango=240)
+        ahora = timezone.now()
+        self.larga = Reserva.objects.create(
+            cliente=clientes[0], vehiculo=self.flota[-1], estado='CONFIRMADA',
+            fecha_inicio=ahora, fecha_fin=ahora + timedelta(days=200), codigo_reserva='LARGA',
+        )
+
+    def test_coincide_con_la_base_de_datos(self):
+        indice = IndiceDisponibilidad()
+        rnd = random.Random(3)
+        for _ in range(100):
+            inicio = timezone.now() + timedelta(hours=rnd.randrange(24 * 120))
+            fin = inicio + timedelta(days=rnd.randint(1, 10))
+            en_bd = set(Reserva.objects.filter(
+                fecha_inicio__lte=fin, fecha_fin__gte=inicio, estado__in=['CONFIRMADA', 'ACTIVA', 'PENDIENTE'],
+            ).values_list('vehiculo_id', flat=True))
+            self.assertEqual(indice.vehiculos_ocupados(inicio, fin), en_bd)
+
+    def test_los_rangos_anteriores_al_indice_van_a_la_base(self):
+        antigua = Reserva.objects.filter(
+            fecha_fin__lt=timezone.now() - timedelta(days=60), estado='CONFIRMADA',
+        ).first()
+        indice = IndiceDisponibilidad()
+        self.assertIsNone(indice.esta_disponible(antigua.vehiculo_id, antigua.fecha_inicio, antigua.fecha_fin))
+        with mock.patch('rentacar_app.disponibilidad.indice_disponibilidad', indice):
+            self.assertFalse(vehiculo_disponible(antigua.vehiculo_id, antigua.fecha_inicio, antigua.fecha_fin))
+
+    def test_la_reconstruccion_no_bloquea_ni_pierde_cambios(self):
+        indice = IndiceDisponibilidad()
+        vehiculo_id = self.larga.vehiculo_id
+        inicio, fin = self.larga.fecha_inicio, self.larga.fecha_fin
+        self.assertFalse(indice.esta_disponible(vehiculo_id, inicio, fin))
+
+        respuestas = []
+        cargar = _DatosIndice.cargar
+
+        def cargar_y_cancelar(datos, *fila):
+            if not respuestas:
+                # Otro hilo consulta mientras se carga: responde con el índice anterior
+                hilo = threading.Thread(target=lambda: respuestas.append(indice.esta_disponible(vehiculo_id, inicio, fin)))
+                hilo.start()
+                hilo.join(5)
+                # La cancelación se confirma después de que la consulta leyó la fila
+                Reserva.objects.filter(pk=self.larga.pk).update(estado='CANCELADA')
+                indice.actualizar_reserva(self.larga.pk, vehiculo_id, 'CANCELADA', inicio, fin)
+            cargar(datos, *fila)
+
+        # Con el TTL vencido, el otro hilo no espera a la reconstrucción
+        with override_settings(DISPONIBILIDAD_INDICE_TTL=0), \
+                mock.patch.object(_DatosIndice, 'cargar', cargar_y_cancelar):
+            indice.reconstruir()
+        self.assertEqual(respuestas, [False])
+        self.assertTrue(indice.esta_disponible(vehiculo_id, inicio, fin))
+
+    def test_trae_los_cambios_de_otros_procesos_por_la_version(self):
+        # Este índice no recibe las señales: solo ve los cambios por el contador
+        indice = IndiceDisponibilidad()
+        vehiculo_id = self.larga.vehiculo_id
+        inicio, fin = self.larga.fecha_inicio, self.larga.fecha_fin
+        self.assertFalse(indice.esta_disponible(vehiculo_id, inicio, fin))
+        generacion = indice.generacion
+        with self.assertNumQueries(1):
+            version = indice.sincronizar()
+        self.assertEqual(version, obtener_version(VERSION_DISPONIBILIDAD))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.larga.estado = 'CANCELADA'
+            self.larga.save()
+        version = indice.sincronizar()
+        self.assertEqual(version, obtener_version(VERSION_DISPONIBILIDAD))
+        self.assertTrue(indice.esta_disponible(vehiculo_id, inicio, fin))
+        # Refresco incremental, sin reconstruir
+        self.assertEqual(indice.generacion, generacion)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.larga.estado = 'CONFIRMADA'
+            self.larga.save()
+        with override_settings(DISPONIBILIDAD_VERIFICAR_CADA=0):
+            self.assertFalse(indice.esta_disponible(vehiculo_id, inicio, fin))
+
+        # Un borrado no deja fila que releer: se carga todo de nuevo
+        with self.captureOnCommitCallbacks(execute=True):
+            self.larga.delete()
+        self.assertNotEqual(indice.sincronizar(), version)
+        self.assertTrue(indice.esta_disponible(vehiculo_id, inicio, fin))
+        self.assertEqual(indice.generacion, generacion + 1)
+
+
+@override_settings(REPORTES_PROCESOS=0, PDF_TURNOS=0)
+class AlmacenamientoSoloLecturaTests(TestCase):
+    """MEDIA_ROOT en un sistema de archivos de solo lectura (Vercel)"""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('admin_almacenamiento', is_staff=True)
+        self.client.force_login(self.usuario)
+        solo_lectura = OSError(errno.EROFS, 'Read-only file system')
+        parche = mock.patch('django.core.files.storage.FileSystemStorage._save', side_effect=solo_lectura)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_el_contrato_se_sirve_aunque_no_se_pueda_guardar(self):
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'A'), _sinteticos.crear_clientes(1, 'almacen'), 1, dias_rango=30)
+        reserva = Reserva.objects.get()
+        with self.assertLogs('rentacar_app.almacenamiento', 'ERROR'):
+            respuesta = self.client.get(reverse('descargar_contrato', args=[reserva.pk]))
+        self.assertEqual(respuesta.status_code, 200)
+        pdf = b''.join(respuesta.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(respuesta['ETag'], f'"{hashlib.sha256(pdf).hexdigest()}"')
+        contrato = Contrato.objects.get(reserva=reserva)
+        self.assertFalse(contrato.archivo_pdf)
+        self.assertEqual(contrato.hash_pdf, hashlib.sha256(pdf).hexdigest())
+
+    def test_el_reporte_se_completa_y_se_descarga_sin_archivo(self):
+        hoy = timezone.localdate()
+        reporte = Reporte.objects.create(tipo='RESERVAS', fecha_inicio=hoy, fecha_fin=hoy, estado='PENDIENTE', generado_por=self.usuario)
+        with self.assertLogs('rentacar_app.almacenamiento', 'ERROR'):
+            tareas.procesar_reporte(tareas.reclamar_siguiente())
+        reporte.refresh_from_db()
+        self.assertEqual(reporte.estado, 'COMPLETADO')
+        self.assertFalse(reporte.archivo_pdf)
+        estado = self.client.get(reverse('api_estado_reporte', args=[reporte.pk])).json()
+        respuesta = self.client.get(estado['url_descarga'])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.content.startswith(b'%PDF'))
+
+
+class MetricasApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin_metricas', is_staff=True))
+
+    def test_dias_enorme_se_acota(self):
+        respuesta = self.client.get(reverse('api_metricas_reportes'), {'dias': 800000})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.client.get(reverse('metricas_reportes'), {'dias': 800000}).status_code, 200)
+
+    def test_dias_invalido_responde_400(self):
+        self.assertEqual(self.client.get(reverse('api_metricas_reportes'), {'dias': 0}).status_code, 400)
+
+
+class JSONComprimidoFieldTests(TestCase):
+    def test_dumpdata_y_loaddata_conservan_el_valor(self):
+        hoy = timezone.localdate()
+        datos = {'total_reservas': 3, 'por_estado': [{'estado': 'ACTIVA', 'total': 3}], 'nota': 'añadido'}
+        reporte = Reporte.objects.create(
+            tipo='RESERVAS', fecha_inicio=hoy, fecha_fin=hoy, datos=datos, estado='COMPLETADO',
+            generado_por=User.objects.create_user('admin_volcado'),
+        )
+        volcado = serializers.serialize('json', [reporte])
+        Reporte.objects.all().delete()
+        for objeto in serializers.deserialize('json', volcado):
+            objeto.save()
+        self.assertEqual(Reporte.objects.get(pk=reporte.pk).datos, datos)
+
+
+@override_settings(REPORTES_PROCESOS=0, PDF_TURNOS=0)
+class DetallePdfTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        parche = override_settings(MEDIA_ROOT=media)
+        parche.enable()
+        self.addCleanup(parche.disable)
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(2, 'E'), _sinteticos.crear_clientes(2, 'detalle'), 6, dias_rango=30)
+        self.client.force_login(User.objects.create_user('admin_detalle', is_staff=True))
+
+    def test_el_pdf_se_genera_en_segundo_plano(self):
+        parametros = {'formato': 'pdf', 'estado': ['PENDIENTE', 'CONFIRMADA', 'ACTIVA', 'COMPLETADA', 'CANCELADA']}
+        with mock.patch.object(tareas.procesador_reportes, 'notificar'):
+            respuesta = self.client.get(reverse('exportar_reservas'), parametros)
+            reporte = Reporte.objects.get(tipo='DETALLE')
+            self.assertRedirects(respuesta, reverse('ver_reporte', args=[reporte.pk]))
+            self.assertEqual(reporte.estado, 'PENDIENTE')
+            # La misma exportación reutiliza el trabajo
+            self.client.get(reverse('exportar_reservas'), parametros)
+            self.assertEqual(Reporte.objects.filter(tipo='DETALLE').count(), 1)
+
+        tareas.procesar_reporte(tareas.reclamar_siguiente())
+        reporte.refresh_from_db()
+        self.assertEqual((reporte.estado, reporte.datos['filas']), ('COMPLETADO', 6))
+        self.assertEqual(self.client.get(reverse('ver_reporte', args=[reporte.pk])).status_code, 200)
+        descarga = self.client.get(reverse('descargar_reporte', args=[reporte.pk]))
+        self.assertTrue(b''.join(descarga.streaming_content).startswith(b'%PDF'))
+
+
+@override_settings(REPORTES_PROCESOS=0, PDF_TURNOS=0)
+class ContratosLoteTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        parche = override_settings(MEDIA_ROOT=media)
+        parche.enable()
+        self.addCleanup(parche.disable)
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(2, 'C'), _sinteticos.crear_clientes(2, 'lote'), 6, dias_rango=30)
+        self.codigos = sorted(Reserva.objects.values_list('codigo_reserva', flat=True)[:4])
+        self.client.force_login(User.objects.create_user('admin_contratos', is_staff=True))
+
+    def _pedir(self, **campos):
+        return self.client.post(reverse('contratos_lote'), {'codigos': ', '.join(self.codigos), 'formato': 'zip', **campos})
+
+    def test_el_lote_se_genera_en_segundo_plano(self):
+        with mock.patch.object(tareas.procesador_reportes, 'notificar'):
+            respuesta = self._pedir()
+            reporte = Reporte.objects.get(tipo='CONTRATOS')
+            self.assertRedirects(respuesta, reverse('ver_reporte', args=[reporte.pk]))
+            # La petición no genera ningún contrato
+            self.assertEqual((reporte.estado, Contrato.objects.count()), ('PENDIENTE', 0))
+            self.assertEqual(reporte.datos, {'codigos': self.codigos, 'formato': 'zip'})
+            # El mismo lote reutiliza el trabajo
+            self._pedir()
+            self.assertEqual(Reporte.objects.filter(tipo='CONTRATOS').count(), 1)
+
+        tareas.procesar_reporte(tareas.reclamar_siguiente())
+        reporte.refresh_from_db()
+        self.assertEqual((reporte.estado, reporte.datos['contratos']), ('COMPLETADO', 4))
+        descarga = self.client.get(reverse('descargar_reporte', args=[reporte.pk]))
+        self.assertEqual(descarga['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(descarga.streaming_content))) as archivo_zip:
+            self.assertEqual(archivo_zip.namelist(), [f'contrato_{codigo}.pdf' for codigo in self.codigos])
+        self.assertEqual(Contrato.objects.count(), 4)
+
+    @override_settings(CONTRATOS_LOTE_MAXIMO=3)
+    def test_un_lote_invalido_no_se_encola(self):
+        for campos in [{}, {'formato': 'rar'}, {'codigos': 'NOEXISTE'}, {'codigos': '', 'fecha_inicio': '18-10-2026'}]:
+            with self.subTest(campos=campos):
+                self.assertRedirects(self._pedir(**campos), reverse('lista_reservas'))
+        self.assertFalse(Reporte.objects.exists())
+
+
+class PdfPrecompiladoTests(SimpleTestCase):
+    """Los estilos, párrafos y fragmentos en caché dan el mismo texto que construirlos de cero"""
+
+    VALORES = [
+        'José Ñandú Pérez',
+        'Construcciones <Hermanos> & Cía. S.R.L.',
+        'a<b & c>d; &amp; no es una entidad',
+        'Avenida ' + 'muy larga ' * 30 + 'número 5',
+    ]
+
+    def _tramos(self, parrafo):
+        # El analizador parte el texto en cada entidad: se juntan los
+        # fragmentos seguidos con la misma fuente
+        tramos = []
+        for frag in parrafo.frags:
+            if tramos and tramos[-1][1:] == [frag.fontName, frag.fontSize]:
+                tramos[-1][0] += frag.text
+            else:
+                tramos.append([frag.text, frag.fontName, frag.fontSize])
+        return tramos
+
+    def _texto_pdf(self, flowables):
+        buffer = io.BytesIO()
+        SimpleDocTemplate(buffer, pagesize=A4).build(list(flowables))
+        return '\n'.join(pagina.extract_text() for pagina in PdfReader(buffer).pages)
+
+    def test_los_estilos_en_cache_no_cambian_al_usarlos(self):
+        self.assertIs(utils._estilos_pdf(), utils._estilos_pdf())
+        utils.generar_contrato_pdf(None, datos={**self._datos_contrato(), 'cliente_nombre': self.VALORES[0]})
+        nuevos = utils._estilos_pdf.__wrapped__()
+        for nombre, estilo in utils._estilos_pdf().items():
+            self.assertEqual(
+                {clave: valor for clave, valor in vars(estilo).items() if clave != 'parent'},
+                {clave: valor for clave, valor in vars(nuevos[nombre]).items() if clave != 'parent'},
+            )
+
+    def test_campo_pdf_escapa_el_valor_como_el_analizador(self):
+        estilos = utils._estilos_pdf.__wrapped__()
+        for valor in self.VALORES:
+            with self.subTest(valor=valor):
+                campo = utils.campo_pdf('Nombre Completo:', valor)
+                referencia = Paragraph(f'<b>Nombre Completo:</b> {escape(valor)}', estilos['info'])
+                self.assertEqual(self._tramos(campo), self._tramos(referencia))
+                for ancho in (120, 450):
+                    self.assertEqual(campo.wrap(ancho, 1000), referencia.wrap(ancho, 1000))
+                self.assertEqual(self._texto_pdf([campo]), self._texto_pdf([referencia]))
+                self.assertIn(valor.split()[0], self._texto_pdf([campo]))
+
+    def test_el_parrafo_fijo_reutiliza_las_lineas_sin_cambiar_el_texto(self):
+        estilos = utils._estilos_pdf.__wrapped__()
+        texto = utils.TERMINOS_CONTRATO[0]
+        # Varios anchos y varias copias: cada una maqueta igual que un párrafo nuevo
+        for ancho in (120, 450, 120):
+            referencia = Paragraph(texto, estilos['info'])
+            copia = utils.parrafo_fijo(texto, 'info')
+            self.assertEqual(copia.wrap(ancho, 1000), referencia.wrap(ancho, 1000))
+            self.assertEqual(len(copia.blPara.lines), len(referencia.blPara.lines))
+        primera, segunda = utils.parrafo_fijo(texto, 'info'), utils.parrafo_fijo(texto, 'info')
+        primera.wrap(300, 1000)
+        segunda.wrap(300, 1000)
+        self.assertIs(primera.blPara, segunda.blPara)
+        self.assertEqual(
+            self._texto_pdf(utils.parrafo_fijo(termino, 'info') for termino in utils.TERMINOS_CONTRATO),
+            self._texto_pdf(Paragraph(termino, estilos['info']) for termino in utils.TERMINOS_CONTRATO),
+        )
+
+    def test_el_contrato_contiene_los_valores_escapados(self):
+        datos = self._datos_contrato()
+        datos.update(cliente_nombre=self.VALORES[0], cliente_direccion=self.VALORES[1], vehiculo=self.VALORES[2])
+        texto = ' '.join(PdfReader(utils.generar_contrato_pdf(None, datos=datos)).pages[0].extract_text().split())
+        for valor in self.VALORES[:3]:
+            self.assertIn(' '.join(valor.split()), texto)
+
+    def _datos_contrato(self):
+        return {
+            'codigo_reserva': 'R000001', 'cliente_nombre': 'Ana', 'cliente_cedula': '123',
+            'cliente_licencia': 'L1', 'cliente_telefono': '700', 'cliente_direccion': 'Santa Cruz',
+            'vehiculo': 'Toyota Hilux', 'vehiculo_placa': 'ABC123', 'vehiculo_año': 2020,
+            'vehiculo_tipo': 'Camioneta', 'vehiculo_capacidad': 5, 'fecha_inicio': '01/01/2027',
+            'fecha_fin': '03/01/2027', 'dias': 2, 'precio_dia': '150.00', 'precio_total': '300.00',
+            'terminos': utils.TERMINOS_CONTRATO,
+        }
+
+
+class OcupacionTests(TestCase):
+    def test_los_tramos_solapados_cuentan_una_vez(self):
+        cliente = _sinteticos.crear_clientes(1, 'ocupacion')[0]
+        ocupado, libre = _sinteticos.crear_flota(2, 'O')
+        desde = timezone.localdate() + timedelta(days=10)
+
+        def medianoche(dias):
+            return timezone.make_aware(datetime.combine(desde + timedelta(days=dias), datetime.min.time()))
+
+        for estado, inicio, fin in [('CONFIRMADA', 2, 4), ('COMPLETADA', 3, 5), ('CANCELADA', 6, 9)]:
+            Reserva.objects.create(
+                cliente=cliente, vehiculo=ocupado, estado=estado, fecha_inicio=medianoche(inicio), fecha_fin=medianoche(fin),
+            )
+        datos = calcular_ocupacion(desde, desde + timedelta(days=9))
+        self.assertEqual((datos['dias_reservados'], datos['dias_disponibles'], datos['tasa']), (3, 20, 15))
+        self.assertEqual(
+            [(fila['vehiculo_id'], fila['dias_reservados']) for fila in datos['por_vehiculo']],
+            [(ocupado.pk, 3), (libre.pk, 0)],
+        )
+        self.assertEqual(sum(fila['dias_reservados'] for fila in datos['por_semana']), 3)
+
+
+class VentanasLibresTests(TestCase):
+    def test_sugiere_los_desplazamientos_mas_cercanos(self):
+        cliente = _sinteticos.crear_clientes(1, 'ventanas')[0]
+        vehiculo = _sinteticos.crear_flota(1, 'V')[0]
+        ahora = timezone.now()
+        dia = timedelta(days=1)
+        Reserva.objects.create(
+            cliente=cliente, vehiculo=vehiculo, estado='CONFIRMADA', fecha_inicio=ahora + 10 * dia, fecha_fin=ahora + 12 * dia,
+        )
+        inicio, fin = ahora + 11 * dia, ahora + 13 * dia
+        # Un día después todavía toca el fin de la reserva; tres antes, su inicio
+        self.assertEqual(
+            ventanas_libres(vehiculo.pk, inicio, fin, k=3),
+            [(inicio + n * dia, fin + n * dia) for n in (2, 3, -4)],
+        )
+        # Nunca se sugieren ventanas que empiecen en el pasado
+        self.assertTrue(all(desde >= ahora for desde, _ in ventanas_libres(vehiculo.pk, ahora + dia, ahora + 11 * dia, k=5)))
+
+    def _reservar(self, vehiculo, desde, hasta, estado='CONFIRMADA'):
+        if not hasattr(self, 'cliente'):
+            self.cliente = _sinteticos.crear_clientes(1, 'bloques')[0]
+        return Reserva.objects.create(
+            cliente=self.cliente, vehiculo=vehiculo, estado=estado, fecha_inicio=desde, fecha_fin=hasta,
+        )
+
+    def test_reservas_seguidas_y_solapadas_forman_un_solo_bloque(self):
+        ahora = timezone.now()
+        dia = timedelta(days=1)
+        seguidas, solapadas = _sinteticos.crear_flota(2, 'W')
+        # Una termina justo cuando empieza la otra: no queda hueco entre ellas
+        self._reservar(seguidas, ahora + 10 * dia, ahora + 12 * dia)
+        self._reservar(seguidas, ahora + 12 * dia, ahora + 14 * dia)
+        # Una contenida en otra y una tercera que la alarga
+        self._reservar(solapadas, ahora + 10 * dia, ahora + 13 * dia)
+        self._reservar(solapadas, ahora + 11 * dia, ahora + 12 * dia)
+        self._reservar(solapadas, ahora + 12 * dia, ahora + 16 * dia)
+        # Las canceladas no ocupan
+        self._reservar(solapadas, ahora + 16 * dia, ahora + 30 * dia, estado='CANCELADA')
+
+        inicio, fin = ahora + 11 * dia, ahora + 13 * dia
+        self.assertEqual(
+            ventanas_libres(seguidas.pk, inicio, fin, k=3),
+            [(inicio + n * dia, fin + n * dia) for n in (-4, 4, -5)],
+        )
+        self.assertEqual(
+            ventanas_libres(solapadas.pk, inicio, fin, k=4),
+            [(inicio + n * dia, fin + n * dia) for n in (-4, -5, -6, 6)],
+        )
+
+    def test_una_reserva_que_pasa_el_horizonte_solo_deja_huecos_antes(self):
+        ahora = timezone.now()
+        dia = timedelta(days=1)
+        futura, en_curso = _sinteticos.crear_flota(2, 'H')
+        self._reservar(futura, ahora + 5 * dia, ahora + 500 * dia)
+        self._reservar(en_curso, ahora - 30 * dia, ahora + 500 * dia)
+        inicio, fin = ahora + 11 * dia, ahora + 13 * dia
+        # Antes del pasado no se busca: solo caben los desplazamientos -9 y -10
+        self.assertEqual(
+            ventanas_libres(futura.pk, inicio, fin, k=3),
+            [(inicio + n * dia, fin + n * dia) for n in (-9, -10)],
+        )
+        self.assertEqual(ventanas_libres(en_curso.pk, inicio, fin, k=3), [])
+
+
+class CalendarioApiTests(TestCase):
+    def test_devuelve_la_ocupacion_del_mes_de_toda_la_flota(self):
+        libre, reservado, taller = _sinteticos.crear_flota(3, 'K')
+        Vehiculo.objects.filter(pk=taller.pk).update(estado='MANTENIMIENTO')
+        cliente = _sinteticos.crear_clientes(1, 'calendario')[0]
+        mes = (timezone.localdate().replace(day=1) + timedelta(days=32)).replace(day=1)
+        zona = timezone.get_current_timezone()
+        Reserva.objects.create(
+            cliente=cliente, vehiculo=reservado, estado='CONFIRMADA',
+            fecha_inicio=datetime.combine(mes.replace(day=3), datetime.min.time(), zona) + timedelta(hours=10),
+            fecha_fin=datetime.combine(mes.replace(day=5), datetime.min.time(), zona) + timedelta(hours=10),
+        )
+        self.client.force_login(User.objects.create_user('empleado_calendario'))
+        url = reverse('api_calendario_disponibilidad')
+
+        indice = IndiceDisponibilidad()
+        with mock.patch('rentacar_app.views.indice_disponibilidad', indice), \
+                mock.patch('rentacar_app.views.calendario_ocupacion', CalendarioOcupacion(indice)):
+            respuesta = self.client.get(url, {'mes': f'{mes:%Y-%m}'})
+            self.assertEqual(respuesta.status_code, 200)
+            datos = respuesta.json()
+            self.assertEqual(datos['mes'], f'{mes:%Y-%m}')
+            dias = calendar.monthrange(mes.year, mes.month)[1]
+            ocupacion = {vehiculo['id']: vehiculo['ocupacion'] for vehiculo in datos['vehiculos']}
+            self.assertEqual(ocupacion, {
+                libre.pk: '0' * dias,
+                reservado.pk: '00111'.ljust(dias, '0'),
+                taller.pk: '1' * dias,
+            })
+            self.assertEqual(datos['vehiculos'][1]['placa'], reservado.placa)
+
+            # Sin cambios, el navegador puede quedarse con su copia
+            self.assertEqual(
+                self.client.get(url, {'mes': f'{mes:%Y-%m}'}, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304
+            )
+            self.assertEqual(self.client.get(url, {'mes': 'marzo'}).status_code, 400)
+            fuera = self.client.get(url, {'mes': '2000-01'})
+            self.assertEqual((fuera.status_code, fuera.json()), (400, {'error': 'Mes fuera del horizonte del calendario'}))
+
+
+class CacheReportesTests(TestCase):
+    def test_reutiliza_el_reporte_hasta_que_cambian_los_datos(self):
+        usuario = User.objects.create_user('admin_cache')
+        cache = CacheReportes()
+        primero = cache.obtener('CLIENTES', None, None, usuario)
+        self.assertIs(cache.obtener('CLIENTES', None, None, usuario), primero)
+        # Sin el LRU (otro proceso) se reutiliza la fila guardada
+        self.assertEqual(CacheReportes().obtener('CLIENTES', None, None, usuario).pk, primero.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Cliente.objects.create(
+                usuario=usuario, cedula_identidad='C1', telefono='70000000', direccion='Santa Cruz',
+                licencia_conducir='L1', fecha_vencimiento_licencia=timezone.localdate(),
+            )
+        segundo = cache.obtener('CLIENTES', None, None, usuario)
+        self.assertNotEqual(segundo.pk, primero.pk)
+        self.assertEqual(segundo.datos['total_clientes'], 1)
+        self.assertEqual((cache.aciertos, cache.fallos), (1, 2))
+
+
+class ExportacionTests(TestCase):
+    def setUp(self):
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(2, 'X'), _sinteticos.crear_clientes(2, 'exportar'), 20, dias_rango=30)
+
+    def test_csv_filtrado_por_estado(self):
+        columnas = [columna for columna, _ in COLUMNAS_EXPORTACION]
+        texto = ''.join(exportar_csv(reservas_exportacion(estados=['CONFIRMADA']), chunk_size=3))
+        cabecera, *filas = csv.reader(io.StringIO(texto))
+        self.assertEqual(cabecera, columnas)
+        esperadas = Reserva.objects.filter(estado='CONFIRMADA').order_by('pk')
+        self.assertEqual(
+            [(fila[columnas.index('codigo_reserva')], fila[columnas.index('precio_total')]) for fila in filas],
+            [(reserva.codigo_reserva, str(reserva.precio_total)) for reserva in esperadas],
+        )
+
+    def test_ndjson_un_objeto_por_reserva(self):
+        lineas = ''.join(exportar_ndjson(reservas_exportacion())).splitlines()
+        self.assertEqual(len(lineas), 20)
+        primera = json.loads(lineas[0])
+        reserva = Reserva.objects.order_by('pk').first()
+        self.assertEqual((primera['codigo_reserva'], primera['precio_total']), (reserva.codigo_reserva, str(reserva.precio_total)))
+
+
+@override_settings(REPORTES_PROCESOS=0, PDF_TURNOS=0)
+class ContratoVigenteTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        parche = override_settings(MEDIA_ROOT=media)
+        parche.enable()
+        self.addCleanup(parche.disable)
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'K'), _sinteticos.crear_clientes(1, 'contrato'), 1, dias_rango=30)
+
+    def test_solo_se_regenera_si_cambian_los_datos(self):
+        reserva = Reserva.objects.select_related('cliente__usuario', 'vehiculo').get()
+        contrato, pdf = contrato_vigente(reserva)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        self.assertEqual(contrato_vigente(reserva), (contrato, None))
+
+        reserva.fecha_fin += timedelta(days=1)
+        reserva.save()
+        actualizado, pdf = contrato_vigente(reserva)
+        self.assertEqual(actualizado.pk, contrato.pk)
+        self.assertIsNotNone(pdf)
+        self.assertNotEqual(actualizado.huella_datos, contrato.huella_datos)
+        self.assertEqual(actualizado.hash_pdf, hashlib.sha256(pdf).hexdigest())
+
+
+@override_settings(REPORTES_PROCESOS=0, PDF_TURNOS=0)
+class PaqueteReportesTests(TransactionTestCase):
+    """Los hilos del paquete abren sus propias conexiones: los datos deben estar confirmados"""
+
+    def setUp(self):
+        cache_reportes.limpiar()
+        self.addCleanup(cache_reportes.limpiar)
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(2, 'P'), _sinteticos.crear_clientes(2, 'paquete'), 10, dias_rango=30)
+        self.usuario = User.objects.create_user('admin_paquete')
+        # Con los reportes ya en caché los hilos solo leen (SQLite en memoria
+        # no admite escrituras concurrentes)
+        for tipo in TIPOS_PAQUETE:
+            cache_reportes.obtener(tipo, None, None, self.usuario)
+
+    def test_zip_y_pdf_unico(self):
+        contenido, nombre = generar_paquete(None, None, self.usuario, 'zip')
+        self.assertEqual(nombre, 'paquete_reportes_inicio_fin.zip')
+        with zipfile.ZipFile(io.BytesIO(contenido)) as archivo_zip:
+            self.assertEqual(archivo_zip.namelist(), [f'reporte_{tipo}_inicio_fin.pdf' for tipo in TIPOS_PAQUETE])
+            self.assertTrue(all(archivo_zip.read(nombre).startswith(b'%PDF') for nombre in archivo_zip.namelist()))
+        contenido, nombre = generar_paquete(None, None, self.usuario, 'pdf')
+        self.assertTrue(contenido.startswith(b'%PDF'))
+        self.assertEqual(Reporte.objects.count(), len(TIPOS_PAQUETE))
+
+    def test_formato_invalido(self):
+        with self.assertRaises(ValueError):
+            generar_paquete(None, None, self.usuario, 'rar')
+
+
+class ReservasConcurrentesTests(TransactionTestCase):
+    """Reservas solapadas desde varios hilos, cada uno con su conexión y sus transacciones reales"""
+
+    def _reservar(self, reserva):
+        # La base de tests de SQLite está en memoria con caché compartida: un
+        # bloqueo no espera el timeout sino que falla al instante, así que se
+        # reintenta como haría el usuario
+        for _ in range(200):
+            try:
+                guardar_reserva_atomica(reserva)
+                return 'creada'
+            except ReservaNoDisponible:
+                return 'rechazada'
+            except OperationalError:
+                time.sleep(0.005)
+        return 'bloqueo'
+
+    def test_no_hay_dobles_reservas(self):
+        clientes = [cliente.pk for cliente in _sinteticos.crear_clientes(3, 'concurrente')]
+        vehiculos = [vehiculo.pk for vehiculo in _sinteticos.crear_flota(2, 'C')]
+        base = timezone.now() + timedelta(days=1)
+        resultados = []
+
+        def trabajador(semilla):
+            rnd = random.Random(semilla)
+            try:
+                for _ in range(15):
+                    inicio = base + timedelta(hours=rnd.randrange(10 * 24))
+                    reserva = Reserva(
+                        cliente_id=rnd.choice(clientes), vehiculo_id=rnd.choice(vehiculos),
+                        fecha_inicio=inicio, fecha_fin=inicio + timedelta(days=rnd.randint(1, 3)),
+                        estado='CONFIRMADA',
+                    )
+                    resultados.append(self._reservar(reserva))
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(6)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(resultados), 90)
+        self.assertNotIn('bloqueo', resultados)
+        self.assertGreater(resultados.count('creada'), 0)
+        self.assertGreater(resultados.count('rechazada'), 0)
+        self.assertEqual(contar_solapamientos(vehiculos), 0)
+        self.assertEqual(Reserva.objects.count(), resultados.count('creada'))
+
+
+class AsignacionIdsTests(TestCase):
+    def setUp(self):
+        self.cliente = _sinteticos.crear_clientes(1, 'ids')[0]
+        self.flota = _sinteticos.crear_flota(3, 'A')
+        self.inicio = timezone.now() + timedelta(days=1)
+
+    def _reserva(self, vehiculo, **campos):
+        return Reserva(cliente=self.cliente, vehiculo=vehiculo, fecha_inicio=self.inicio,
+                       fecha_fin=self.inicio + timedelta(days=2), **campos)
+
+    def test_los_ids_asignados_no_chocan_con_inserts_sin_id(self):
+        primera = self._reserva(self.flota[0])
+        primera.save()
+        # bulk_create sin ID, como _sinteticos o una importación del admin
+        Reserva.objects.bulk_create([self._reserva(self.flota[1], codigo_reserva='IMPORTADA')])
+        segunda = self._reserva(self.flota[2])
+        segunda.save()
+        ids = list(Reserva.objects.values_list('pk', flat=True))
+        self.assertEqual(len(set(ids)), 3)
+        self.assertEqual(segunda.codigo_reserva, f'R{segunda.pk:06d}')
+
+    def test_un_save_fallido_no_deja_el_id_asignado(self):
+        self._reserva(self.flota[0], codigo_reserva='DUPLICADA').save()
+        reserva = self._reserva(self.flota[1], codigo_reserva='DUPLICADA')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            reserva.save()
+        self.assertIsNone(reserva.pk)
+        lote = [self._reserva(self.flota[1]), self._reserva(self.flota[2], codigo_reserva='DUPLICADA')]
+        with self.assertRaises(IntegrityError):
+            crear_reservas_en_lote(lote)
+        self.assertEqual([(r.pk, r.codigo_reserva) for r in lote], [(None, ''), (None, 'DUPLICADA')])
+        reserva.codigo_reserva = ''
+        reserva.save()
+        self.assertEqual(reserva.codigo_reserva, f'R{reserva.pk:06d}')
+
+    def test_sqlite_toma_los_ids_con_una_sentencia(self):
+        self._reserva(self.flota[0]).save()
+        with self.assertNumQueries(1):
+            ids = asignar_ids_reserva(5)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertGreater(min(ids), Reserva.objects.order_by('-pk').values_list('pk', flat=True)[0])
+
+    def test_sin_asignacion_previa_inserta_y_pone_el_codigo(self):
+        # Como una base sin RETURNING: ni asignación previa ni IDs en bulk_create
+        with mock.patch.object(connection.features, 'can_return_columns_from_insert', False):
+            self.assertIsNone(asignar_ids_reserva(1))
+            reserva = self._reserva(self.flota[0])
+            reserva.save()
+            lote = [self._reserva(self.flota[1]), self._reserva(self.flota[2], codigo_reserva='PROPIO')]
+            crear_reservas_en_lote(lote)
+        for guardada in [reserva, *lote]:
+            self.assertEqual(Reserva.objects.get(pk=guardada.pk).codigo_reserva, guardada.codigo_reserva)
+        self.assertEqual(reserva.codigo_reserva, f'R{reserva.pk:06d}')
+        self.assertEqual([r.codigo_reserva for r in lote], [f'R{lote[0].pk:06d}', 'PROPIO'])
+
+
+class RestriccionSolapamientoTests(TestCase):
+    def test_la_migracion_rechaza_solapamientos_existentes(self):
+        migracion = importlib.import_module('rentacar_app.migrations.0004_reserva_sin_solapamiento')
+        _sinteticos.crear_reservas(_sinteticos.crear_flota(1, 'M'), _sinteticos.crear_clientes(1, 'migracion'), 2, dias_rango=30)
+        migracion.comprobar_solapamientos(apps)
+        # Datos anteriores a la restricción: se quita (se restaura al deshacer el test)
+        with connection.cursor() as cursor:
+            for sentencia in {'postgresql': migracion.POSTGRESQL_BORRAR, 'sqlite': migracion.SQLITE_BORRAR}[connection.vendor]:
+                cursor.execute(sentencia)
+        primera, segunda = Reserva.objects.order_by('fecha_inicio')
+        Reserva.objects.filter(pk__in=[primera.pk, segunda.pk]).update(estado='CONFIRMADA')
+        Reserva.objects.filter(pk=segunda.pk).update(fecha_inicio=primera.fecha_inicio)
+        with self.assertRaisesMessage(RuntimeError, segunda.codigo_reserva):
+            migracion.comprobar_solapamientos(apps)
+
+    def test_sin_la_restriccion_el_lote_comprueba_los_cruces(self):
+        migracion = importlib.import_module('rentacar_app.migrations.0004_reserva_sin_solapamiento')
+        vehiculo = _sinteticos.crear_flota(1, 'L')[0]
+        cliente = _sinteticos.crear_clientes(1, 'lote')[0]
+        inicio = timezone.now() + timedelta(days=1)
+
+        def reserva(dias_desde, dias):
+            return Reserva(cliente=cliente, vehiculo=vehiculo, estado='CONFIRMADA',
+                           fecha_inicio=inicio + timedelta(days=dias_desde),
+                           fecha_fin=inicio + timedelta(days=dias_desde + dias))
+
+        crear_reservas_en_lote([reserva(0, 2)])
+        # Como un PostgreSQL donde la migración omitió la restricción
+        with connection.cursor() as cursor:
+            for sentencia in migracion.SQLITE_BORRAR:
+                cursor.execute(sentencia)
+        with mock.patch('rentacar_app.reservas.restriccion_en_bd', return_value=False):
+            with self.assertRaises(ReservaNoDisponible):
+                crear_reservas_en_lote([reserva(5, 1), reserva(1, 2)])
+            with self.assertRaises(ReservaNoDisponible):
+                crear_reservas_en_lote([reserva(5, 2), reserva(6, 2)])
+            crear_reservas_en_lote([reserva(5, 1), reserva(10, 1)])
+        self.assertEqual(Reserva.objects.count(), 3)
+        self.assertEqual(contar_solapamientos([vehiculo.pk]), 0)
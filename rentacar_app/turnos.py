@@ -0,0 +1,101 @@
+"""
+Límite global de PDF en generación.
+
+La cola de procesos.py es de cada proceso web: con varios procesos (varios
+workers de gunicorn, varias instancias serverless) cada uno tendría su propia
+cola y su propio pool, y con workers de un solo hilo la cola de cada proceso
+nunca tendría más de un trabajo. Para que el límite valga para todo el
+despliegue, cada PDF toma además uno de los PDF_TURNOS turnos de la tabla
+TurnoPDF, que comparten todos los procesos.
+
+Un turno se toma con un UPDATE condicional (como los trabajos de tareas.py:
+solo gana uno de los procesos que compiten) que lo marca ocupado hasta
+dentro de PDF_TURNO_MAXIMO segundos, y se libera al terminar el PDF. Si el
+proceso muere sin liberarlo, el turno vuelve a estar libre al vencer ese
+plazo. Las filas se crean cuando no queda ninguna libre y faltan turnos.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import TurnoPDF
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre intentos de los trabajos por lotes que esperan turno
+ESPERA_TURNO = 0.5
+
+def total_turnos():
+    return getattr(settings, 'PDF_TURNOS', 10)
+
+
+def _libre(ahora):
+    return Q(ocupado_hasta__isnull=True) | Q(ocupado_hasta__lt=ahora)
+
+
+def _crear_turnos(total):
+    """Crea los turnos que falten; False si ya estaban todos"""
+    if TurnoPDF.objects.filter(numero__lte=total).count() >= total:
+        return False
+    TurnoPDF.objects.bulk_create([TurnoPDF(numero=i) for i in range(1, total + 1)], ignore_conflicts=True)
+    return True
+
+
+def intentar_turno():
+    """Número de un turno libre, ya marcado como ocupado; None si no hay ninguno"""
+    total = total_turnos()
+    numero = _ocupar_turno(total)
+    if numero is None and _crear_turnos(total):
+        numero = _ocupar_turno(total)
+    return numero
+
+
+def _ocupar_turno(total):
+    ahora = timezone.now()
+    candidatos = TurnoPDF.objects.filter(_libre(ahora), numero__lte=total).order_by('numero')
+    hasta = ahora + timedelta(seconds=getattr(settings, 'PDF_TURNO_MAXIMO', 600))
+    for numero in list(candidatos.values_list('numero', flat=True)[:5]):
+        # Solo uno de los procesos que compiten gana el UPDATE
+        if TurnoPDF.objects.filter(_libre(ahora), numero=numero).update(ocupado_hasta=hasta):
+            return numero
+    return None
+
+
+def tomar_turno(esperar=False):
+    """
+    Toma un turno (None si el límite global está desactivado). Sin turnos
+    libres devuelve False, o con esperar=True reintenta hasta conseguir uno.
+    """
+    if total_turnos() <= 0:
+        return None
+    while True:
+        numero = intentar_turno()
+        if numero is not None or not esperar:
+            return numero if numero is not None else False
+        time.sleep(ESPERA_TURNO)
+
+
+def liberar_turno(numero, cerrar_conexion=False):
+    """
+    Libera el turno; un fallo solo se registra (el turno vence solo). Con
+    cerrar_conexion=True cierra la conexión del hilo, para los hilos
+    internos del pool que no son de ninguna petición.
+    """
+    if not numero:
+        return
+    try:
+        TurnoPDF.objects.filter(numero=numero).update(ocupado_hasta=None)
+    except Exception:
+        logger.exception('No se pudo liberar el turno de PDF %s', numero)
+    finally:
+        if cerrar_conexion:
+            connection.close()
+
+
+def turnos_ocupados():
+    return TurnoPDF.objects.filter(numero__lte=total_turnos()).exclude(_libre(timezone.now())).count()
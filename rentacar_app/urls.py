@@ -44,6 +44,7 @@ path('empleados/<int:empleado_id>/eliminar/', views.eliminar_empleado, name='eli
     # Reservas - URLs COMPLETAS
     path('reservas/', views.lista_reservas, name='lista_reservas'),
     path('reservas/crear/', views.crear_reserva, name='crear_reserva'),
+    path('reservas/contratos/', views.contratos_lote, name='contratos_lote'),
     path('reservas/<int:reserva_id>/', views.detalle_reserva, name='detalle_reserva'),
     path('reservas/<int:reserva_id>/editar/', views.editar_reserva, name='editar_reserva'),
     path('reservas/<int:reserva_id>/eliminar/', views.eliminar_reserva, name='eliminar_reserva'),
@@ -53,9 +54,21 @@ path('empleados/<int:empleado_id>/eliminar/', views.eliminar_empleado, name='eli
     
     # Reportes
     path('reportes/', views.reportes, name='reportes'),
+    path('reportes/historial/', views.historial_reportes, name='historial_reportes'),
+    path('reportes/metricas/', views.metricas_reportes, name='metricas_reportes'),
+    path('reportes/exportar-reservas/', views.exportar_reservas, name='exportar_reservas'),
+    path('reportes/paquete/', views.paquete_reportes, name='paquete_reportes'),
+    path('reportes/<int:reporte_id>/', views.ver_reporte, name='ver_reporte'),
+    path('reportes/<int:reporte_id>/descargar/', views.descargar_reporte, name='descargar_reporte'),
+    path('api/reportes/<int:reporte_id>/estado/', views.api_estado_reporte, name='api_estado_reporte'),
+    path('api/reportes/metricas/', views.api_metricas_reportes, name='api_metricas_reportes'),
+    path('api/reportes/pool/', views.api_estado_pool_pdf, name='api_estado_pool_pdf'),
     
     # APIs
     path('api/disponibilidad/', views.api_disponibilidad, name='api_disponibilidad'),
+    path('api/disponibilidad/lote/', views.api_disponibilidad_lote, name='api_disponibilidad_lote'),
+    path('api/disponibilidad/calendario/', views.api_calendario_disponibilidad, name='api_calendario_disponibilidad'),
+    path('api/vehiculos/<int:vehiculo_id>/ventanas-libres/', views.api_ventanas_libres, name='api_ventanas_libres'),
     
     # Diagnóstico
     path('diagnostico/vehiculos/', views.diagnostico_vehiculos, name='diagnostico_vehiculos'),
@@ -1,18 +1,30 @@
-from reportlab.lib.pagesizes import letter, A4
+from reportlab.lib.pagesizes import letter, A4, landscape
 from reportlab.pdfgen import canvas
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, LongTable
 from reportlab.lib import colors
 from reportlab.lib.units import inch
+from reportlab import rl_config
 from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfdoc import PDFArray, PDFBase85Encode, PDFName, PDFStream, PDFZCompress
 from reportlab.pdfbase.ttfonts import TTFont
 from io import BytesIO
 import os
-from datetime import datetime
+from copy import copy
+from functools import lru_cache
+from datetime import date, datetime, time, timedelta
+from django.conf import settings
 from django.http import HttpResponse
-from django.db.models import Count, Sum, Q
+from django.db.models import BooleanField, Case, Count, DecimalField, Exists, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, TruncMonth, TruncYear
+from django.utils import timezone
 from decimal import Decimal
-from .models import Reserva, Vehiculo, Cliente
+from .models import Reserva, Vehiculo, Cliente, ResumenDiario
+from .disponibilidad import vehiculo_disponible
+from .precios import dias_facturables
+from .ocupacion import calcular_ocupacion
+from .resumen import ESTADOS_INGRESO
+from .instrumentacion import medido, medir
 
 # ========== FUNCIÓN AUXILIAR PARA CONVERTIR DECIMAL A FLOAT ==========
 
@@ -30,120 +42,253 @@ def convertir_decimal_a_float(datos):
     else:
         return datos
 
-def generar_contrato_pdf(reserva):
-    """Genera un contrato en PDF para una reserva"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
+TERMINOS_CONTRATO = [
+    "1. El cliente se compromete a devolver el vehículo en el mismo estado en que fue recibido.",
+    "2. Cualquier daño al vehículo será responsabilidad del cliente.",
+    "3. El cliente debe presentar licencia de conducir válida al momento de la entrega.",
+    "4. No se permite el uso del vehículo fuera de los límites departamentales sin autorización.",
+    "5. El combustible utilizado durante el alquiler es responsabilidad del cliente.",
+    "6. Cualquier infracción de tránsito cometida durante el período de alquiler será responsabilidad del cliente.",
+    "7. La empresa se reserva el derecho de cancelar el contrato en caso de incumplimiento de los términos.",
+]
+
+def datos_contrato(reserva):
+    """
+    Todo lo que el contrato imprime de la reserva, el cliente y el vehículo,
+    ya con el formato del PDF (salvo la fecha de emisión, que es la de
+    generación). Si no cambia, el PDF guardado sigue siendo válido.
+    """
+    cliente = reserva.cliente
+    vehiculo = reserva.vehiculo
+    return {
+        'codigo_reserva': reserva.codigo_reserva,
+        'cliente_nombre': cliente.usuario.get_full_name(),
+        'cliente_cedula': cliente.cedula_identidad,
+        'cliente_licencia': cliente.licencia_conducir,
+        'cliente_telefono': cliente.telefono,
+        'cliente_direccion': cliente.direccion,
+        'vehiculo': f'{vehiculo.marca} {vehiculo.modelo}',
+        'vehiculo_placa': vehiculo.placa,
+        'vehiculo_año': vehiculo.año,
+        'vehiculo_tipo': vehiculo.get_tipo_display(),
+        'vehiculo_capacidad': vehiculo.capacidad_pasajeros,
+        'fecha_inicio': reserva.fecha_inicio.strftime('%d/%m/%Y %H:%M'),
+        'fecha_fin': reserva.fecha_fin.strftime('%d/%m/%Y %H:%M'),
+        'dias': dias_facturables(reserva.fecha_inicio, reserva.fecha_fin),
+        'precio_dia': str(vehiculo.precio_dia),
+        'precio_total': str(reserva.precio_total),
+        'terminos': TERMINOS_CONTRATO,
+    }
+
+# ========== ESTILOS Y PÁRRAFOS PRECOMPILADOS ==========
+
+@lru_cache(maxsize=None)
+def _estilos_pdf():
+    """Estilos de contratos y reportes, creados una vez por proceso (solo se leen)"""
     styles = getSampleStyleSheet()
-    story = []
-    
-    # Estilo personalizado para el título
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        alignment=1,  # Centrado
-        textColor=colors.HexColor('#2c3e50')
-    )
-    
-    # Título del contrato
-    title = Paragraph("CONTRATO DE ALQUILER DE VEHÍCULO", title_style)
-    story.append(title)
-    
-    # Información de la empresa
-    empresa_style = ParagraphStyle(
-        'Empresa',
-        parent=styles['Normal'],
-        fontSize=12,
-        spaceAfter=12,
-        alignment=1
-    )
-    empresa = Paragraph("<b>RENTACAR</b><br/>Calle Raúl Otero Reich y Vía Puerto Suárez<br/>Teléfono: +591-XXX-XXXX", empresa_style)
-    story.append(empresa)
-    story.append(Spacer(1, 20))
-    
-    # Información del contrato
-    info_style = ParagraphStyle(
-        'Info',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=6
+    return {
+        'seccion': styles['Heading2'],
+        # Contrato
+        'titulo_contrato': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=16,
+            spaceAfter=30,
+            alignment=1,  # Centrado
+            textColor=colors.HexColor('#2c3e50')
+        ),
+        'empresa': ParagraphStyle(
+            'Empresa',
+            parent=styles['Normal'],
+            fontSize=12,
+            spaceAfter=12,
+            alignment=1
+        ),
+        'info': ParagraphStyle(
+            'Info',
+            parent=styles['Normal'],
+            fontSize=10,
+            spaceAfter=6
+        ),
+        # Reportes
+        'titulo_reporte': ParagraphStyle(
+            'ReportTitle',
+            parent=styles['Heading1'],
+            fontSize=14,
+            spaceAfter=30,
+            alignment=1,
+            textColor=colors.HexColor('#2c3e50')
+        ),
+        'fecha': ParagraphStyle(
+            'Fecha',
+            parent=styles['Normal'],
+            fontSize=10,
+            spaceAfter=20,
+            alignment=1
+        ),
+        'contenido': ParagraphStyle(
+            'Content',
+            parent=styles['Normal'],
+            fontSize=9,
+            spaceAfter=12
+        ),
+        'pie': ParagraphStyle(
+            'Footer',
+            parent=styles['Normal'],
+            fontSize=8,
+            alignment=1,
+            textColor=colors.HexColor('#7f8c8d')
+        ),
+    }
+
+ESTILO_TABLA_REPORTE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecf0f1')),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7'))
+])
+
+# Tablas de detalle con miles de filas: compactas y sin colores por fila
+ESTILO_TABLA_DETALLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 7),
+    ('TOPPADDING', (0, 0), (-1, -1), 1),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.HexColor('#bdc3c7')),
+])
+
+ESTILO_TABLA_FIRMAS = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+class ParrafoFijo(Paragraph):
+    """
+    Párrafo de texto fijo: se analiza una sola vez (ver _parrafo_fijo) y
+    guarda su partición en líneas por ancho disponible. Cada documento usa
+    una copia, que comparte el análisis y las líneas pero no el estado de
+    maquetación, así que se puede usar desde varios hilos.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lineas = {}
+    
+    def wrap(self, availWidth, availHeight):
+        guardado = self._lineas.get(availWidth)
+        if guardado is None:
+            resultado = super().wrap(availWidth, availHeight)
+            if hasattr(self, 'blPara'):
+                self._lineas[availWidth] = (self._wrapWidths, self.blPara, self.height)
+            return resultado
+        self.width = availWidth
+        self._wrapWidths, self.blPara, self.height = guardado
+        return self.width, self.height
+
+@lru_cache(maxsize=256)
+def _parrafo_fijo(texto, estilo):
+    return ParrafoFijo(texto, _estilos_pdf()[estilo])
+
+def parrafo_fijo(texto, estilo):
+    """Copia del párrafo precompilado de `texto` con el estilo `estilo` de _estilos_pdf"""
+    return copy(_parrafo_fijo(texto, estilo))
+
+@lru_cache(maxsize=256)
+def _fragmentos_campo(etiqueta, estilo):
+    # "<b>Etiqueta:</b> x" da dos fragmentos: la etiqueta en negrita y el valor
+    etiqueta_frag, valor_frag = Paragraph(f'<b>{etiqueta}</b> x', _estilos_pdf()[estilo]).frags
+    return etiqueta_frag, valor_frag
+
+def campo_pdf(etiqueta, valor, estilo='info'):
+    """
+    Párrafo "<b>etiqueta</b> valor" sin pasar por el analizador XML: la
+    etiqueta se analiza una vez y el valor se inserta como texto literal
+    (sin interpretar &, < ni >).
+    """
+    etiqueta_frag, valor_frag = _fragmentos_campo(etiqueta, estilo)
+    return Paragraph(
+        f'{etiqueta} {valor}', _estilos_pdf()[estilo], frags=[etiqueta_frag, valor_frag.clone(text=f' {valor}')]
     )
+
+# ========== CONTRATOS ==========
+
+@medido('CONTRATO', 'PDF')
+def generar_contrato_pdf(reserva, datos=None, emision=None):
+    """
+    Genera un contrato en PDF para una reserva (datos: los de datos_contrato,
+    si ya se calcularon; emision: fecha de emisión, ahora por defecto).
     
-    # Datos del contrato
-    story.append(Paragraph(f"<b>Número de Contrato:</b> {reserva.codigo_reserva}", info_style))
-    story.append(Paragraph(f"<b>Fecha de Emisión:</b> {datetime.now().strftime('%d/%m/%Y %H:%M')}", info_style))
-    story.append(Spacer(1, 15))
-    
-    # Datos del cliente
-    story.append(Paragraph("<b>DATOS DEL CLIENTE</b>", styles['Heading2']))
-    story.append(Paragraph(f"<b>Nombre Completo:</b> {reserva.cliente.usuario.get_full_name()}", info_style))
-    story.append(Paragraph(f"<b>Cédula de Identidad:</b> {reserva.cliente.cedula_identidad}", info_style))
-    story.append(Paragraph(f"<b>Licencia de Conducir:</b> {reserva.cliente.licencia_conducir}", info_style))
-    story.append(Paragraph(f"<b>Teléfono:</b> {reserva.cliente.telefono}", info_style))
-    story.append(Paragraph(f"<b>Dirección:</b> {reserva.cliente.direccion}", info_style))
-    story.append(Spacer(1, 15))
-    
-    # Datos del vehículo
-    story.append(Paragraph("<b>DATOS DEL VEHÍCULO</b>", styles['Heading2']))
-    story.append(Paragraph(f"<b>Vehículo:</b> {reserva.vehiculo.marca} {reserva.vehiculo.modelo}", info_style))
-    story.append(Paragraph(f"<b>Placa:</b> {reserva.vehiculo.placa}", info_style))
-    story.append(Paragraph(f"<b>Año:</b> {reserva.vehiculo.año}", info_style))
-    story.append(Paragraph(f"<b>Tipo:</b> {reserva.vehiculo.get_tipo_display()}", info_style))
-    story.append(Paragraph(f"<b>Capacidad:</b> {reserva.vehiculo.capacidad_pasajeros} pasajeros", info_style))
-    story.append(Spacer(1, 15))
-    
-    # Términos del alquiler
-    story.append(Paragraph("<b>TÉRMINOS DEL ALQUILER</b>", styles['Heading2']))
-    story.append(Paragraph(f"<b>Fecha de Inicio:</b> {reserva.fecha_inicio.strftime('%d/%m/%Y %H:%M')}", info_style))
-    story.append(Paragraph(f"<b>Fecha de Fin:</b> {reserva.fecha_fin.strftime('%d/%m/%Y %H:%M')}", info_style))
-    story.append(Paragraph(f"<b>Duración:</b> {reserva.duracion_dias} días", info_style))
-    story.append(Paragraph(f"<b>Precio por Día:</b> Bs. {reserva.vehiculo.precio_dia}", info_style))
-    story.append(Paragraph(f"<b>Precio Total:</b> Bs. {reserva.precio_total}", info_style))
-    story.append(Spacer(1, 15))
-    
-    # Términos y condiciones
-    story.append(Paragraph("<b>TÉRMINOS Y CONDICIONES</b>", styles['Heading2']))
-    terminos = [
-        "1. El cliente se compromete a devolver el vehículo en el mismo estado en que fue recibido.",
-        "2. Cualquier daño al vehículo será responsabilidad del cliente.",
-        "3. El cliente debe presentar licencia de conducir válida al momento de la entrega.",
-        "4. No se permite el uso del vehículo fuera de los límites departamentales sin autorización.",
-        "5. El combustible utilizado durante el alquiler es responsabilidad del cliente.",
-        "6. Cualquier infracción de tránsito cometida durante el período de alquiler será responsabilidad del cliente.",
-        "7. La empresa se reserva el derecho de cancelar el contrato en caso de incumplimiento de los términos.",
+    Solo se maquetan los campos que cambian: estilos, título, cabecera de la
+    empresa, secciones y términos son párrafos precompilados (parrafo_fijo).
+    """
+    if datos is None:
+        datos = datos_contrato(reserva)
+    emision = emision or datetime.now()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    story = [
+        parrafo_fijo("CONTRATO DE ALQUILER DE VEHÍCULO", 'titulo_contrato'),
+        parrafo_fijo("<b>RENTACAR</b><br/>Calle Raúl Otero Reich y Vía Puerto Suárez<br/>Teléfono: +591-XXX-XXXX", 'empresa'),
+        Spacer(1, 20),
+        
+        # Datos del contrato
+        campo_pdf("Número de Contrato:", datos['codigo_reserva']),
+        campo_pdf("Fecha de Emisión:", emision.strftime('%d/%m/%Y %H:%M')),
+        Spacer(1, 15),
+        
+        # Datos del cliente
+        parrafo_fijo("<b>DATOS DEL CLIENTE</b>", 'seccion'),
+        campo_pdf("Nombre Completo:", datos['cliente_nombre']),
+        campo_pdf("Cédula de Identidad:", datos['cliente_cedula']),
+        campo_pdf("Licencia de Conducir:", datos['cliente_licencia']),
+        campo_pdf("Teléfono:", datos['cliente_telefono']),
+        campo_pdf("Dirección:", datos['cliente_direccion']),
+        Spacer(1, 15),
+        
+        # Datos del vehículo
+        parrafo_fijo("<b>DATOS DEL VEHÍCULO</b>", 'seccion'),
+        campo_pdf("Vehículo:", datos['vehiculo']),
+        campo_pdf("Placa:", datos['vehiculo_placa']),
+        campo_pdf("Año:", datos['vehiculo_año']),
+        campo_pdf("Tipo:", datos['vehiculo_tipo']),
+        campo_pdf("Capacidad:", f"{datos['vehiculo_capacidad']} pasajeros"),
+        Spacer(1, 15),
+        
+        # Términos del alquiler
+        parrafo_fijo("<b>TÉRMINOS DEL ALQUILER</b>", 'seccion'),
+        campo_pdf("Fecha de Inicio:", datos['fecha_inicio']),
+        campo_pdf("Fecha de Fin:", datos['fecha_fin']),
+        campo_pdf("Duración:", f"{datos['dias']} días"),
+        campo_pdf("Precio por Día:", f"Bs. {datos['precio_dia']}"),
+        campo_pdf("Precio Total:", f"Bs. {datos['precio_total']}"),
+        Spacer(1, 15),
+        
+        # Términos y condiciones
+        parrafo_fijo("<b>TÉRMINOS Y CONDICIONES</b>", 'seccion'),
     ]
-    
-    for termino in terminos:
-        story.append(Paragraph(termino, info_style))
-    
+    story.extend(parrafo_fijo(termino, 'info') for termino in datos['terminos'])
     story.append(Spacer(1, 30))
     
     # Firmas
-    firmas_style = ParagraphStyle(
-        'Firmas',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceBefore=20
-    )
-    
     firmas_data = [
         ['', ''],
         ['_________________________', '_________________________'],
         ['Firma del Cliente', 'Firma del Representante RentaCar'],
-        [f'{reserva.cliente.usuario.get_full_name()}', 'RentaCar'],
-        [f'CI: {reserva.cliente.cedula_identidad}', f'Fecha: {datetime.now().strftime("%d/%m/%Y")}']
+        [datos['cliente_nombre'], 'RentaCar'],
+        [f"CI: {datos['cliente_cedula']}", f'Fecha: {emision.strftime("%d/%m/%Y")}']
     ]
-    
     firmas_table = Table(firmas_data, colWidths=[3*inch, 3*inch])
-    firmas_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    
+    firmas_table.setStyle(ESTILO_TABLA_FIRMAS)
     story.append(firmas_table)
     
     # Generar PDF
@@ -151,61 +296,191 @@ def generar_contrato_pdf(reserva):
     buffer.seek(0)
     return buffer
 
+def filtros_periodo(campo, fecha_inicio=None, fecha_fin=None):
+    """
+    Filtros de un DateTimeField entre dos días locales (ambos incluidos) como
+    rango sobre la columna; campo__date convertiría cada fila a fecha.
+    """
+    filtros = {}
+    if fecha_inicio:
+        inicio = date.fromisoformat(str(fecha_inicio))
+        filtros[f'{campo}__gte'] = timezone.make_aware(datetime.combine(inicio, time.min))
+    if fecha_fin:
+        fin = date.fromisoformat(str(fecha_fin)) + timedelta(days=1)
+        filtros[f'{campo}__lt'] = timezone.make_aware(datetime.combine(fin, time.min))
+    return filtros
+
 def generar_reporte_pdf(reporte_data, tipo_reporte):
     """Genera reportes en PDF"""
+    with medir(tipo_reporte, 'PDF') as medicion:
+        buffer = generar_paquete_pdf([(reporte_data, tipo_reporte)])
+        medicion.tamano_pdf = buffer.getbuffer().nbytes
+    return buffer
+
+def generar_paquete_pdf(reportes):
+    """Un único PDF con varios reportes [(datos, tipo)], cada uno desde una página nueva"""
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
     story = []
+    for i, (reporte_data, tipo_reporte) in enumerate(reportes):
+        if i:
+            story.append(PageBreak())
+        story.extend(_contenido_reporte_pdf(reporte_data, tipo_reporte))
     
-    # Título del reporte
-    title_style = ParagraphStyle(
-        'ReportTitle',
-        parent=styles['Heading1'],
-        fontSize=14,
-        spaceAfter=30,
-        alignment=1,
-        textColor=colors.HexColor('#2c3e50')
-    )
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+class CanvasCompacto(canvas.Canvas):
+    """
+    Canvas que comprime el contenido de cada página al cerrarla. El de
+    ReportLab lo guarda como texto hasta save() (unos 18 KB por página de
+    tabla); así lo que se acumula es solo el PDF comprimido. Misma salida.
+    """
+
+    def showPage(self):
+        super().showPage()
+        pagina = self._doc.Pages.pages[-1]
+        if pagina.compression and pagina.stream:
+            # Los mismos filtros y en el mismo orden que aplicaría save()
+            filtros = [PDFBase85Encode, PDFZCompress] if rl_config.useA85 else [PDFZCompress]
+            codificado = pagina.stream
+            for filtro in reversed(filtros):
+                codificado = filtro.encode(codificado)
+            contenido = PDFStream(content=codificado)
+            # Con Filter ya puesto, save() no los vuelve a aplicar
+            contenido.dictionary['Filter'] = PDFArray([PDFName(filtro.pdfname) for filtro in filtros])
+            contenido.__Comment__ = 'page stream'
+            pagina.Contents = contenido
+            pagina.stream = None
+
+
+class HistoriaPerezosa:
+    """
+    Story para doc.build() que va sacando los flowables de un iterable a
+    medida que se maquetan. build() solo usa len(), índices, del y
+    inserciones al principio, así que en memoria están únicamente los que
+    esperan turno (y los que deben ir con el siguiente, keepWithNext).
+    """
+
+    def __init__(self, flowables):
+        self._pendientes = iter(flowables)
+        self._cola = []
+
+    def _leer(self, cantidad):
+        while len(self._cola) < cantidad:
+            siguiente = next(self._pendientes, None)
+            if siguiente is None:
+                return
+            self._cola.append(siguiente)
+
+    def __len__(self):
+        self._leer(1)
+        while self._cola and self._cola[-1].getKeepWithNext():
+            anterior = len(self._cola)
+            self._leer(anterior + 1)
+            if len(self._cola) == anterior:
+                break
+        return len(self._cola)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, int):
+            self._leer(indice + 1)
+        return self._cola[indice]
+
+    def __setitem__(self, indice, valor):
+        self._cola[indice] = valor
+
+    def __delitem__(self, indice):
+        if isinstance(indice, int):
+            self._leer(indice + 1)
+        del self._cola[indice]
+
+    def insert(self, indice, flowable):
+        self._cola.insert(indice, flowable)
+
+
+def _tablas_largas(encabezado, filas, col_widths, filas_por_tabla):
+    """LongTable de hasta filas_por_tabla filas (con el encabezado repetido en cada página)"""
+    bloque = [encabezado]
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) > filas_por_tabla:
+            yield _tabla_larga(bloque, col_widths)
+            bloque = [encabezado]
+    if len(bloque) > 1:
+        yield _tabla_larga(bloque, col_widths)
+
+
+def _tabla_larga(bloque, col_widths):
+    tabla = LongTable(bloque, colWidths=col_widths, repeatRows=1)
+    tabla.setStyle(ESTILO_TABLA_DETALLE)
+    return tabla
+
+
+def escribir_tabla_pdf(archivo, titulo, subtitulo, encabezado, filas, col_widths, filas_por_tabla=None):
+    """
+    Escribe en `archivo` un PDF apaisado con una tabla de `filas` (un iterable,
+    p. ej. un iterator() de la base) partida en LongTable de filas_por_tabla
+    filas que se crean al maquetarlas. En memoria solo quedan la tabla en
+    curso y las páginas ya comprimidas (CanvasCompacto), que ReportLab junta
+    al final en save(). Devuelve cuántas filas escribió.
+    """
+    estilos = _estilos_pdf()
+    filas_por_tabla = filas_por_tabla or getattr(settings, 'PDF_FILAS_POR_TABLA', 500)
+    escritas = 0
+
+    def contar(filas):
+        nonlocal escritas
+        for fila in filas:
+            escritas += 1
+            yield fila
+
+    def historia():
+        yield parrafo_fijo(titulo, 'titulo_reporte')
+        yield Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", estilos['fecha'])
+        if subtitulo:
+            yield Paragraph(subtitulo, estilos['contenido'])
+        yield from _tablas_largas(encabezado, contar(filas), col_widths, filas_por_tabla)
+        yield Spacer(1, 30)
+        yield Paragraph(f"{escritas} filas - Sistema RentaCar - Generado automáticamente", estilos['pie'])
+
+    doc = SimpleDocTemplate(archivo, pagesize=landscape(A4), leftMargin=0.5*inch, rightMargin=0.5*inch,
+                            topMargin=0.5*inch, bottomMargin=0.5*inch)
+    doc.build(HistoriaPerezosa(historia()), canvasmaker=CanvasCompacto)
+    return escritas
+
+def _contenido_reporte_pdf(reporte_data, tipo_reporte):
+    """Flowables de un reporte, desde el título hasta el pie"""
+    estilos = _estilos_pdf()
+    story = []
     
     titulos = {
         'FINANCIERO': 'REPORTE FINANCIERO',
         'RESERVAS': 'REPORTE DE RESERVAS',
         'VEHICULOS': 'REPORTE DE VEHÍCULOS',
-        'CLIENTES': 'REPORTE DE CLIENTES'
+        'CLIENTES': 'REPORTE DE CLIENTES',
+        'TENDENCIAS': 'REPORTE DE TENDENCIAS'
     }
     
-    title = Paragraph(titulos.get(tipo_reporte, 'REPORTE'), title_style)
-    story.append(title)
+    # Título del reporte
+    story.append(parrafo_fijo(titulos.get(tipo_reporte, 'REPORTE'), 'titulo_reporte'))
     
     # Fecha de generación
-    fecha_style = ParagraphStyle(
-        'Fecha',
-        parent=styles['Normal'],
-        fontSize=10,
-        spaceAfter=20,
-        alignment=1
-    )
-    fecha = Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", fecha_style)
+    fecha = Paragraph(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}", estilos['fecha'])
     story.append(fecha)
     
     # Contenido específico según el tipo de reporte
-    content_style = ParagraphStyle(
-        'Content',
-        parent=styles['Normal'],
-        fontSize=9,
-        spaceAfter=12
-    )
     
     if tipo_reporte == 'FINANCIERO':
         total_ingresos = reporte_data.get('total_ingresos', 0)
-        story.append(Paragraph(f"<b>Total de Ingresos:</b> Bs. {total_ingresos:,.2f}", content_style))
-        story.append(Paragraph(f"<b>Total de Reservas:</b> {reporte_data.get('total_reservas', 0)}", content_style))
+        story.append(campo_pdf("Total de Ingresos:", f"Bs. {total_ingresos:,.2f}", 'contenido'))
+        story.append(campo_pdf("Total de Reservas:", reporte_data.get('total_reservas', 0), 'contenido'))
         
         # Tabla de reservas por tipo de vehículo
         if 'reservas_por_tipo' in reporte_data:
             story.append(Spacer(1, 15))
-            story.append(Paragraph("<b>Reservas por Tipo de Vehículo</b>", styles['Heading2']))
+            story.append(parrafo_fijo("<b>Reservas por Tipo de Vehículo</b>", 'seccion'))
             
             tabla_data = [['Tipo de Vehículo', 'Cantidad', 'Total (Bs.)']]
             for item in reporte_data['reservas_por_tipo']:
@@ -216,177 +491,216 @@ def generar_reporte_pdf(reporte_data, tipo_reporte):
                 ])
             
             tabla = Table(tabla_data, colWidths=[2.5*inch, 1.5*inch, 1.5*inch])
-            tabla.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ecf0f1')),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 9),
-                ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#bdc3c7'))
-            ]))
+            tabla.setStyle(ESTILO_TABLA_REPORTE)
             story.append(tabla)
     
     elif tipo_reporte == 'RESERVAS':
-        story.append(Paragraph(f"<b>Total de Reservas:</b> {reporte_data.get('total_reservas', 0)}", content_style))
+        story.append(campo_pdf("Total de Reservas:", reporte_data.get('total_reservas', 0), 'contenido'))
         tasa_ocupacion = reporte_data.get('tasa_ocupacion', 0)
-        story.append(Paragraph(f"<b>Tasa de Ocupación:</b> {tasa_ocupacion:.1f}%", content_style))
+        story.append(campo_pdf("Tasa de Ocupación:", f"{tasa_ocupacion:.1f}%", 'contenido'))
+        
+        if reporte_data.get('ocupacion_por_tipo'):
+            story.append(Spacer(1, 15))
+            story.append(parrafo_fijo("<b>Ocupación por Tipo de Vehículo</b>", 'seccion'))
+            
+            tabla_data = [['Tipo de Vehículo', 'Días reservados', 'Días disponibles', 'Ocupación']]
+            for item in reporte_data['ocupacion_por_tipo']:
+                tabla_data.append([
+                    item['tipo'],
+                    f"{item['dias_reservados']:,.1f}",
+                    f"{item['dias_disponibles']:,.1f}",
+                    f"{item['tasa']:.1f}%"
+                ])
+            
+            tabla = Table(tabla_data, colWidths=[2*inch, 1.5*inch, 1.5*inch, 1*inch])
+            tabla.setStyle(ESTILO_TABLA_REPORTE)
+            story.append(tabla)
     
     elif tipo_reporte == 'VEHICULOS':
         total_vehiculos = reporte_data.get('total_vehiculos', 0)
-        story.append(Paragraph(f"<b>Total de Vehículos:</b> {total_vehiculos}", content_style))
+        story.append(campo_pdf("Total de Vehículos:", total_vehiculos, 'contenido'))
         
-        # Contar vehículos disponibles si no está en los datos
-        if 'vehiculos_disponibles' in reporte_data:
-            disponibles = reporte_data['vehiculos_disponibles']
-        else:
-            disponibles = Vehiculo.objects.filter(estado='DISPONIBLE').count()
+        # Reportes guardados antes de tener los totales: se sacan de la agrupación por estado
+        por_estado = {item['estado']: item['total'] for item in reporte_data.get('vehiculos_por_estado', [])}
+        disponibles = reporte_data.get('vehiculos_disponibles', por_estado.get('DISPONIBLE', 0))
+        mantenimiento = reporte_data.get('vehiculos_mantenimiento', por_estado.get('MANTENIMIENTO', 0))
             
-        story.append(Paragraph(f"<b>Vehículos Disponibles:</b> {disponibles}", content_style))
-        story.append(Paragraph(f"<b>Vehículos en Mantenimiento:</b> {Vehiculo.objects.filter(estado='MANTENIMIENTO').count()}", content_style))
+        story.append(campo_pdf("Vehículos Disponibles:", disponibles, 'contenido'))
+        story.append(campo_pdf("Vehículos en Mantenimiento:", mantenimiento, 'contenido'))
     
     elif tipo_reporte == 'CLIENTES':
         total_clientes = reporte_data.get('total_clientes', 0)
-        story.append(Paragraph(f"<b>Total de Clientes:</b> {total_clientes}", content_style))
+        story.append(campo_pdf("Total de Clientes:", total_clientes, 'contenido'))
         
         clientes_activos = reporte_data.get('clientes_con_licencia_valida', 0)
-        story.append(Paragraph(f"<b>Clientes con Licencia Válida:</b> {clientes_activos}", content_style))
+        story.append(campo_pdf("Clientes con Licencia Válida:", clientes_activos, 'contenido'))
+    
+    elif tipo_reporte == 'TENDENCIAS':
+        story.append(campo_pdf("Periodo:", reporte_data.get('periodo', ''), 'contenido'))
+        story.append(campo_pdf("Total de Reservas:", reporte_data.get('total_reservas', 0), 'contenido'))
+        story.append(campo_pdf("Ingresos:", f"Bs. {reporte_data.get('total_ingresos', 0):,.2f}", 'contenido'))
+        story.append(campo_pdf("Tasa de Cancelación:", f"{reporte_data.get('tasa_cancelacion', 0):.1f}%", 'contenido'))
+        story.append(Paragraph(
+            f"<b>Duración media:</b> {reporte_data.get('duracion_media_dias', 0):.1f} días - "
+            f"<b>Anticipación media:</b> {reporte_data.get('anticipacion_media_dias', 0):.1f} días",
+            estilos['contenido']
+        ))
+        
+        if reporte_data.get('por_tipo'):
+            story.append(Spacer(1, 15))
+            story.append(parrafo_fijo("<b>Tendencias por Tipo de Vehículo</b>", 'seccion'))
+            
+            tabla_data = [['Tipo', 'Reservas', 'Ingresos (Bs.)', 'Duración', 'Anticipación', 'Cancelación']]
+            for item in reporte_data['por_tipo']:
+                tabla_data.append([
+                    item['tipo'],
+                    str(item['reservas']),
+                    f"{item['ingresos']:,.2f}",
+                    f"{item['duracion_media_dias']:.1f} d",
+                    f"{item['anticipacion_media_dias']:.1f} d",
+                    f"{item['tasa_cancelacion']:.1f}%"
+                ])
+            
+            tabla = Table(tabla_data, colWidths=[1.2*inch, 0.9*inch, 1.3*inch, 1*inch, 1.1*inch, 1*inch])
+            tabla.setStyle(ESTILO_TABLA_REPORTE)
+            story.append(tabla)
     
     story.append(Spacer(1, 30))
     
     # Pie de página
-    footer_style = ParagraphStyle(
-        'Footer',
-        parent=styles['Normal'],
-        fontSize=8,
-        alignment=1,
-        textColor=colors.HexColor('#7f8c8d')
-    )
-    footer = Paragraph("Sistema RentaCar - Generado automáticamente", footer_style)
-    story.append(footer)
-    
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+    story.append(parrafo_fijo("Sistema RentaCar - Generado automáticamente", 'pie'))
+    return story
 
+@medido('VEHICULOS')
 def generar_reporte_vehiculos():
-    """Genera datos para reporte de vehículos"""
-    vehiculos = Vehiculo.objects.all()
-    
-    # Vehículos por tipo
-    vehiculos_por_tipo = list(vehiculos.values('tipo').annotate(
-        total=Count('id')
-    ))
+    """
+    Genera datos para reporte de vehículos.
     
-    # Vehículos por estado
-    vehiculos_por_estado = list(vehiculos.values('estado').annotate(
-        total=Count('id')
-    ))
+    Una sola consulta recorre la flota con el número de reservas y los
+    ingresos de cada vehículo ya agregados en subconsultas sobre Reserva
+    (sin multiplicar filas con JOINs); totales, agrupaciones y rankings se
+    calculan en Python sobre ese resultado.
+    """
+    reservas = Reserva.objects.filter(vehiculo=OuterRef('pk')).order_by().values('vehiculo')
+    vehiculos = list(Vehiculo.objects.annotate(
+        num_reservas=Coalesce(Subquery(reservas.annotate(total=Count('id')).values('total')), 0),
+        total_ingresos=Subquery(
+            reservas.annotate(total=Sum('precio_total')).values('total'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    ).order_by('id').values('marca', 'modelo', 'placa', 'tipo', 'estado', 'num_reservas', 'total_ingresos'))
+    
+    por_tipo = {}
+    por_estado = {}
+    for vehiculo in vehiculos:
+        por_tipo[vehiculo['tipo']] = por_tipo.get(vehiculo['tipo'], 0) + 1
+        por_estado[vehiculo['estado']] = por_estado.get(vehiculo['estado'], 0) + 1
     
     # Vehículos más rentados
-    vehiculos_mas_rentados = list(vehiculos.annotate(
-        num_reservas=Count('reservas')
-    ).order_by('-num_reservas')[:5].values(
-        'marca', 'modelo', 'placa', 'num_reservas'
-    ))
-    
-    # Ingresos por vehículo - CONVERTIR DECIMAL A FLOAT
-    ingresos_por_vehiculo_raw = list(vehiculos.annotate(
-        total_ingresos=Sum('reservas__precio_total')
-    ).filter(total_ingresos__isnull=False).order_by('-total_ingresos')[:5].values(
-        'marca', 'modelo', 'placa', 'total_ingresos'
-    ))
-    
-    # Convertir Decimal a float
-    ingresos_por_vehiculo = []
-    for item in ingresos_por_vehiculo_raw:
-        ingresos_por_vehiculo.append({
-            'marca': item['marca'],
-            'modelo': item['modelo'],
-            'placa': item['placa'],
-            'total_ingresos': float(item['total_ingresos'] or 0)
-        })
+    vehiculos_mas_rentados = [
+        {campo: vehiculo[campo] for campo in ('marca', 'modelo', 'placa', 'num_reservas')}
+        for vehiculo in sorted(vehiculos, key=lambda v: -v['num_reservas'])[:5]
+    ]
+    
+    # Ingresos por vehículo (solo los que tienen reservas)
+    ingresos_por_vehiculo = [
+        {
+            'marca': vehiculo['marca'],
+            'modelo': vehiculo['modelo'],
+            'placa': vehiculo['placa'],
+            'total_ingresos': float(vehiculo['total_ingresos']),
+        }
+        for vehiculo in sorted(
+            (v for v in vehiculos if v['total_ingresos'] is not None), key=lambda v: -v['total_ingresos']
+        )[:5]
+    ]
     
     datos = {
-        'total_vehiculos': vehiculos.count(),
-        'vehiculos_por_tipo': vehiculos_por_tipo,
-        'vehiculos_por_estado': vehiculos_por_estado,
+        'total_vehiculos': len(vehiculos),
+        'vehiculos_por_tipo': [{'tipo': tipo, 'total': total} for tipo, total in sorted(por_tipo.items())],
+        'vehiculos_por_estado': [{'estado': estado, 'total': total} for estado, total in sorted(por_estado.items())],
         'vehiculos_mas_rentados': vehiculos_mas_rentados,
         'ingresos_por_vehiculo': ingresos_por_vehiculo,
-        'vehiculos_disponibles': vehiculos.filter(estado='DISPONIBLE').count(),
+        'vehiculos_disponibles': por_estado.get('DISPONIBLE', 0),
+        'vehiculos_mantenimiento': por_estado.get('MANTENIMIENTO', 0),
         'fecha_generacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     
     return datos
 
+@medido('CLIENTES')
 def generar_reporte_clientes():
-    """Genera datos para reporte de clientes - VERSIÓN SIMPLE"""
-    clientes = Cliente.objects.select_related('usuario').all()
+    """
+    Genera datos para reporte de clientes.
+    
+    Usa un número fijo de consultas agrupadas, sin importar cuántos clientes
+    haya: totales con agregación condicional, top 10, altas por año y altas
+    por mes del año actual. La vigencia de la licencia se evalúa en SQL sobre
+    fecha_vencimiento_licencia.
+    """
+    hoy = timezone.localdate()
+    año_actual = hoy.year
+    clientes = Cliente.objects.all()
+    licencia_vigente = Q(fecha_vencimiento_licencia__gte=hoy)
+    
+    totales = clientes.aggregate(
+        total=Count('id'),
+        con_licencia_valida=Count('id', filter=licencia_vigente),
+        activos=Count('id', filter=Q(usuario__is_active=True)),
+        con_reservas=Count('id', filter=Q(Exists(Reserva.objects.filter(cliente=OuterRef('pk'))))),
+    )
     
     # Clientes más frecuentes
-    clientes_mas_frecuentes_raw = list(clientes.annotate(
+    clientes_mas_frecuentes_raw = clientes.annotate(
         num_reservas=Count('reservas'),
-        total_gastado=Sum('reservas__precio_total')
-    ).order_by('-num_reservas')[:10])
+        total_gastado=Sum('reservas__precio_total'),
+        licencia_valida=Case(When(licencia_vigente, then=True), default=False, output_field=BooleanField()),
+    ).order_by('-num_reservas', 'id').values(
+        'usuario__first_name', 'usuario__last_name', 'usuario__username', 'usuario__is_active',
+        'cedula_identidad', 'telefono', 'num_reservas', 'total_gastado', 'licencia_valida',
+    )[:10]
     
     clientes_mas_frecuentes = []
-    for cliente in clientes_mas_frecuentes_raw:
+    for item in clientes_mas_frecuentes_raw:
+        nombre = f"{item['usuario__first_name']} {item['usuario__last_name']}".strip()
         clientes_mas_frecuentes.append({
-            'nombre': cliente.usuario.get_full_name() or cliente.usuario.username,
-            'cedula': cliente.cedula_identidad,
-            'telefono': cliente.telefono,
-            'num_reservas': cliente.num_reservas or 0,
-            'total_gastado': float(cliente.total_gastado or 0),
-            'licencia_valida': cliente.licencia_valida,
-            'activo': cliente.activo
+            'nombre': nombre or item['usuario__username'],
+            'cedula': item['cedula_identidad'],
+            'telefono': item['telefono'],
+            'num_reservas': item['num_reservas'] or 0,
+            'total_gastado': float(item['total_gastado'] or 0),
+            'licencia_valida': item['licencia_valida'],
+            'activo': item['usuario__is_active']
         })
     
-    # Clientes por fecha de registro (simplificado para SQLite)
-    # Agrupar manualmente por año
-    clientes_por_año = {}
-    for cliente in clientes:
-        if cliente.fecha_registro:
-            año = cliente.fecha_registro.year
-            clientes_por_año[año] = clientes_por_año.get(año, 0) + 1
-        else:
-            año = 'Sin fecha'
-            clientes_por_año[año] = clientes_por_año.get(año, 0) + 1
-    
-    clientes_por_año_list = []
-    for año, total in sorted(clientes_por_año.items()):
-        clientes_por_año_list.append({
-            'año': str(año),
-            'total': total
-        })
+    # Clientes por año de registro
+    clientes_por_año = [
+        {'año': str(item['año'].year), 'total': item['total']}
+        for item in clientes.annotate(año=TruncYear('fecha_registro')).values('año').annotate(
+            total=Count('id')
+        ).order_by('año')
+    ]
     
     # Clientes por mes del año actual (para mostrar tendencia)
-    from datetime import datetime, timedelta
-    año_actual = datetime.now().year
-    clientes_este_año = clientes.filter(
-        fecha_registro__year=año_actual
-    )
-    
-    clientes_por_mes = []
-    for mes in range(1, 13):
-        cantidad = clientes_este_año.filter(
-            fecha_registro__month=mes
-        ).count()
-        clientes_por_mes.append({
-            'mes': f'{mes:02d}/{año_actual}',
-            'total': cantidad
-        })
+    por_mes = {
+        item['mes'].month: item['total']
+        for item in clientes.filter(fecha_registro__year=año_actual).annotate(
+            mes=TruncMonth('fecha_registro')
+        ).values('mes').annotate(total=Count('id'))
+    }
+    clientes_por_mes = [
+        {'mes': f'{mes:02d}/{año_actual}', 'total': por_mes.get(mes, 0)}
+        for mes in range(1, 13)
+    ]
     
     datos = {
-        'total_clientes': clientes.count(),
-        'clientes_con_licencia_valida': clientes.filter(licencia_valida=True).count(),
-        'clientes_sin_licencia_valida': clientes.filter(licencia_valida=False).count(),
-        'clientes_activos': clientes.filter(activo=True).count(),
-        'clientes_con_reservas': clientes.filter(reservas__isnull=False).distinct().count(),
+        'total_clientes': totales['total'],
+        'clientes_con_licencia_valida': totales['con_licencia_valida'],
+        'clientes_sin_licencia_valida': totales['total'] - totales['con_licencia_valida'],
+        'clientes_activos': totales['activos'],
+        'clientes_con_reservas': totales['con_reservas'],
         'clientes_mas_frecuentes': clientes_mas_frecuentes,
-        'clientes_por_año': clientes_por_año_list,
+        'clientes_por_año': clientes_por_año,
         'clientes_por_mes': clientes_por_mes,
         'fecha_generacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
@@ -395,47 +709,45 @@ def generar_reporte_clientes():
 
 def verificar_disponibilidad_vehiculo(vehiculo_id, fecha_inicio, fecha_fin, reserva_excluida=None):
     """Verifica si un vehículo está disponible en un rango de fechas"""
-    reservas_conflictivas = Reserva.objects.filter(
-        vehiculo_id=vehiculo_id,
-        fecha_inicio__lte=fecha_fin,
-        fecha_fin__gte=fecha_inicio,
-        estado__in=['CONFIRMADA', 'ACTIVA', 'PENDIENTE']
+    return vehiculo_disponible(
+        vehiculo_id, fecha_inicio, fecha_fin,
+        excluir_id=reserva_excluida.id if reserva_excluida else None,
+        verificar_en_bd=True
     )
-    
-    if reserva_excluida:
-        reservas_conflictivas = reservas_conflictivas.exclude(id=reserva_excluida.id)
-    
-    return not reservas_conflictivas.exists()
 
+@medido('FINANCIERO')
 def generar_reporte_financiero(fecha_inicio=None, fecha_fin=None):
-    """Genera datos para reporte financiero"""
-    from django.db.models import Sum, Count
-    
+    """Genera datos para reporte financiero (totales desde el resumen diario)"""
     # Filtrar por fechas si se proporcionan
     filtros = {}
+    filtros_resumen = {}
     if fecha_inicio:
-        filtros['fecha_reserva__date__gte'] = fecha_inicio
+        filtros.update(filtros_periodo('fecha_reserva', fecha_inicio=fecha_inicio))
+        filtros_resumen['fecha__gte'] = fecha_inicio
     if fecha_fin:
-        filtros['fecha_reserva__date__lte'] = fecha_fin
+        filtros.update(filtros_periodo('fecha_reserva', fecha_fin=fecha_fin))
+        filtros_resumen['fecha__lte'] = fecha_fin
     
     reservas = Reserva.objects.filter(
-        estado__in=['COMPLETADA', 'ACTIVA'],
+        estado__in=ESTADOS_INGRESO,
         **filtros
     )
+    resumen = ResumenDiario.objects.filter(estado__in=ESTADOS_INGRESO, **filtros_resumen)
     
-    total_ingresos = reservas.aggregate(total=Sum('precio_total'))['total'] or Decimal('0')
-    total_reservas = reservas.count()
-    
-    # Reservas por tipo de vehículo - CONVERTIR DECIMAL A FLOAT
-    reservas_por_tipo_raw = list(reservas.values('vehiculo__tipo').annotate(
-        total=Sum('precio_total'),
-        cantidad=Count('id')
-    ))
-    
+    # Reservas por tipo de vehículo; los totales salen de sumar los tipos
     reservas_por_tipo = []
-    for item in reservas_por_tipo_raw:
+    total_ingresos = Decimal('0')
+    total_reservas = 0
+    for item in resumen.values('tipo_vehiculo').annotate(
+        total=Sum('ingresos'),
+        cantidad=Sum('reservas')
+    ).order_by('tipo_vehiculo'):
+        if not item['cantidad']:
+            continue
+        total_ingresos += item['total'] or 0
+        total_reservas += item['cantidad']
         reservas_por_tipo.append({
-            'vehiculo__tipo': item['vehiculo__tipo'],
+            'vehiculo__tipo': item['tipo_vehiculo'],
             'total': float(item['total'] or 0),
             'cantidad': item['cantidad']
         })
@@ -467,32 +779,32 @@ def generar_reporte_financiero(fecha_inicio=None, fecha_fin=None):
     
     return datos
 
+@medido('RESERVAS')
 def generar_reporte_reservas(fecha_inicio=None, fecha_fin=None):
     """Genera datos para reporte de reservas"""
     from django.db.models import Count
     
     # Filtrar por fechas si se proporcionan
     filtros = {}
+    filtros_resumen = {}
     if fecha_inicio:
-        filtros['fecha_reserva__date__gte'] = fecha_inicio
+        filtros.update(filtros_periodo('fecha_reserva', fecha_inicio=fecha_inicio))
+        filtros_resumen['fecha__gte'] = fecha_inicio
     if fecha_fin:
-        filtros['fecha_reserva__date__lte'] = fecha_fin
+        filtros.update(filtros_periodo('fecha_reserva', fecha_fin=fecha_fin))
+        filtros_resumen['fecha__lte'] = fecha_fin
     
     reservas = Reserva.objects.filter(**filtros)
     
-    total_reservas = reservas.count()
-    
-    # Reservas por estado
-    reservas_por_estado_raw = list(reservas.values('estado').annotate(
-        total=Count('id')
-    ))
-    
-    reservas_por_estado = []
-    for item in reservas_por_estado_raw:
-        reservas_por_estado.append({
-            'estado': item['estado'],
-            'total': item['total']
-        })
+    # Reservas por estado, desde el resumen diario
+    reservas_por_estado = [
+        {'estado': item['estado'], 'total': item['total']}
+        for item in ResumenDiario.objects.filter(**filtros_resumen).values('estado').annotate(
+            total=Sum('reservas')
+        ).order_by('estado')
+        if item['total']
+    ]
+    total_reservas = sum(item['total'] for item in reservas_por_estado)
     
     # Reservas por vehículo
     reservas_por_vehiculo = list(reservas.values(
@@ -501,22 +813,22 @@ def generar_reporte_reservas(fecha_inicio=None, fecha_fin=None):
         total=Count('id')
     ).order_by('-total')[:10])  # Top 10 vehículos
     
-    # Calcular tasa de ocupación (simplificado)
-    total_vehiculos = Vehiculo.objects.count()
-    tasa_ocupacion = 0
-    
-    if total_vehiculos > 0 and total_reservas > 0:
-        # Estimación simple: porcentaje de vehículos con al menos una reserva
-        vehiculos_con_reservas = Vehiculo.objects.filter(
-            reservas__in=reservas
-        ).distinct().count()
-        tasa_ocupacion = (vehiculos_con_reservas / total_vehiculos) * 100
+    # Ocupación real: días-vehículo reservados / disponibles en el periodo
+    ocupacion = calcular_ocupacion(
+        date.fromisoformat(str(fecha_inicio)) if fecha_inicio else None,
+        date.fromisoformat(str(fecha_fin)) if fecha_fin else None,
+    )
     
     datos = {
         'total_reservas': total_reservas,
         'reservas_por_estado': reservas_por_estado,
         'reservas_por_vehiculo': reservas_por_vehiculo,
-        'tasa_ocupacion': round(tasa_ocupacion, 2),
+        'tasa_ocupacion': ocupacion['tasa'],
+        'dias_vehiculo_reservados': ocupacion['dias_reservados'],
+        'dias_vehiculo_disponibles': ocupacion['dias_disponibles'],
+        'ocupacion_por_tipo': ocupacion['por_tipo'],
+        'ocupacion_por_semana': ocupacion['por_semana'],
+        'ocupacion_por_vehiculo': ocupacion['por_vehiculo'][:10],
         'periodo': f"{fecha_inicio or 'Inicio'} a {fecha_fin or 'Fin'}",
         'fecha_generacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
@@ -0,0 +1,77 @@
+"""
+Contadores de versión globales.
+
+Cada contador se incrementa cuando se confirma la transacción que modificó
+los datos que vigila. No se hace dentro de ella: la fila del contador es la
+misma para todas las reservas y el UPDATE la dejaría bloqueada hasta el
+final de cada transacción, serializando todas las que escriben. Un lector
+que entre el COMMIT y el incremento vea ya los datos nuevos los guarda bajo
+la versión anterior, que deja de usarse en cuanto se incrementa. Lo que se
+escribe en un callback posterior al COMMIT (el resumen diario) tiene que
+incrementar el contador después de escribirse, no antes: resumen.py lo hace
+en el mismo callback.
+
+Leer un contador cuesta una consulta sobre una tabla de pocas filas, lo que
+permite validar respuestas en caché (ETag, reportes...) sin recalcularlas.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ContadorVersion
+
+# Reservas y estado de la flota: todo lo que cambia la disponibilidad
+VERSION_DISPONIBILIDAD = 'disponibilidad'
+# Reservas, vehículos y clientes: los datos de los reportes
+VERSION_REPORTES = 'reportes'
+# Reservas borradas: invalida la instantánea de analitica.py
+VERSION_RESERVAS_ELIMINADAS = 'reservas_eliminadas'
+
+
+# Contadores por incrementar en cada conexión (alias) del hilo
+_pendientes = threading.local()
+
+
+def incrementar_version(nombre, using=None):
+    """
+    Incrementa el contador al confirmarse la transacción en curso (en el acto
+    si no hay). Cada contador se incrementa una sola vez por transacción,
+    aunque se guarden muchas filas o varios modelos que lo invalidan.
+    """
+    conexion = transaction.get_connection(using)
+    if not conexion.in_atomic_block:
+        _incrementar(nombre)
+        return
+    pendientes = _pendientes.__dict__.setdefault(conexion.alias, set())
+    pendientes.add(nombre)
+    # Cada llamada registra su callback: si la transacción (o el savepoint)
+    # se deshace, Django los descarta y el nombre queda en el conjunto hasta
+    # el próximo COMMIT, que lo incrementa de más (inofensivo) en lugar de
+    # perderlo. El primer callback que se ejecuta vacía el conjunto y los
+    # demás no hacen nada. robust: un fallo al incrementar no convierte en
+    # error un cambio ya confirmado.
+    transaction.on_commit(lambda: _confirmar(conexion.alias), using=using, robust=True)
+
+
+def _confirmar(alias):
+    pendientes = _pendientes.__dict__.pop(alias, None)
+    for nombre in sorted(pendientes or ()):
+        _incrementar(nombre)
+
+
+def _incrementar(nombre):
+    actualizados = ContadorVersion.objects.filter(nombre=nombre).update(
+        valor=F('valor') + 1, actualizado=timezone.now()
+    )
+    if not actualizados:
+        contador, creado = ContadorVersion.objects.get_or_create(nombre=nombre, defaults={'valor': 1})
+        if not creado:
+            _incrementar(nombre)
+
+
+def obtener_version(nombre):
+    """Devuelve (valor, actualizado) del contador; (0, None) si aún no existe"""
+    fila = ContadorVersion.objects.filter(nombre=nombre).values_list('valor', 'actualizado').first()
+    return fila or (0, None)
@@ -4,20 +4,45 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User 
 from django.contrib import messages  # ✅ IMPORTACIÓN AÑADIDA
-from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST, condition
 from django.db.models import Count, Sum, Q
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from decimal import Decimal
+import base64
+from functools import partial
+import io
 import json
 from django.db.models import Sum, Count, Avg
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
-from .models import Cliente, Vehiculo, Reserva, Contrato, Reporte, Empleado
+from .models import Cliente, Vehiculo, Reserva, Contrato, Reporte, Empleado, ResumenDiario, MetricaReporte
 from .forms import ClienteForm, VehiculoForm, ReservaForm, UserForm, EmpleadoForm, EmpleadoUserForm
 from .utils import (
-    generar_contrato_pdf, generar_reporte_pdf, generar_reporte_vehiculos, 
-    generar_reporte_clientes, verificar_disponibilidad_vehiculo,
-    generar_reporte_financiero, generar_reporte_reservas
+    verificar_disponibilidad_vehiculo,
+)
+from .reservas import guardar_reserva_atomica, ReservaNoDisponible
+from .versiones import obtener_version, VERSION_DISPONIBILIDAD
+from .precios import cotizar, cotizar_varios, dias_facturables
+from .cache_reportes import cache_reportes
+from .resumen import ESTADOS_INGRESO
+from .exportacion import exportar_csv, exportar_ndjson, reservas_exportacion, FORMATOS_EXPORTACION
+from .paquetes import generar_paquete, FORMATOS_PAQUETE
+from .tareas import (
+    encolar_contratos, encolar_detalle, encolar_reporte, procesador_reportes,
+    ESTADOS_EN_CURSO, TIPO_CONTRATOS, TIPO_DETALLE, TIPOS_SOLO_ARCHIVO,
+)
+from .instrumentacion import guardar_metricas, resumen_metricas, PERCENTILES
+from .procesos import ColaLlena, TiempoAgotado, estado_pool, renderizar, renderizar_pdf
+from .almacenamiento import archivo_disponible
+from .contratos import contrato_vigente, preparar_contrato, FORMATOS_LOTE_CONTRATOS
+from .disponibilidad import (
+    vehiculos_ocupados, vehiculos_ocupados_lote, vehiculos_disponibles_qs, calendario_ocupacion,
+    indice_disponibilidad, ventanas_libres, vehiculos_alternativos,
 )
 
 def inicio(request):
@@ -136,16 +161,19 @@ def dashboard(request):
     if user_role == 'administrador' or user_role == 'empleado':
         # Dashboard para administradores y empleados (MANTENER EXISTENTE)
         total_clientes = Cliente.objects.count()
-        total_reservas = Reserva.objects.count()
-        reservas_activas = Reserva.objects.filter(estado='ACTIVA').count()
         
-        mes_actual = timezone.now().month
-        año_actual = timezone.now().year
-        ingresos_mes = Reserva.objects.filter(
-            fecha_reserva__month=mes_actual,
-            fecha_reserva__year=año_actual,
-            estado__in=['COMPLETADA', 'ACTIVA']
-        ).aggregate(total=Sum('precio_total'))['total'] or 0
+        # Totales desde el resumen diario (filas por día, no por reserva)
+        hoy = timezone.localdate()
+        resumen = ResumenDiario.objects.aggregate(
+            total_reservas=Sum('reservas'),
+            reservas_activas=Sum('reservas', filter=Q(estado='ACTIVA')),
+            ingresos_mes=Sum('ingresos', filter=Q(
+                fecha__year=hoy.year, fecha__month=hoy.month, estado__in=ESTADOS_INGRESO
+            )),
+        )
+        total_reservas = resumen['total_reservas'] or 0
+        reservas_activas = resumen['reservas_activas'] or 0
+        ingresos_mes = resumen['ingresos_mes'] or 0
         
         reservas_recientes = Reserva.objects.select_related('cliente', 'vehiculo').order_by('-fecha_reserva')[:5]
         vehiculos_populares = Vehiculo.objects.annotate(num_reservas=Count('reservas')).order_by('-num_reservas')[:3]
@@ -244,24 +272,64 @@ def crear_vehiculo(request):
         form = VehiculoForm()
     return render(request, 'vehiculos/crear.html', {'form': form})
 
+def _version_disponibilidad(request, indice=False):
+    # Se guarda en la petición para que ETag y Last-Modified compartan la consulta
+    if not hasattr(request, '_version_disponibilidad'):
+        if indice:
+            # La respuesta sale del índice en memoria, que puede ir por detrás
+            # del contador: la versión es la que refleja el índice
+            request._version_disponibilidad = indice_disponibilidad.sincronizar()
+        else:
+            request._version_disponibilidad = obtener_version(VERSION_DISPONIBILIDAD)
+    return request._version_disponibilidad
+
+
+def _etag_disponibilidad(request, *args, indice=False, **kwargs):
+    """
+    ETag de las vistas de disponibilidad: versión de reservas/flota con la que
+    se construyó la respuesta (indice=True para las que leen el índice en
+    memoria), día actual (el calendario se desplaza con él) y usuario (las
+    páginas HTML incluyen su nombre). Cuesta una consulta y no toca la tabla
+    de reservas.
+    """
+    version, _ = _version_disponibilidad(request, indice)
+    return f'"{version}-{timezone.localdate():%Y%m%d}-{request.user.pk}"'
+
+
+def _ultima_modificacion_disponibilidad(request, *args, indice=False, **kwargs):
+    _, actualizado = _version_disponibilidad(request, indice)
+    return actualizado
+
+
+def _condicion_disponibilidad(indice=False):
+    return condition(
+        etag_func=partial(_etag_disponibilidad, indice=indice),
+        last_modified_func=partial(_ultima_modificacion_disponibilidad, indice=indice),
+    )
+
+
 @login_required
+@_condicion_disponibilidad(indice=True)
 def disponibilidad_vehiculos(request):
     fecha_inicio = request.GET.get('fecha_inicio')
     fecha_fin = request.GET.get('fecha_fin')
     
     vehiculos = Vehiculo.objects.filter(estado='DISPONIBLE')
+    dias = None
     
     if fecha_inicio and fecha_fin:
         try:
             fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d')
             fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d')
             
-            reservas_conflictivas = Reserva.objects.filter(
-                Q(fecha_inicio__lte=fecha_fin_dt) & Q(fecha_fin__gte=fecha_inicio_dt),
-                estado__in=['CONFIRMADA', 'ACTIVA', 'PENDIENTE']
-            )
-            vehiculos_reservados_ids = reservas_conflictivas.values_list('vehiculo_id', flat=True)
-            vehiculos = vehiculos.exclude(id__in=vehiculos_reservados_ids)
+            vehiculos_reservados_ids = vehiculos_ocupados(fecha_inicio_dt, fecha_fin_dt)
+            vehiculos = [v for v in vehiculos if v.id not in vehiculos_reservados_ids]
+            
+            # Precio total del rango para cada vehículo listado
+            precios = cotizar_varios([(v.precio_dia, v.tipo) for v in vehiculos], [(fecha_inicio_dt, fecha_fin_dt)])[0]
+            for vehiculo, precio in zip(vehiculos, precios):
+                vehiculo.precio_estimado = precio
+            dias = dias_facturables(fecha_inicio_dt, fecha_fin_dt)
             
         except ValueError:
             pass
@@ -269,22 +337,30 @@ def disponibilidad_vehiculos(request):
     return render(request, 'vehiculos/disponibilidad.html', {
         'vehiculos': vehiculos,
         'fecha_inicio': fecha_inicio,
-        'fecha_fin': fecha_fin
+        'fecha_fin': fecha_fin,
+        'dias': dias,
     })
 
 # Vistas de Reservas
 @login_required
 def lista_reservas(request):
     reservas = Reserva.objects.select_related('cliente', 'vehiculo').all()
-    return render(request, 'reservas/lista.html', {'reservas': reservas})
+    return render(request, 'reservas/lista.html', {
+        'reservas': reservas,
+        'es_administrador': es_administrador(request.user),
+    })
 
 @login_required
 def crear_reserva(request):
     if request.method == 'POST':
         form = ReservaForm(request.POST)
         if form.is_valid():
-            reserva = form.save()
-            return redirect('detalle_reserva', reserva_id=reserva.id)
+            try:
+                reserva = guardar_reserva_atomica(form.save(commit=False))
+            except ReservaNoDisponible:
+                form.add_error(None, "El vehículo no está disponible en las fechas seleccionadas.")
+            else:
+                return redirect('detalle_reserva', reserva_id=reserva.id)
     else:
         form = ReservaForm()
     return render(request, 'reservas/crear.html', {'form': form})
@@ -303,35 +379,34 @@ def reportes(request):
         fecha_fin = request.POST.get('fecha_fin')
         formato = request.POST.get('formato', 'web')
         
-        # Generar reporte según el tipo
-        if tipo == 'FINANCIERO':
-            datos = generar_reporte_financiero(fecha_inicio, fecha_fin)
-        elif tipo == 'RESERVAS':
-            datos = generar_reporte_reservas(fecha_inicio, fecha_fin)
-        elif tipo == 'VEHICULOS':
-            datos = generar_reporte_vehiculos()
-        else:
-            datos = generar_reporte_clientes()
+        if formato == 'pdf_segundo_plano':
+            # Se encola y se responde al instante; la página consulta el estado
+            try:
+                reporte = encolar_reporte(tipo, fecha_inicio, fecha_fin, request.user)
+            except ValueError:
+                messages.error(request, 'Tipo de reporte o formato de fecha inválido.')
+                return render(request, 'reportes/generar.html')
+            return redirect('ver_reporte', reporte_id=reporte.id)
         
-        # CONVERTIR DATOS DECIMAL A FLOAT PARA JSON
-        datos = convertir_decimal_a_float(datos)
+        # Reutiliza el reporte si ya se generó con la versión actual de los datos
+        try:
+            reporte = cache_reportes.obtener(tipo, fecha_inicio, fecha_fin, request.user)
+        except ValueError:
+            messages.error(request, 'Tipo de reporte o formato de fecha inválido.')
+            return render(request, 'reportes/generar.html')
+        datos = reporte.datos
         
         if formato == 'pdf':
-            pdf_buffer = generar_reporte_pdf(datos, tipo)
-            response = HttpResponse(pdf_buffer, content_type='application/pdf')
+            try:
+                pdf, metricas = renderizar(renderizar_pdf, datos, tipo)
+            except (ColaLlena, TiempoAgotado):
+                return _pdf_ocupado()
+            guardar_metricas(metricas, reporte)
+            response = HttpResponse(pdf, content_type='application/pdf')
             filename = f"reporte_{tipo}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
             response['Content-Disposition'] = f'attachment; filename="{filename}"'
             return response
         
-        # Guardar reporte en base de datos
-        reporte = Reporte.objects.create(
-            tipo=tipo,
-            fecha_inicio=fecha_inicio if fecha_inicio else None,
-            fecha_fin=fecha_fin if fecha_fin else None,
-            datos=datos,
-            generado_por=request.user
-        )
-        
         return render(request, 'reportes/resultado.html', {
             'reporte': reporte,
             'datos': datos,
@@ -340,6 +415,195 @@ def reportes(request):
     
     return render(request, 'reportes/generar.html')
 
+@login_required
+@user_passes_test(es_administrador)
+@require_POST
+def paquete_reportes(request):
+    """Los cuatro reportes de un periodo en un ZIP o en un único PDF"""
+    formato = request.POST.get('formato', 'zip')
+    try:
+        contenido, filename = generar_paquete(
+            request.POST.get('fecha_inicio'), request.POST.get('fecha_fin'), request.user, formato
+        )
+    except ValueError:
+        messages.error(request, 'Formato de paquete o de fecha inválido.')
+        return redirect('reportes')
+    response = HttpResponse(contenido, content_type=FORMATOS_PAQUETE[formato])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+REPORTES_POR_PAGINA = 25
+
+@login_required
+@user_passes_test(es_administrador)
+def historial_reportes(request):
+    """Reportes guardados, paginados; los datos solo se cargan al abrir uno"""
+    reportes = Reporte.objects.defer('datos').select_related('generado_por').order_by('-fecha_generacion', '-id')
+    tipo = request.GET.get('tipo', '')
+    estado = request.GET.get('estado', '')
+    if tipo:
+        reportes = reportes.filter(tipo=tipo)
+    if estado:
+        reportes = reportes.filter(estado=estado)
+    
+    pagina = Paginator(reportes, REPORTES_POR_PAGINA).get_page(request.GET.get('pagina'))
+    return render(request, 'reportes/historial.html', {
+        'pagina': pagina,
+        'tipo': tipo,
+        'estado': estado,
+        'tipos': Reporte.TIPOS_REPORTE,
+        'estados': Reporte.ESTADOS_REPORTE,
+    })
+
+@login_required
+@user_passes_test(es_administrador)
+def ver_reporte(request, reporte_id):
+    """Resultado de un reporte guardado, o página de espera si aún se está generando"""
+    reporte = get_object_or_404(Reporte, id=reporte_id)
+    # El detalle de reservas y los contratos no tienen resultado que mostrar, solo el archivo
+    if reporte.estado == 'COMPLETADO' and reporte.tipo not in TIPOS_SOLO_ARCHIVO:
+        return render(request, 'reportes/resultado.html', {
+            'reporte': reporte,
+            'datos': reporte.datos,
+            'tipo': reporte.tipo
+        })
+    return render(request, 'reportes/estado.html', {'reporte': reporte})
+
+@login_required
+@user_passes_test(es_administrador)
+def api_estado_reporte(request, reporte_id):
+    """Estado de un trabajo de reporte; mientras esté en curso despierta al trabajador"""
+    reporte = get_object_or_404(Reporte.objects.defer('datos'), id=reporte_id)
+    if reporte.estado in ESTADOS_EN_CURSO:
+        procesador_reportes.notificar()
+    return JsonResponse({
+        'id': reporte.id,
+        'estado': reporte.estado,
+        'error': reporte.error,
+        'url_descarga': reverse('descargar_reporte', args=[reporte.id]) if reporte.estado == 'COMPLETADO' else None,
+        'url_resultado': reverse('ver_reporte', args=[reporte.id]),
+    })
+
+@login_required
+@user_passes_test(es_administrador)
+def descargar_reporte(request, reporte_id):
+    """PDF de un reporte guardado (el generado en segundo plano o, si no hay, uno nuevo)"""
+    reporte = get_object_or_404(Reporte, id=reporte_id)
+    if reporte.estado != 'COMPLETADO':
+        return JsonResponse({'error': 'El reporte aún no está listo', 'estado': reporte.estado}, status=409)
+    
+    filename = f"reporte_{reporte.tipo}_{reporte.fecha_generacion.strftime('%Y%m%d_%H%M')}.pdf"
+    content_type = 'application/pdf'
+    if reporte.tipo == TIPO_DETALLE:
+        filename = f"reservas_{reporte.fecha_inicio or 'inicio'}_{reporte.fecha_fin or 'fin'}.pdf"
+    elif reporte.tipo == TIPO_CONTRATOS:
+        filename = reporte.datos['archivo']
+        content_type = FORMATOS_LOTE_CONTRATOS[reporte.datos['formato']]
+    if archivo_disponible(reporte.archivo_pdf):
+        return FileResponse(reporte.archivo_pdf.open('rb'), as_attachment=True, filename=filename,
+                            content_type=content_type)
+    if reporte.tipo in TIPOS_SOLO_ARCHIVO:
+        # Sin datos agregados de los que volver a generarlo
+        return JsonResponse({'error': 'El archivo ya no está disponible; vuelva a generarlo'}, status=410)
+    try:
+        pdf, metricas = renderizar(renderizar_pdf, reporte.datos, reporte.tipo)
+    except (ColaLlena, TiempoAgotado):
+        return _pdf_ocupado()
+    guardar_metricas(metricas, reporte)
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def _pdf_ocupado():
+    """503 con Retry-After cuando el pool de PDF está saturado"""
+    response = JsonResponse(
+        {'error': 'El generador de PDF está ocupado, inténtelo de nuevo en unos segundos'}, status=503
+    )
+    response['Retry-After'] = str(getattr(settings, 'PDF_REINTENTAR_EN', 5))
+    return response
+
+METRICAS_RECIENTES = 50
+MAX_DIAS_METRICAS = 3650
+
+def _desde_metricas(request):
+    """Inicio del periodo de ?dias=N (7 por defecto, como mucho MAX_DIAS_METRICAS); ValueError si N no es válido"""
+    dias = int(request.GET.get('dias', 7))
+    if dias < 1:
+        raise ValueError('dias debe ser positivo')
+    # Sin tope, un N enorme desborda timedelta y datetime (OverflowError)
+    dias = min(dias, MAX_DIAS_METRICAS)
+    return dias, timezone.now() - timedelta(days=dias)
+
+@login_required
+@user_passes_test(es_administrador)
+def metricas_reportes(request):
+    """Panel de rendimiento: percentiles por tipo de reporte y últimas mediciones"""
+    try:
+        dias, desde = _desde_metricas(request)
+    except ValueError:
+        messages.error(request, 'Número de días inválido.')
+        dias, desde = 7, timezone.now() - timedelta(days=7)
+    return render(request, 'reportes/metricas.html', {
+        'dias': dias,
+        'resumen': resumen_metricas(desde),
+        'recientes': MetricaReporte.objects.order_by('-fecha', '-id')[:METRICAS_RECIENTES],
+        'pool': estado_pool(),
+    })
+
+@login_required
+@user_passes_test(es_administrador)
+def api_metricas_reportes(request):
+    """Percentiles de tiempos, consultas, filas y tamaño de PDF por tipo y operación (?dias=N)"""
+    try:
+        dias, desde = _desde_metricas(request)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetro dias inválido'}, status=400)
+    return JsonResponse({
+        'desde': desde.isoformat(),
+        'dias': dias,
+        'percentiles': list(PERCENTILES),
+        'resumen': resumen_metricas(desde),
+    })
+
+@login_required
+@user_passes_test(es_administrador)
+def api_estado_pool_pdf(request):
+    """Estado del pool de PDF de este proceso: cola, rechazos, tiempos agotados y duraciones"""
+    return JsonResponse(estado_pool())
+
+@login_required
+@user_passes_test(es_administrador)
+def exportar_reservas(request):
+    """
+    Detalle completo de reservas en CSV, NDJSON o PDF (?formato=csv|ndjson|pdf),
+    filtrado por fecha de reserva (fecha_inicio, fecha_fin) y por uno o más
+    estados (?estado=...). CSV y NDJSON se envían en streaming mientras se lee
+    de la base; el PDF se encola como trabajo en segundo plano y se redirige a
+    su página de estado, que ofrece la descarga.
+    """
+    formato = request.GET.get('formato', 'csv')
+    estados = request.GET.getlist('estado')
+    try:
+        fecha_inicio = date.fromisoformat(request.GET['fecha_inicio']) if request.GET.get('fecha_inicio') else None
+        fecha_fin = date.fromisoformat(request.GET['fecha_fin']) if request.GET.get('fecha_fin') else None
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido'}, status=400)
+    if formato not in FORMATOS_EXPORTACION:
+        return JsonResponse({'error': 'Formato de exportación inválido'}, status=400)
+    if not set(estados) <= set(dict(Reserva.ESTADOS_RESERVA)):
+        return JsonResponse({'error': 'Estado de reserva inválido'}, status=400)
+    
+    if formato == 'pdf':
+        reporte = encolar_detalle(fecha_inicio, fecha_fin, estados, request.user)
+        return redirect('ver_reporte', reporte_id=reporte.id)
+    
+    filename = f"reservas_{fecha_inicio or 'inicio'}_{fecha_fin or 'fin'}.{formato}"
+    reservas = reservas_exportacion(fecha_inicio, fecha_fin, estados)
+    generador = exportar_csv(reservas) if formato == 'csv' else exportar_ndjson(reservas)
+    response = StreamingHttpResponse(generador, content_type=FORMATOS_EXPORTACION[formato])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 # ========== FUNCIÓN PARA CONVERTIR DECIMAL A FLOAT ==========
 
 def convertir_decimal_a_float(datos):
@@ -357,55 +621,302 @@ def convertir_decimal_a_float(datos):
         return datos
 
 
+# Tabla precalculada de etiquetas para no llamar get_tipo_display() por fila
+ETIQUETAS_TIPO = dict(Vehiculo.TIPOS_VEHICULO)
+CAMPOS_VEHICULO_API = ('id', 'marca', 'modelo', 'placa', 'precio_dia', 'tipo', 'capacidad_pasajeros', 'imagen')
+MAX_CONSULTAS_LOTE = 100
+MAX_VENTANAS_LIBRES = 10
+
+
+def _vehiculo_api(fila):
+    """Convierte una fila de values(*CAMPOS_VEHICULO_API) al formato de la API"""
+    imagen = fila['imagen']
+    return {
+        'id': fila['id'],
+        'marca': fila['marca'],
+        'modelo': fila['modelo'],
+        'placa': fila['placa'],
+        'precio_dia': float(fila['precio_dia']),
+        'tipo': ETIQUETAS_TIPO.get(fila['tipo'], fila['tipo']),
+        'capacidad_pasajeros': fila['capacidad_pasajeros'],
+        'imagen_url': Vehiculo._meta.get_field('imagen').storage.url(imagen) if imagen else None
+    }
+
+
 # API para disponibilidad en tiempo real
+ORDENES_DISPONIBILIDAD = {
+    'id': ('id', 'id'),
+    'precio': ('precio_dia', 'id'),
+    '-precio': ('-precio_dia', '-id'),
+    'capacidad': ('capacidad_pasajeros', 'id'),
+    '-capacidad': ('-capacidad_pasajeros', '-id'),
+}
+LIMITE_DISPONIBILIDAD = 50
+MAX_LIMITE_DISPONIBILIDAD = 200
+
+
+def _codificar_cursor(valor, pk):
+    return base64.urlsafe_b64encode(json.dumps([str(valor), pk]).encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    valor, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return valor, int(pk)
+
+
 @login_required
+@_condicion_disponibilidad()
 def api_disponibilidad(request):
+    """
+    Vehículos disponibles en un rango con filtros opcionales (tipo,
+    capacidad_min, precio_max), orden (id, precio, -precio, capacidad,
+    -capacidad) y paginación por cursor (cursor, limite).
+    """
     fecha_inicio = request.GET.get('fecha_inicio')
     fecha_fin = request.GET.get('fecha_fin')
     
     if not fecha_inicio or not fecha_fin:
         return JsonResponse({'error': 'Fechas requeridas'}, status=400)
     
+    orden = request.GET.get('orden', 'id')
+    if orden not in ORDENES_DISPONIBILIDAD:
+        return JsonResponse({'error': 'Orden inválido'}, status=400)
+    
     try:
         fecha_inicio_dt = datetime.strptime(fecha_inicio, '%Y-%m-%d')
         fecha_fin_dt = datetime.strptime(fecha_fin, '%Y-%m-%d')
+    except ValueError:
+        return JsonResponse({'error': 'Formato de fecha inválido'}, status=400)
+    
+    try:
+        limite = max(1, min(int(request.GET.get('limite', LIMITE_DISPONIBILIDAD)), MAX_LIMITE_DISPONIBILIDAD))
+        capacidad_min = request.GET.get('capacidad_min')
+        precio_max = request.GET.get('precio_max')
+        cursor = request.GET.get('cursor')
         
-        vehiculos_disponibles = Vehiculo.objects.filter(estado='DISPONIBLE')
-        
-        reservas_conflictivas = Reserva.objects.filter(
-            Q(fecha_inicio__lte=fecha_fin_dt) & Q(fecha_fin__gte=fecha_inicio_dt),
-            estado__in=['CONFIRMADA', 'ACTIVA', 'PENDIENTE']
-        )
-        vehiculos_no_disponibles = reservas_conflictivas.values_list('vehiculo_id', flat=True)
-        vehiculos_disponibles = vehiculos_disponibles.exclude(id__in=vehiculos_no_disponibles)
+        vehiculos = vehiculos_disponibles_qs(fecha_inicio_dt, fecha_fin_dt)
+        if request.GET.get('tipo'):
+            vehiculos = vehiculos.filter(tipo=request.GET['tipo'])
+        if capacidad_min:
+            vehiculos = vehiculos.filter(capacidad_pasajeros__gte=int(capacidad_min))
+        if precio_max:
+            vehiculos = vehiculos.filter(precio_dia__lte=Decimal(precio_max))
         
-        datos = []
-        for vehiculo in vehiculos_disponibles:
-            datos.append({
-                'id': vehiculo.id,
-                'marca': vehiculo.marca,
-                'modelo': vehiculo.modelo,
-                'placa': vehiculo.placa,
-                'precio_dia': float(vehiculo.precio_dia),
-                'tipo': vehiculo.get_tipo_display(),
-                'imagen_url': vehiculo.imagen.url if vehiculo.imagen else None
-            })
+        campo_orden, campo_desempate = ORDENES_DISPONIBILIDAD[orden]
+        campo = campo_orden.lstrip('-')
+        if cursor:
+            valor, ultimo_id = _decodificar_cursor(cursor)
+            if campo_orden.startswith('-'):
+                vehiculos = vehiculos.filter(Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'id__lt': ultimo_id}))
+            else:
+                vehiculos = vehiculos.filter(Q(**{f'{campo}__gt': valor}) | Q(**{campo: valor, 'id__gt': ultimo_id}))
         
-        return JsonResponse({'vehiculos': datos})
+        filas = list(vehiculos.order_by(campo_orden, campo_desempate).values(*CAMPOS_VEHICULO_API)[:limite + 1])
+    except (ValueError, ArithmeticError, TypeError):
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
     
-    except ValueError:
-        return JsonResponse({'error': 'Formato de fecha inválido'}, status=400)
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = _codificar_cursor(filas[-1][campo], filas[-1]['id'])
+    
+    precios = cotizar_varios(filas, [(fecha_inicio_dt, fecha_fin_dt)])[0]
+    return JsonResponse({
+        'vehiculos': [
+            dict(_vehiculo_api(fila), precio_total=float(precio))
+            for fila, precio in zip(filas, precios)
+        ],
+        'dias': dias_facturables(fecha_inicio_dt, fecha_fin_dt),
+        'siguiente': siguiente,
+    })
+
+@login_required
+@require_POST
+def api_disponibilidad_lote(request):
+    """
+    Disponibilidad para varias ventanas en una sola petición.
+    
+    Cuerpo JSON: {"consultas": [{"fecha_inicio": "AAAA-MM-DD", "fecha_fin": "AAAA-MM-DD",
+    "tipo": "SUV", "capacidad_min": 5}, ...]}. Cada resultado devuelve los IDs
+    disponibles y su precio total en "precios"; los datos de cada vehículo se
+    envían una sola vez en "vehiculos". Una consulta inválida no anula las
+    demás: su resultado lleva "error" en lugar de "vehiculos" y "precios".
+    """
+    try:
+        consultas = json.loads(request.body).get('consultas')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    
+    if not isinstance(consultas, list) or not consultas:
+        return JsonResponse({'error': 'Se requiere una lista de consultas'}, status=400)
+    if len(consultas) > MAX_CONSULTAS_LOTE:
+        return JsonResponse({'error': f'Máximo {MAX_CONSULTAS_LOTE} consultas por petición'}, status=400)
+    
+    validas, rangos, resultados = [], [], []
+    for consulta in consultas:
+        resultado = {'error': 'Consulta con fechas o capacidad inválidas'}
+        try:
+            rango = (
+                datetime.strptime(consulta['fecha_inicio'], '%Y-%m-%d'),
+                datetime.strptime(consulta['fecha_fin'], '%Y-%m-%d'),
+            )
+            capacidad_min = consulta.get('capacidad_min')
+            capacidad_min = int(capacidad_min) if capacidad_min is not None else None
+            tipo = consulta.get('tipo')
+            resultado = {
+                'fecha_inicio': consulta['fecha_inicio'],
+                'fecha_fin': consulta['fecha_fin'],
+                'tipo': tipo,
+                'capacidad_min': capacidad_min,
+            }
+            validas.append((resultado, tipo, capacidad_min))
+            rangos.append(rango)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            pass
+        resultados.append(resultado)
+    
+    flota = list(Vehiculo.objects.filter(estado='DISPONIBLE').values(*CAMPOS_VEHICULO_API))
+    ocupados_por_rango = vehiculos_ocupados_lote(rangos)
+    precios_por_rango = cotizar_varios(flota, rangos)
+    
+    usados = set()
+    for (resultado, tipo, capacidad_min), ocupados, precios in zip(validas, ocupados_por_rango, precios_por_rango):
+        disponibles = [
+            (fila['id'], precio) for fila, precio in zip(flota, precios)
+            if fila['id'] not in ocupados
+            and (not tipo or fila['tipo'] == tipo)
+            and (capacidad_min is None or fila['capacidad_pasajeros'] >= capacidad_min)
+        ]
+        ids = [pk for pk, _ in disponibles]
+        usados.update(ids)
+        resultado['vehiculos'] = ids
+        resultado['precios'] = {str(pk): float(precio) for pk, precio in disponibles}
+    
+    return JsonResponse({
+        'resultados': resultados,
+        'vehiculos': {str(fila['id']): _vehiculo_api(fila) for fila in flota if fila['id'] in usados},
+    })
+
+def _fecha_api(valor):
+    """Fecha (AAAA-MM-DD) o fecha y hora (AAAA-MM-DDTHH:MM) con la zona local"""
+    fecha = datetime.fromisoformat(valor)
+    return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+
+
+@login_required
+def api_ventanas_libres(request, vehiculo_id):
+    """
+    Ventanas libres más cercanas para un vehículo con la duración del rango
+    pedido (k, por defecto 3, máximo MAX_VENTANAS_LIBRES), y el mismo rango en
+    vehículos comparables (mismo tipo, capacidad igual o mayor).
+    """
+    vehiculo = get_object_or_404(Vehiculo, id=vehiculo_id)
+    try:
+        fecha_inicio = _fecha_api(request.GET['fecha_inicio'])
+        fecha_fin = _fecha_api(request.GET['fecha_fin'])
+        k = max(1, min(int(request.GET.get('k', 3)), MAX_VENTANAS_LIBRES))
+        excluir_id = int(request.GET['excluir']) if request.GET.get('excluir') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    if fecha_fin <= fecha_inicio:
+        return JsonResponse({'error': 'La fecha de fin debe ser posterior a la fecha de inicio'}, status=400)
+    
+    ventanas = ventanas_libres(vehiculo.id, fecha_inicio, fecha_fin, k=k, excluir_id=excluir_id)
+    alternativos = list(vehiculos_alternativos(vehiculo, fecha_inicio, fecha_fin, k=k).values(*CAMPOS_VEHICULO_API))
+    precios = cotizar_varios(alternativos, [(fecha_inicio, fecha_fin)])[0]
+    
+    return JsonResponse({
+        'vehiculo_id': vehiculo.id,
+        'disponible': bool(ventanas) and ventanas[0] == (fecha_inicio, fecha_fin),
+        'ventanas': [
+            {
+                'fecha_inicio': timezone.localtime(inicio).isoformat(),
+                'fecha_fin': timezone.localtime(fin).isoformat(),
+                'precio_total': float(cotizar(vehiculo.precio_dia, vehiculo.tipo, inicio, fin)),
+            }
+            for inicio, fin in ventanas
+        ],
+        'alternativos': [
+            dict(_vehiculo_api(fila), precio_total=float(precio))
+            for fila, precio in zip(alternativos, precios)
+        ],
+    })
+
+@login_required
+@_condicion_disponibilidad(indice=True)
+def api_calendario_disponibilidad(request):
+    """Ocupación diaria de toda la flota para un mes (parámetro mes=AAAA-MM)"""
+    mes_param = request.GET.get('mes')
+    
+    if mes_param:
+        try:
+            mes_dt = datetime.strptime(mes_param, '%Y-%m')
+        except ValueError:
+            return JsonResponse({'error': 'Formato de mes inválido (AAAA-MM)'}, status=400)
+    else:
+        mes_dt = timezone.localdate()
+    
+    vehiculos = Vehiculo.objects.order_by('id').values('id', 'placa', 'marca', 'modelo', 'estado')
+    try:
+        datos = [{
+            'id': vehiculo['id'],
+            'placa': vehiculo['placa'],
+            'vehiculo': f"{vehiculo['marca']} {vehiculo['modelo']}",
+            'ocupacion': calendario_ocupacion.ocupacion_mes(
+                vehiculo['id'], vehiculo['estado'], mes_dt.year, mes_dt.month
+            ),
+        } for vehiculo in vehiculos]
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'mes': f'{mes_dt.year}-{mes_dt.month:02d}',
+        'vehiculos': datos,
+    })
 
 # Añadir esta vista para descargar contratos
 @login_required
 def descargar_contrato(request, reserva_id):
-    reserva = get_object_or_404(Reserva, id=reserva_id)
-    pdf_buffer = generar_contrato_pdf(reserva)
-    response = HttpResponse(pdf_buffer, content_type='application/pdf')
-    filename = f"contrato_{reserva.codigo_reserva}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    """PDF guardado del contrato; 304 si el navegador ya tiene esa versión (If-None-Match)"""
+    reserva = get_object_or_404(Reserva.objects.select_related('cliente__usuario', 'vehiculo'), id=reserva_id)
+    try:
+        contrato, pdf = contrato_vigente(reserva)
+    except (ColaLlena, TiempoAgotado):
+        return _pdf_ocupado()
+    etag = f'"{contrato.hash_pdf}"'
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        return no_modificado
+    # Recién generado (quizá sin guardar, ver almacenamiento.py) o el archivo guardado
+    contenido = io.BytesIO(pdf) if pdf is not None else contrato.archivo_pdf.open('rb')
+    response = FileResponse(contenido, as_attachment=True,
+                            filename=f"contrato_{reserva.codigo_reserva}.pdf", content_type='application/pdf')
+    response['ETag'] = etag
+    # Se puede guardar, pero siempre se revalida: el contrato cambia si cambian sus datos
+    response['Cache-Control'] = 'private, no-cache'
     return response
 
+@login_required
+@user_passes_test(es_administrador)
+@require_POST
+def contratos_lote(request):
+    """
+    Encola los contratos de un rango de fechas de inicio (fecha_inicio,
+    fecha_fin) o de una lista de códigos (codigos, separados por espacios o
+    comas) en un ZIP o en un único PDF (formato); el archivo se descarga
+    desde la página del trabajo.
+    """
+    codigos = request.POST.get('codigos', '').replace(',', ' ').split()
+    try:
+        reporte = encolar_contratos(
+            request.POST.get('fecha_inicio'), request.POST.get('fecha_fin'), codigos,
+            request.POST.get('formato', 'zip'), request.user,
+        )
+    except ValueError as e:
+        messages.error(request, f'No se pudieron generar los contratos: {e}')
+        return redirect('lista_reservas')
+    return redirect('ver_reporte', reporte_id=reporte.id)
+
 # Añadir esta vista para el perfil del cliente
 @login_required
 def perfil_cliente(request):
@@ -846,21 +1357,16 @@ def editar_reserva(request, reserva_id):
     if request.method == 'POST':
         form = ReservaForm(request.POST, instance=reserva)
         if form.is_valid():
-            # Calcular precio total si cambió el vehículo o las fechas
+            # Reserva.save recotiza el precio si cambió el vehículo o las fechas
             reserva_editada = form.save(commit=False)
             
-            # Recalcular días si cambiaron las fechas
-            if reserva_editada.fecha_inicio and reserva_editada.fecha_fin:
-                diferencia = reserva_editada.fecha_fin - reserva_editada.fecha_inicio
-                dias = diferencia.days + 1
-                
-                # Calcular precio total
-                if reserva_editada.vehiculo:
-                    reserva_editada.precio_total = dias * reserva_editada.vehiculo.precio_dia
-            
-            reserva_editada.save()
-            messages.success(request, 'Reserva actualizada exitosamente!')
-            return redirect('detalle_reserva', reserva_id=reserva.id)
+            try:
+                guardar_reserva_atomica(reserva_editada)
+            except ReservaNoDisponible:
+                form.add_error(None, "El vehículo no está disponible en las fechas seleccionadas.")
+            else:
+                messages.success(request, 'Reserva actualizada exitosamente!')
+                return redirect('detalle_reserva', reserva_id=reserva.id)
     else:
         form = ReservaForm(instance=reserva)
     
@@ -890,6 +1396,7 @@ def confirmar_reserva(request, reserva_id):
         if reserva.estado == 'PENDIENTE':
             reserva.estado = 'CONFIRMADA'
             reserva.save()
+            preparar_contrato(reserva)
             messages.success(request, f'Reserva {reserva.codigo_reserva} confirmada exitosamente!')
         else:
             messages.warning(request, 'Solo se pueden confirmar reservas pendientes.')